@@ -0,0 +1,155 @@
+# asyncio で Minecraft Pi Edition (Reborn) のテキストプロトコルを直接話すクライアント
+#
+# mcpi のプロトコルは "world.getBlock(1,2,3)\n" のような1行の要求に対し、
+# 値を返すコマンドだけが1行の応答を返します。応答は要求の順番どおりに届くため、
+# 応答待ちの Future を FIFO に並べておけば、多数の要求を同時に送ったまま待つことができます。
+
+import asyncio
+from collections import deque
+
+
+class AsyncMinecraftError(Exception):
+    """接続が切れた、またはゲームが Fail を返した場合のエラー"""
+
+
+def format_request(function, args):
+    """要求を1行のバイト列に変換する (mcpi と同じく引数はカンマ区切り)"""
+    params = ",".join(str(int(arg)) if isinstance(arg, bool) else str(arg) for arg in args)
+    # 要求は改行で区切られるため、引数に含まれる改行は空白に置き換える
+    return (f"{function}({params})".replace("\n", " ") + "\n").encode()
+
+
+class AsyncMinecraft:
+    """1本のソケットで要求をパイプライン化する非同期 mcpi クライアント
+
+    send() は応答のないコマンド (setBlock など) を書き込むだけで待ちません。
+    query() は応答のあるコマンドを送り、その応答の行を返します。
+    """
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._pending = deque()
+        self._closed = False
+        self._reader_task = asyncio.ensure_future(self._read_replies())
+
+    @classmethod
+    async def create(cls, host="localhost", port=4711):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def in_flight(self):
+        """応答を待っている要求の数"""
+        return len(self._pending)
+
+    def send(self, function, *args):
+        if self._closed:
+            raise AsyncMinecraftError("connection closed")
+        self._writer.write(format_request(function, args))
+
+    async def query(self, function, *args):
+        # 書き込みと Future の登録の間で他のタスクに切り替わらないようにする
+        # (await を挟まないので、応答の順番と _pending の順番が一致する)
+        future = asyncio.get_running_loop().create_future()
+        self.send(function, *args)
+        self._pending.append(future)
+        await self._writer.drain()
+        reply = await future
+        if reply == "Fail":
+            raise AsyncMinecraftError(f"{function} failed")
+        return reply
+
+    async def drain(self):
+        """書き込みバッファが送信されるまで待つ"""
+        await self._writer.drain()
+
+    async def close(self):
+        self._fail_pending(AsyncMinecraftError("connection closed"))
+        self._reader_task.cancel()
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except (OSError, asyncio.CancelledError):
+            pass
+
+    def _fail_pending(self, error):
+        self._closed = True
+        while self._pending:
+            future = self._pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+
+    async def _read_replies(self):
+        try:
+            while True:
+                line = await self._reader.readline()
+                if not line:
+                    break
+                if self._pending:
+                    future = self._pending.popleft()
+                    if not future.done():
+                        future.set_result(line.decode().rstrip("\n"))
+        except OSError:
+            pass
+        self._fail_pending(AsyncMinecraftError("connection closed by Minecraft"))
+
+    # --- mcpi の主なコマンド ---
+
+    def postToChat(self, message):
+        self.send("chat.post", message)
+
+    def setBlock(self, x, y, z, block_id, *data):
+        self.send("world.setBlock", x, y, z, block_id, *data)
+
+    def setBlocks(self, x1, y1, z1, x2, y2, z2, block_id, *data):
+        self.send("world.setBlocks", x1, y1, z1, x2, y2, z2, block_id, *data)
+
+    async def getBlock(self, x, y, z):
+        return int(await self.query("world.getBlock", x, y, z))
+
+    async def getHeight(self, x, z):
+        return int(await self.query("world.getHeight", x, z))
+
+    def setting(self, name, status):
+        self.send("world.setting", name, 1 if status else 0)
+
+    async def getPlayerPos(self):
+        return tuple(float(value) for value in (await self.query("player.getPos")).split(","))
+
+    async def getPlayerTilePos(self):
+        return tuple(int(value) for value in (await self.query("player.getTile")).split(","))
+
+    def setPlayerPos(self, x, y, z):
+        self.send("player.setPos", x, y, z)
+
+    async def getPlayerDirection(self):
+        return tuple(float(value) for value in (await self.query("player.getDirection")).split(","))
+
+    async def getPlayerRotation(self):
+        return float(await self.query("player.getRotation"))
+
+    async def getPlayerPitch(self):
+        return float(await self.query("player.getPitch"))
+
+    async def pollBlockHits(self):
+        """ブロックヒットイベントを (x, y, z, face, entityId) のリストで返す"""
+        reply = await self.query("events.block.hits")
+        return [tuple(int(value) for value in item.split(",")) for item in reply.split("|") if item]
+
+    async def pollChatPosts(self):
+        """チャット投稿イベントを (entityId, message) のリストで返す"""
+        reply = await self.query("events.chat.posts")
+        posts = []
+        for item in reply.split("|"):
+            if item:
+                entity_id, _, message = item.partition(",")
+                posts.append((int(entity_id), message))
+        return posts
+
+    def clearEvents(self):
+        self.send("events.clear")
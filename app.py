@@ -1,208 +1,910 @@
-from flask import Flask, request, jsonify
-# mcpiライブラリは後でインポートします
-from mcpi.minecraft import Minecraft
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+# 起動にかかった時間を /metrics で公開するため、できるだけ早く時刻を記録する
+STARTED = time.perf_counter()
+
+from flask import Flask, Response, request, jsonify
+# mcpiライブラリは最初に接続するときにインポートします (create_minecraft を参照)
+
+import commands
+import serialization
+from commands import CommandError, prepare_command, to_bool
+from connection import ConnectionManager
+from events import BLOCK_HIT, CHAT_POST, DROP_OLDEST, MAX_PAGE, EventLog, EventPoller, EventQueue
+from journal import CommandJournal
+from block_cache import WorldCache
+from player_state import PlayerStateCache
+from scheduler import FairScheduler, Overloaded
+from sequencing import ClientSequencer, SequenceError
+from snapshots import SnapshotStore
+from metrics import Metrics
+from structured_log import setup_logging
+from worlds import DEFAULT_WORLD, InflightLimit, World, parse_worlds
+from write_buffer import BlockWriteBuffer
+
+# WebSocket のサポートはオプション (simple-websocket がない場合は /ws を無効にする)
+try:
+    import simple_websocket
+except ImportError:
+    simple_websocket = None
+
+logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
-# Minecraftへの接続 (後で初期化)
+# Minecraft Pi Edition (Reborn)が動作しているホストとポートを指定
+# DockerコンテナからホストOS上のMinecraftに接続する場合、
+# 'host.docker.internal' またはホストマシンのIPアドレスを使用します。
+# 環境変数から取得するか、デフォルト値を設定します。
+MINECRAFT_HOST = os.environ.get("MINECRAFT_HOST", "localhost")
+MINECRAFT_PORT = int(os.environ.get("MINECRAFT_PORT", 4711)) # デフォルトポート
+# 未接続のときに、コマンドを 503 で返す前に再接続を待つ時間 (秒)
+CONNECT_WAIT_TIMEOUT = 2.0
+
+# Minecraftへの接続 (後で初期化、接続管理が切断・再接続のたびに更新する)
 mc = None
+# 起動 (app の読み込み) からリクエストを受け付けられるようになるまでと、最初に接続できるまでの時間 (秒)
+startup_seconds = None
+first_connect_seconds = None
+# mc のソケットは1本なので、複数のスレッドから同時に読み書きしないようにするロック
+mc_lock = threading.RLock()
+
+
+def create_minecraft(host=None, port=None):
+    """Minecraftに接続し、接続確認のためにチャットにメッセージを送信する (省略時は MINECRAFT_HOST / MINECRAFT_PORT)"""
+    from mcpi.minecraft import Minecraft
+    new_mc = Minecraft.create(host or MINECRAFT_HOST, port or MINECRAFT_PORT)
+    # 小さな要求を応答を待たずに続けて送るので、Nagle アルゴリズムを無効にする
+    # (有効なままだと相手の遅延 ACK と重なって、要求が約40ms待たされることがある)
+    sock = getattr(getattr(new_mc, "conn", None), "socket", None)
+    if isinstance(sock, socket.socket):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    new_mc.postToChat("Scratch bridge connected!")
+    return new_mc
+
+
+def set_minecraft(new_mc):
+    global mc, first_connect_seconds
+    mc = new_mc
+    if new_mc is not None and first_connect_seconds is None:
+        first_connect_seconds = time.perf_counter() - STARTED
+
+
+# 接続の監視と再接続 (起動時に start() される)
+# 接続を確認する間隔 (秒、WORLDS のワールドも同じ)
+HEALTH_INTERVAL = float(os.environ.get("MINECRAFT_HEALTH_INTERVAL", 5))
+connection = ConnectionManager(create_minecraft, lock=mc_lock, on_change=set_minecraft,
+                               health_interval=HEALTH_INTERVAL)
+
+# バックグラウンドでイベントを取得するポーラー (EVENT_POLL_INTERVAL が設定された場合に起動)
+event_poller = None
+
+# クライアントごとの公平なスケジューラー (CLIENT_QUEUE_SIZE が 0 でなければ起動時に設定)
+scheduler = None
+# クライアントを区別するヘッダー (ない場合は IP アドレスで区別する)
+CLIENT_ID_HEADER = "X-Client-Id"
+# クライアントごとの連番 (seq) で再送を検出し、順番どおりに実行する (DEDUP_WINDOW が 0 でなければ起動時に設定)
+sequencer = None
+# 実行した書き込み系のコマンドを記録するジャーナル (JOURNAL_DIR が設定された場合に起動)
+journal = None
+
+# 終了の準備を始めたときにセットされる (SSE や WebSocket の長い接続を閉じて、ワーカーが終了できるようにする)
+stopping = threading.Event()
+
+
+
+class DefaultWorld:
+    """MINECRAFT_HOST / MINECRAFT_PORT の既定のワールド
+
+    worlds.World と同じ属性で、このモジュールの mc や scheduler などをそのまま返します。
+    キャッシュなどは commands のモジュールのフックを使うので、state は None です。
+    """
+
+    name = DEFAULT_WORLD
+    state = None
+    limit = InflightLimit()
+    host = property(lambda self: MINECRAFT_HOST)
+    port = property(lambda self: MINECRAFT_PORT)
+    mc = property(lambda self: mc)
+    mc_lock = property(lambda self: mc_lock)
+    connection = property(lambda self: connection)
+    scheduler = property(lambda self: scheduler)
+    sequencer = property(lambda self: sequencer)
+    event_poller = property(lambda self: event_poller)
+
+
+default_world = DefaultWorld()
+# WORLDS で設定された名前付きのワールド (名前 -> worlds.World)
+worlds = {}
+
+# /metrics で公開するメトリクス (バッチは "batch" として記録する)
+metrics = Metrics(list(commands.COMMANDS) + ["batch", "subscribeEvents"])
 
 @app.route('/')
 def index():
     return "Minecraft Scratch Bridge is running!"
 
-# Scratchからのコマンドを受け取るエンドポイント (例)
+# 1回の /batch リクエストで受け付けるコマンド数の上限
+MAX_BATCH_SIZE = 10000
+
+
+def run_command(command, args, action, client=None, world=default_world):
+    """検証済みのコマンドを world で実行し、(レスポンス dict, HTTPステータス) を返す"""
+    current = world.mc
+    try:
+        with world.mc_lock:
+            current = world.mc
+            started = metrics.clock()
+            try:
+                result = action(current)
+            finally:
+                metrics.observe_game(command, metrics.clock() - started)
+            # ロックを持ったまま記録するので、ジャーナルの順番はゲームに送った順番と同じになる
+            if journal is not None and action.writes:
+                journal.append(client, command, args, None if world is default_world else world.name)
+            return result, 200
+    except Exception as e:
+        # ソケットのエラーは接続が切れたとみなし、バックグラウンドで再接続させる
+        if isinstance(e, OSError):
+            world.connection.mark_failed(current, e)
+        # エラーの詳細 (トレースバック) をログに出力
+        logger.exception("Error executing Minecraft command", extra={"command": command, "arguments": args})
+        return {"status": "error", "message": f"Minecraft command failed: {e}"}, 500
+
+
+def schedule(client, cost, run, world=default_world):
+    """world のスケジューラーが有効なら client の順番を待ってから run() を実行し、その戻り値を返す"""
+    if world.scheduler is None:
+        return run()
+    try:
+        return world.scheduler.run(client, cost, run)
+    except Overloaded as e:
+        return {"status": "error", "message": e.message, "retryAfter": round(e.retry_after, 3)}, e.status
+
+
+def execute_command(command, args, client=None, world=default_world):
+    """コマンドを検証して world で実行し、(レスポンス dict, HTTPステータス) を返す"""
+    if not world.mc and not world.connection.wait_connected(CONNECT_WAIT_TIMEOUT):
+        return {"status": "error", "message": "Minecraft not connected"}, 503 # Service Unavailable
+
+    try:
+        action = prepare_command(command, args)
+    except CommandError as e:
+        return {"status": "error", "message": e.message}, e.status
+
+    return schedule(client, action.cost, lambda: run_command(command, args, action, client, world), world)
+
+
+def body_client(data):
+    """ボディ (またはメッセージ) の client (ない場合は None)"""
+    client = data.get('client') if isinstance(data, dict) else None
+    return client if isinstance(client, str) and client else None
+
+
+def explicit_client_id(data=None):
+    """ヘッダーまたはボディの client で明示されたクライアントの識別子 (ない場合は None)"""
+    return request.headers.get(CLIENT_ID_HEADER) or body_client(data)
+
+
+def client_id(data=None):
+    """リクエストを送ったクライアントの識別子 (ヘッダー、ボディの client、IP アドレスの順)"""
+    return explicit_client_id(data) or request.remote_addr
+
+
+def sequenced(client, seq, run, world=default_world):
+    """seq が指定されていれば、client の連番の順に重複なく run() を実行し、(レスポンス dict, HTTPステータス) を返す
+
+    すでに実行した連番の再送には、保存しておいた結果を返します。連番はワールドごとに数えます。
+    client は明示されたクライアントの識別子 (explicit_client_id) です。同じ PC のタブや NAT の後ろの教室は
+    同じ IP アドレスになり、連番が混ざってしまうので、IP アドレスでは区別せずに 400 を返します。
+    """
+    if seq is None or world.sequencer is None:
+        return run()
+    if client is None:
+        return {"status": "error", "message": f"seq requires a client id ({CLIENT_ID_HEADER} header or client)"}, 400
+    try:
+        return world.sequencer.run(client, seq, run)
+    except SequenceError as e:
+        return {"status": "error", "message": e.message}, e.status
+
+
+def resolve_world(name):
+    """名前のワールドを返す (None は既定のワールド、知らない名前は None)"""
+    if name is None or name == DEFAULT_WORLD:
+        return default_world
+    return worlds.get(name) if isinstance(name, str) else None
+
+
+def unknown_world(name):
+    return {"status": "error", "message": f"Unknown world: {name}"}, 404
+
+
+def in_world(world, run):
+    """world のキャッシュなどを使い、同時に処理するリクエストの上限の中で run() を実行する"""
+    if not world.limit.acquire():
+        return {"status": "error", "message": f"Too many requests for world {world.name}"}, 503
+    token = commands.world_state.set(world.state)
+    try:
+        return run()
+    finally:
+        commands.world_state.reset(token)
+        world.limit.release()
+
+
+def request_format():
+    """Accept ヘッダーから、レスポンスの形式 (メディアタイプ) を選ぶ (指定がなければ JSON)"""
+    return serialization.canonical(request.accept_mimetypes.best_match(serialization.available(),
+                                                                        default=serialization.JSON))
+
+
+def request_data():
+    """リクエストのボディを Content-Type の形式 (JSON / MessagePack / CBOR) で読み込む (不正な場合は None)"""
+    fmt = serialization.canonical(request.mimetype)
+    if not serialization.is_binary(fmt):
+        return request.get_json(silent=True)
+    try:
+        return serialization.decode(request.get_data(), fmt)
+    except ValueError:
+        return None
+
+
+def is_terse(data):
+    """terse モード (?terse=1 またはボディの "terse": true) か"""
+    if isinstance(data, dict) and data.get('terse') is True:
+        return True
+    return request.args.get('terse', '').lower() in ('1', 'true')
+
+
+@contextmanager
+def response_style(fmt, terse):
+    """このリクエストの間、コマンドが返す値の形式を設定する"""
+    tokens = (commands.terse_response.set(terse), commands.binary_response.set(serialization.is_binary(fmt)))
+    try:
+        yield
+    finally:
+        commands.terse_response.reset(tokens[0])
+        commands.binary_response.reset(tokens[1])
+
+
+def strip_messages(result):
+    """成功したレスポンス (とバッチの各結果) から人が読むための message を取り除いたものを返す"""
+    if result.get("status") == "success" and "message" in result:
+        result = {key: value for key, value in result.items() if key != "message"}
+    if "results" in result:
+        result = dict(result, results=[strip_messages(item) for item in result["results"]])
+    return result
+
+
+def encoded_response(result, status, fmt=serialization.JSON, terse=False):
+    """fmt の形式でレスポンスを返す (429 の場合は Retry-After ヘッダーを付ける)"""
+    if terse:
+        result = strip_messages(result)
+    response = Response(serialization.encode(result, fmt), status, mimetype=fmt)
+    if "retryAfter" in result:
+        response.headers["Retry-After"] = str(max(1, math.ceil(result["retryAfter"])))
+    return response, status
+
+
+# Scratchからのコマンドを受け取るエンドポイント
+# /w/<ワールド名>/command (またはボディの "world") で、WORLDS で設定したワールドに送ります
 @app.route('/command', methods=['POST'])
-def handle_command():
-    data = request.get_json()
-    if not data:
-        return jsonify({"status": "error", "message": "Invalid JSON"}), 400
+@app.route('/w/<world>/command', methods=['POST'])
+def handle_command(world=None):
+    started = metrics.start()
+    fmt = request_format()
+    data = request_data()
+    if not isinstance(data, dict) or not data:
+        metrics.finish(None, 400, started)
+        return encoded_response({"status": "error", "message": "Invalid JSON"}, 400, fmt)
 
     command = data.get('command')
     args = data.get('args', [])
 
-    print(f"Received command: {command} with args: {args}")
-
-    # ここでMinecraftへのコマンドを実行するロジックを追加
-    # 例:
-    # if command == 'postToChat':
-    #     if mc and len(args) > 0:
-    #         mc.postToChat(str(args[0]))
-    #         return jsonify({"status": "success"})
-    #     else:
-    #         return jsonify({"status": "error", "message": "Minecraft not connected or invalid args"}), 500
-    # elif command == 'setBlock':
-    # ここでMinecraftへのコマンドを実行するロジックを追加
-    global mc
-    if not mc:
-        return jsonify({"status": "error", "message": "Minecraft not connected"}), 503 # Service Unavailable
+    logger.info("Received command", extra={"command": command, "arguments": args})
+
+    client = client_id(data)
+    terse = is_terse(data)
+    target = resolve_world(world if world is not None else data.get('world'))
+    if target is None:
+        result, status = unknown_world(world if world is not None else data.get('world'))
+    else:
+        with response_style(fmt, terse):
+            result, status = in_world(target, lambda: sequenced(
+                explicit_client_id(data), data.get('seq'), lambda: execute_command(command, args, client, target),
+                target))
+    metrics.finish(command, status, started)
+    return encoded_response(result, status, fmt, terse)
+
+
+# 複数のコマンドを1回のHTTPリクエストでまとめて実行するエンドポイント
+# ボディはコマンドのリスト、または {"commands": [...], "seq": ...} の形式
+@app.route('/batch', methods=['POST'])
+@app.route('/w/<world>/batch', methods=['POST'])
+def handle_batch(world=None):
+    started = metrics.start()
+    fmt = request_format()
+    data = request_data()
+    client = client_id(data)
+    seq = data.get('seq') if isinstance(data, dict) else None
+    terse = is_terse(data)
+    if world is None and isinstance(data, dict):
+        world = data.get('world')
+    target = resolve_world(world)
+    if target is None:
+        result, status = unknown_world(world)
+    else:
+        with response_style(fmt, terse):
+            result, status = in_world(target, lambda: sequenced(
+                explicit_client_id(data), seq, lambda: batch_response(data, client, target), target))
+    metrics.finish("batch", status, started)
+    return encoded_response(result, status, fmt, terse)
+
+
+def batch_response(data, client, world=default_world):
+    """/batch のリクエストを world で処理し、(レスポンス dict, HTTPステータス) を返す"""
+    items = data.get('commands') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return {"status": "error", "message": "Invalid JSON (expected a list of commands)"}, 400
+    if len(items) > MAX_BATCH_SIZE:
+        return {"status": "error", "message": f"Too many commands in batch (max {MAX_BATCH_SIZE})"}, 413
+
+    logger.info("Received batch", extra={"command": "batch", "size": len(items)})
+
+    if not world.mc and not world.connection.wait_connected(CONNECT_WAIT_TIMEOUT):
+        return {"status": "error", "message": "Minecraft not connected"}, 503 # Service Unavailable
+
+    # 実行前にすべてのコマンドを検証し、1つでも不正なら何も実行しない
+    actions = []
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "message": "Invalid command object"})
+            continue
+        command = item.get('command')
+        args = item.get('args', [])
+        try:
+            actions.append((command, args, prepare_command(command, args)))
+        except CommandError as e:
+            errors.append({"index": index, "message": e.message})
+    if errors:
+        return {"status": "error", "message": "Invalid commands in batch", "errors": errors}, 400
+
+    # setBlock などの書き込み系コマンドは応答を待たずに送信されるため、
+    # 連続して実行するだけでMinecraftへの書き込みがパイプライン化される
+    # 他のリクエストのコマンドが間に割り込まないように、バッチ全体でロックを保持する
+    def run_batch():
+        results = []
+        with world.mc_lock:
+            for command, args, action in actions:
+                result, status = run_command(command, args, action, client, world)
+                result["code"] = status
+                results.append(result)
+        return {"status": "success", "results": results}, 200
+
+    # バッチ全体を1回の順番として、含まれるコマンドの重さの合計を消費する
+    return schedule(client, sum(action.cost for _, _, action in actions), run_batch, world)
+
+
+# --- /metrics のゲージ (読み出し時に現在の値を求める) ---
+
+def event_buffer_values(value):
+    """既定のワールドのイベントのバッファ (ポーラーまたは pollBlockHits 用) についての値"""
+    queue = event_poller.queue if event_poller is not None else commands.event_backlog
+    return value(queue.log) if queue is not None else 0
+
 
+def cache_counts(attribute):
+    caches = {}
+    if commands.world_cache is not None:
+        caches['cache="block"'] = getattr(commands.world_cache.blocks, attribute)
+        caches['cache="height"'] = getattr(commands.world_cache.heights, attribute)
+    if commands.player_state_cache is not None:
+        caches['cache="player_state"'] = getattr(commands.player_state_cache, attribute)
+    return caches
+
+
+metrics.gauge("bridge_minecraft_connected", "Whether the bridge is connected to Minecraft",
+              lambda: 1 if connection.mc is not None else 0)
+metrics.gauge("bridge_minecraft_connects_total", "Successful connections to Minecraft (including reconnects)",
+              lambda: connection.connects, "counter")
+metrics.gauge("bridge_minecraft_rtt_seconds", "Round trip of the last connection health check",
+              lambda: connection.rtt if connection.rtt is not None else 0)
+metrics.gauge("bridge_startup_seconds", "Time from loading the bridge until it accepted requests",
+              lambda: startup_seconds if startup_seconds is not None else 0)
+metrics.gauge("bridge_first_connect_seconds", "Time from loading the bridge until the first connection to Minecraft",
+              lambda: first_connect_seconds if first_connect_seconds is not None else 0)
+metrics.gauge("bridge_scheduler_queue_depth", "Commands waiting for their turn in the client scheduler",
+              lambda: scheduler.depth() if scheduler is not None else 0)
+metrics.gauge("bridge_scheduler_rejected_total", "Commands rejected with 429 by the client scheduler",
+              lambda: scheduler.rejected if scheduler is not None else 0, "counter")
+metrics.gauge("bridge_sequence_replays_total", "Retried commands answered with the stored result instead of running again",
+              lambda: sequencer.replayed if sequencer is not None else 0, "counter")
+metrics.gauge("bridge_journal_records_total", "Write commands written to the journal",
+              lambda: journal.records if journal is not None else 0, "counter")
+metrics.gauge("bridge_journal_pending", "Journal records waiting for the next fsync",
+              lambda: len(journal) if journal is not None else 0)
+metrics.gauge("bridge_write_buffer_pending", "setBlock writes waiting in the write buffer",
+              lambda: len(commands.write_buffer) if commands.write_buffer is not None else 0)
+metrics.gauge("bridge_event_buffer_events", "Events held in the default world's event buffer, by kind",
+              lambda: event_buffer_values(lambda log: {f'kind="{kind}"': count for kind, count in log.sizes().items()}))
+metrics.gauge("bridge_events_dropped_total", "Unread events dropped because the event buffer was full",
+              lambda: event_buffer_values(lambda log: log.dropped), "counter")
+metrics.gauge("bridge_events_coalesced_total", "Block hits dropped as duplicates of a buffered hit on the same block",
+              lambda: event_buffer_values(lambda log: log.coalesced), "counter")
+metrics.gauge("bridge_cache_hits_total", "Cache lookups answered without asking Minecraft",
+              lambda: cache_counts("hits"), "counter")
+metrics.gauge("bridge_cache_misses_total", "Cache lookups that had to ask Minecraft",
+              lambda: cache_counts("misses"), "counter")
+
+
+def world_values(value):
+    """WORLDS のワールドごとの値 (world ラベル付き、WORLDS がなければ空)"""
+    if not worlds:
+        return {}
+    return {f'world="{world.name}"': value(world) for world in [default_world, *worlds.values()]}
+
+
+metrics.gauge("bridge_world_connected", "Whether the bridge is connected to each world's Minecraft server",
+              lambda: world_values(lambda world: 1 if world.connection.mc is not None else 0))
+metrics.gauge("bridge_world_connects_total", "Successful connections to each world (including reconnects)",
+              lambda: world_values(lambda world: world.connection.connects), "counter")
+metrics.gauge("bridge_world_queue_depth", "Commands waiting in each world's client scheduler",
+              lambda: world_values(lambda world: world.scheduler.depth() if world.scheduler is not None else 0))
+metrics.gauge("bridge_world_inflight", "Requests being handled for each world",
+              lambda: world_values(lambda world: world.limit.inflight))
+metrics.gauge("bridge_world_rejected_total", "Requests rejected with 503 because the world had too many in flight",
+              lambda: world_values(lambda world: world.limit.rejected), "counter")
+
+
+# Prometheus のテキスト形式でメトリクスを返すエンドポイント
+@app.route('/metrics', methods=['GET'])
+def handle_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+# 既定のワールドと WORLDS のワールドの接続の状態を返すエンドポイント
+@app.route('/worlds', methods=['GET'])
+def handle_worlds():
+    return jsonify({"status": "success", "worlds": [
+        {"name": world.name, "host": world.host, "port": world.port,
+         "connected": world.connection.mc is not None, "inflight": world.limit.inflight,
+         "lastError": str(world.connection.last_error) if world.connection.last_error is not None else None}
+        for world in [default_world, *worlds.values()]]})
+
+
+# /readyz で応答を確認するときに、他のリクエストが接続を使い終わるのを待つ時間 (秒)
+READY_TIMEOUT = float(os.environ.get("READY_TIMEOUT_MS", 1000)) / 1000
+
+
+# プロセスが動いているかを返すエンドポイント (Minecraft への接続とは関係なく 200)
+@app.route('/healthz', methods=['GET'])
+def handle_healthz():
+    return jsonify({"status": "success", "uptime": round(time.perf_counter() - STARTED, 3)})
+
+
+# Minecraft に接続していて応答する場合だけ 200 を返すエンドポイント (往復時間を測る)
+# 接続できていない間と、終了の準備を始めた後は 503 を返すので、ロードバランサーなどはリクエストを送らない
+@app.route('/readyz', methods=['GET'])
+@app.route('/w/<world>/readyz', methods=['GET'])
+def handle_readyz(world=None):
+    target = request_world(world)
+    if target is None:
+        return jsonify(unknown_world(world or request.args.get('world'))[0]), 404
+    if stopping.is_set():
+        return jsonify({"status": "error", "world": target.name, "message": "Shutting down"}), 503
+    rtt = target.connection.probe(READY_TIMEOUT)
+    if rtt is None:
+        error = target.connection.last_error
+        return jsonify({"status": "error", "world": target.name, "message": "Minecraft not connected",
+                        "lastError": str(error) if error is not None else None}), 503
+    return jsonify({"status": "success", "world": target.name, "rttMs": round(rtt * 1000, 3)})
+
+
+# /events で1回に待つ最大時間 (秒)
+MAX_EVENT_WAIT = 30.0
+# SSE で接続を維持するためのコメントを送る間隔 (秒)
+SSE_KEEPALIVE = 15.0
+
+
+def parse_event_kinds(value):
+    """type パラメータ (カンマ区切り) を受け取るイベントの種類に変換する"""
+    if not value:
+        return None
+    kinds = set(value.split(','))
+    if not kinds <= {BLOCK_HIT, CHAT_POST}:
+        raise ValueError(f"unknown event type: {value}")
+    return kinds
+
+
+def event_poller_unavailable():
+    return jsonify({"status": "error", "message": "Event poller is not running"}), 503
+
+
+def request_world(world):
+    """パスのワールド名 (なければクエリの world) のワールドを返す (知らない名前は None)"""
+    return resolve_world(world if world is not None else request.args.get('world'))
+
+
+# ブロックヒットとチャット投稿をカーソル付きで取得するエンドポイント (ロングポーリング)
+# 例: GET /events?since=42&timeout=10&type=blockHit
+# since より新しいイベントがなければ、最大 timeout 秒まで届くのを待ちます
+@app.route('/events', methods=['GET'])
+@app.route('/w/<world>/events', methods=['GET'])
+def handle_events(world=None):
+    target = request_world(world)
+    if target is None:
+        return jsonify(unknown_world(world or request.args.get('world'))[0]), 404
+    event_poller = target.event_poller
+    if event_poller is None:
+        return event_poller_unavailable()
     try:
-        if command == 'postToChat':
-            if len(args) > 0:
-                mc.postToChat(str(args[0]))
-                return jsonify({"status": "success", "message": f"Posted '{args[0]}' to chat"})
-            else:
-                return jsonify({"status": "error", "message": "Missing message argument for postToChat"}), 400
-        elif command == 'setBlock':
-            if len(args) == 4: # x, y, z, block_id (block_dataはオプションなので省略)
-                try:
-                    x, y, z, block_id = map(int, args[:4])
-                    mc.setBlock(x, y, z, block_id)
-                    return jsonify({"status": "success", "message": f"Set block at ({x},{y},{z}) to {block_id}"})
-                except ValueError:
-                    return jsonify({"status": "error", "message": "Invalid arguments for setBlock (must be integers)"}), 400
-            else:
-                 return jsonify({"status": "error", "message": "Incorrect number of arguments for setBlock (expected 4)"}), 400
-        elif command == 'getPlayerPos':
-            if len(args) == 0:
-                pos = mc.player.getPos()
-                # Vec3 オブジェクトは直接 JSON シリアライズできない場合があるので、属性を個別に返す
-                return jsonify({"status": "success", "x": pos.x, "y": pos.y, "z": pos.z})
-            else:
-                return jsonify({"status": "error", "message": "getPlayerPos does not take any arguments"}), 400
-        elif command == 'setPlayerPos':
-            if len(args) == 3: # x, y, z
-                try:
-                    x, y, z = map(float, args[:3]) # 座標は float もありうる
-                    mc.player.setPos(x, y, z)
-                    return jsonify({"status": "success", "message": f"Set player position to ({x},{y},{z})"})
-                except ValueError:
-                    return jsonify({"status": "error", "message": "Invalid arguments for setPlayerPos (must be numbers)"}), 400
-            else:
-                return jsonify({"status": "error", "message": "Incorrect number of arguments for setPlayerPos (expected 3)"}), 400
-        elif command == 'getBlock':
-            if len(args) == 3: # x, y, z
-                try:
-                    x, y, z = map(int, args[:3])
-                    block_id = mc.getBlock(x, y, z)
-                    return jsonify({"status": "success", "block_id": block_id})
-                except ValueError:
-                    return jsonify({"status": "error", "message": "Invalid arguments for getBlock (must be integers)"}), 400
-            else:
-                return jsonify({"status": "error", "message": "Incorrect number of arguments for getBlock (expected 3)"}), 400
-        elif command == 'setBlocks':
-            # 引数: x1, y1, z1, x2, y2, z2, block_id, [block_data] (block_dataはオプション)
-            if len(args) == 7 or len(args) == 8:
-                try:
-                    coords = list(map(int, args[:6]))
-                    block_id = int(args[6])
-                    block_data = int(args[7]) if len(args) == 8 else None
-                    if block_data is not None:
-                        mc.setBlocks(coords[0], coords[1], coords[2], coords[3], coords[4], coords[5], block_id, block_data)
-                    else:
-                        mc.setBlocks(coords[0], coords[1], coords[2], coords[3], coords[4], coords[5], block_id)
-                    return jsonify({"status": "success", "message": f"Set blocks in range ({coords[0]}..{coords[3]}, {coords[1]}..{coords[4]}, {coords[2]}..{coords[5]}) to {block_id}" + (f":{block_data}" if block_data is not None else "")})
-                except ValueError:
-                    return jsonify({"status": "error", "message": "Invalid arguments for setBlocks (must be integers)"}), 400
-            else:
-                return jsonify({"status": "error", "message": "Incorrect number of arguments for setBlocks (expected 7 or 8)"}), 400
-        elif command == 'getHeight':
-            if len(args) == 2: # x, z
-                try:
-                    x, z = map(int, args[:2])
-                    height = mc.getHeight(x, z)
-                    return jsonify({"status": "success", "height": height})
-                except ValueError:
-                     return jsonify({"status": "error", "message": "Invalid arguments for getHeight (must be integers)"}), 400
-            else:
-                return jsonify({"status": "error", "message": "Incorrect number of arguments for getHeight (expected 2)"}), 400
-        elif command == 'getPlayerTilePos':
-             if len(args) == 0:
-                pos = mc.player.getTilePos()
-                return jsonify({"status": "success", "x": pos.x, "y": pos.y, "z": pos.z})
-             else:
-                return jsonify({"status": "error", "message": "getPlayerTilePos does not take any arguments"}), 400
-        elif command == 'getPlayerDirection':
-            if len(args) == 0:
-                direction = mc.player.getDirection()
-                return jsonify({"status": "success", "x": direction.x, "y": direction.y, "z": direction.z})
-            else:
-                return jsonify({"status": "error", "message": "getPlayerDirection does not take any arguments"}), 400
-        elif command == 'getPlayerRotation':
-            if len(args) == 0:
-                rotation = mc.player.getRotation()
-                return jsonify({"status": "success", "rotation": rotation})
-            else:
-                return jsonify({"status": "error", "message": "getPlayerRotation does not take any arguments"}), 400
-        elif command == 'getPlayerPitch':
-            if len(args) == 0:
-                pitch = mc.player.getPitch()
-                return jsonify({"status": "success", "pitch": pitch})
-            else:
-                return jsonify({"status": "error", "message": "getPlayerPitch does not take any arguments"}), 400
-        elif command == 'worldSetting':
-            if len(args) == 2: # setting_name, status (True/False or 1/0)
-                setting_name = str(args[0])
-                status_str = str(args[1]).lower()
-                if status_str in ['true', '1']:
-                    status = True
-                elif status_str in ['false', '0']:
-                    status = False
-                else:
-                    return jsonify({"status": "error", "message": "Invalid status for worldSetting (must be true/false or 1/0)"}), 400
-
-                # 利用可能な設定名を制限するか、そのまま渡すか検討
-                # ここではそのまま渡す
-                mc.world.setting(setting_name, status)
-                return jsonify({"status": "success", "message": f"Set world setting '{setting_name}' to {status}"})
-            else:
-                return jsonify({"status": "error", "message": "Incorrect number of arguments for worldSetting (expected 2: name, status)"}), 400
-        elif command == 'pollBlockHits':
-             if len(args) == 0:
-                hits = mc.events.pollBlockHits()
-                # Event オブジェクトをJSONシリアライズ可能な形式に変換
-                hits_data = [{"type": hit.type, "pos": {"x": hit.pos.x, "y": hit.pos.y, "z": hit.pos.z}, "face": hit.face, "entityId": hit.entityId} for hit in hits]
-                return jsonify({"status": "success", "hits": hits_data})
-             else:
-                return jsonify({"status": "error", "message": "pollBlockHits does not take any arguments"}), 400
-        elif command == 'pollChatPosts':
-             if len(args) == 0:
-                posts = mc.events.pollChatPosts()
-                # Event オブジェクトをJSONシリアライズ可能な形式に変換
-                posts_data = [{"type": post.type, "entityId": post.entityId, "message": post.message} for post in posts]
-                return jsonify({"status": "success", "posts": posts_data})
-             else:
-                return jsonify({"status": "error", "message": "pollChatPosts does not take any arguments"}), 400
-        elif command == 'clearEvents':
-            if len(args) == 0:
-                mc.events.clearAll()
-                return jsonify({"status": "success", "message": "Cleared all events"})
-            else:
-                return jsonify({"status": "error", "message": "clearEvents does not take any arguments"}), 400
-        # --- 他のMinecraftコマンドの処理をここに追加 ---
-        else:
-            return jsonify({"status": "error", "message": f"Unknown command: {command}"}), 400
-    except Exception as e:
-        # エラーの詳細をログに出力
-        import traceback
-        print(f"Error executing Minecraft command '{command}' with args {args}:")
-        traceback.print_exc()
-        return jsonify({"status": "error", "message": f"Minecraft command failed: {e}"}), 500
+        since = int(request.args.get('since', 0))
+        timeout = min(float(request.args.get('timeout', 0)), MAX_EVENT_WAIT)
+        # 1回に返すのは最大 MAX_PAGE 件 (残りは more が true になり、cursor から続きを読む)
+        limit = min(int(request.args.get('limit', MAX_PAGE)), MAX_PAGE)
+        kinds = parse_event_kinds(request.args.get('type'))
+        if limit < 1:
+            raise ValueError("limit must be positive")
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid query parameters for /events"}), 400
 
-    # # 仮のレスポンス (エラー処理が先に行われるため、通常ここには到達しない)
-    # return jsonify({"status": "received", "command": command, "args": args})
+    log = event_poller.log
+    events, cursor, missed = log.since(since, kinds, limit)
+    if not events and timeout > 0 and log.wait(cursor, timeout):
+        events, cursor, missed = log.since(since, kinds, limit)
+    return jsonify({"status": "success", "events": events, "cursor": cursor, "missed": missed,
+                    "more": log.pending(cursor, kinds) > 0})
 
-if __name__ == '__main__':
-    # Minecraft Pi Edition (Reborn)が動作しているホストとポートを指定
-    # DockerコンテナからホストOS上のMinecraftに接続する場合、
-    # 'host.docker.internal' またはホストマシンのIPアドレスを使用します。
-    # 環境変数から取得するか、デフォルト値を設定します。
-    import os
-    minecraft_host = os.environ.get("MINECRAFT_HOST", "localhost")
-    minecraft_port = int(os.environ.get("MINECRAFT_PORT", 4711)) # デフォルトポート
 
+# イベントを Server-Sent Events で配信するエンドポイント
+# 再接続時は Last-Event-ID ヘッダー (または since) の続きから配信します
+@app.route('/events/stream', methods=['GET'])
+@app.route('/w/<world>/events/stream', methods=['GET'])
+def handle_event_stream(world=None):
+    target = request_world(world)
+    if target is None:
+        return jsonify(unknown_world(world or request.args.get('world'))[0]), 404
+    event_poller = target.event_poller
+    if event_poller is None:
+        return event_poller_unavailable()
     try:
-        print(f"Attempting to connect to Minecraft at {minecraft_host}:{minecraft_port}...")
-        mc = Minecraft.create(minecraft_host, minecraft_port)
-        # 接続確認のためにチャットにメッセージを送信
-        mc.postToChat("Scratch bridge connected!")
-        print("Successfully connected to Minecraft Pi Edition (Reborn)")
-    except Exception as e:
-        print(f"!!! WARNING: Could not connect to Minecraft at {minecraft_host}:{minecraft_port} - {e}")
-        print("!!! The bridge will run, but Minecraft commands will fail until connection is established.")
-        mc = None # 接続失敗時はNoneに設定
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+        kinds = parse_event_kinds(request.args.get('type'))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid query parameters for /events/stream"}), 400
+
+    log = event_poller.log
+
+    def generate(cursor):
+        while not stopping.is_set():
+            events, cursor, _ = log.since(cursor, kinds, MAX_PAGE)
+            for event in events:
+                yield f"id: {event['seq']}\nevent: {event['kind']}\ndata: {json.dumps(event)}\n\n"
+            if not log.wait(cursor, SSE_KEEPALIVE):
+                yield ": keepalive\n\n"
+
+    return Response(generate(since), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def handle_ws_message(text, subscribe=None, client=None, world=None, sequence_client=None):
+    """WebSocket で受け取った1つのメッセージを実行し、返信用の dict を返す
+
+    メッセージは {"id": ..., "command": ..., "args": [...]} の形式で、
+    返信には同じ id と HTTP ステータス相当の code が付きます。
+    command が subscribeEvents の場合は subscribe(since, kinds) を呼び出し、
+    以降のイベントが {"event": {...}} として同じ接続に配信されます。
+    world は接続のワールド名 (/w/<名前>/ws または ?world=) で、None は既定のワールドです。
+    seq の連番は、メッセージの client または sequence_client (接続の X-Client-Id) ごとに数えます。
+    """
+    started = metrics.start()
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        data = None
+    if not isinstance(data, dict):
+        metrics.finish(None, 400, started)
+        return {"id": None, "code": 400, "status": "error", "message": "Invalid JSON"}
+
+    command = data.get('command')
+    target = resolve_world(world)
+    if target is None:
+        result, status = unknown_world(world)
+    elif command == 'subscribeEvents' and subscribe is not None:
+        result, status = subscribe_ws_events(data.get('args') or [], subscribe, target)
+    else:
+        args = data.get('args', [])
+        result, status = in_world(target, lambda: sequenced(
+            body_client(data) or sequence_client, data.get('seq'),
+            lambda: execute_command(command, args, client, target), target))
+    metrics.finish(command, status, started)
+    result["id"] = data.get('id')
+    result["code"] = status
+    return result
+
+
+def subscribe_ws_events(args, subscribe, world=default_world):
+    """subscribeEvents の引数 [since, type] (省略可能) を検証して world のイベントの購読を開始する"""
+    event_poller = world.event_poller
+    if event_poller is None:
+        return {"status": "error", "message": "Event poller is not running"}, 503
+    try:
+        since = int(args[0]) if len(args) > 0 else event_poller.log.last_seq
+        kinds = parse_event_kinds(args[1] if len(args) > 1 else None)
+    except (TypeError, ValueError):
+        return {"status": "error", "message": "Invalid arguments for subscribeEvents"}, 400
+    if not subscribe(since, kinds):
+        return {"status": "error", "message": "Already subscribed to events"}, 409
+    return {"status": "success", "cursor": since}, 200
+
+
+# 1本の接続を開いたままコマンドを送り続けるための WebSocket エンドポイント
+# リクエストごとの TCP 接続や HTTP ヘッダーの処理を省けます
+@app.route('/ws', websocket=True)
+@app.route('/w/<world>/ws', websocket=True)
+def handle_ws(world=None):
+    if simple_websocket is None:
+        return jsonify({"status": "error", "message": "WebSocket support is not installed"}), 501
+    if world is None:
+        world = request.args.get('world')
+    target = resolve_world(world)
+    if target is None:
+        return jsonify(unknown_world(world)[0]), 404
+    try:
+        ws = simple_websocket.Server.accept(request.environ)
+    except (RuntimeError, simple_websocket.ConnectionError):
+        return jsonify({"status": "error", "message": "WebSocket upgrade required"}), 400
+
+    client = client_id()
+    sequence_client = explicit_client_id()
+    # 返信とイベントの配信が別スレッドから送られるため、送信はロックで直列化する
+    send_lock = threading.Lock()
+    closed = threading.Event()
+    subscribed = threading.Event()
+
+    def send(message):
+        with send_lock:
+            ws.send(json.dumps(message))
+
+    def push_events(cursor, kinds, log):
+        try:
+            while not closed.is_set():
+                events, cursor, _ = log.since(cursor, kinds, MAX_PAGE)
+                for event in events:
+                    send({"event": event})
+                log.wait(cursor, SSE_KEEPALIVE)
+        except simple_websocket.ConnectionClosed:
+            pass
+
+    def subscribe(since, kinds):
+        # 購読は1つの接続につき1回まで
+        if subscribed.is_set():
+            return False
+        subscribed.set()
+        threading.Thread(target=push_events, args=(since, kinds, target.event_poller.log), name="ws-events",
+                         daemon=True).start()
+        return True
+
+    try:
+        while not stopping.is_set():
+            text = ws.receive(timeout=SSE_KEEPALIVE)
+            if text is None:
+                continue
+            send(handle_ws_message(text, subscribe, client, world, sequence_client))
+    except simple_websocket.ConnectionClosed:
+        pass
+    closed.set()
+    try:
+        ws.close()
+    except Exception:
+        pass
+    return WebSocketResponse(ws.mode)
+
+
+class WebSocketResponse(Response):
+    """WebSocket 終了後に HTTP レスポンスを書き込まないためのレスポンス"""
+
+    def __init__(self, mode):
+        super().__init__()
+        self.mode = mode
+
+    def __call__(self, *args, **kwargs):
+        if self.mode == 'werkzeug':
+            return super().__call__(*args, **kwargs)
+        # gunicorn などでは接続はすでに WebSocket として閉じられている
+        return []
+
+
+def configure_logging():
+    """ログを JSON Lines で標準出力に書き出す (LOG_SAMPLE でコマンドごとに間引ける)"""
+    setup_logging(level=os.environ.get("LOG_LEVEL", "INFO"), sample=os.environ.get("LOG_SAMPLE", ""),
+                  fmt=os.environ.get("LOG_FORMAT", "json"))
+
+
+def configure_world(state, get_mc, lock, workers, snapshot_dir):
+    """環境変数に従って1つのワールドのキャッシュ、ポーラー、書き込みバッファなどを state に設定する
+
+    state は既定のワールドでは commands のモジュール、WORLDS のワールドでは commands.WorldState です。
+    そのワールドのスケジューラーと連番の管理を (scheduler, sequencer) で返します (無効なものは None)。
+    """
+    scheduler = sequencer = None
+    # BLOCK_CACHE_TTL (秒) を設定すると、getBlock / getHeight の結果をキャッシュする
+    block_cache_ttl = float(os.environ.get("BLOCK_CACHE_TTL", 0))
+    if block_cache_ttl > 0 and workers > 1:
+        # 他のワーカーの書き込みはこのワーカーのキャッシュに反映されないので、古い値を返してしまう
+        logger.warning("BLOCK_CACHE_TTL is ignored with %s workers", workers)
+    elif block_cache_ttl > 0:
+        state.world_cache = WorldCache(ttl=block_cache_ttl,
+                                       max_chunks=int(os.environ.get("BLOCK_CACHE_CHUNKS", 256)))
+        logger.info("Caching block reads for %ss", block_cache_ttl)
+
+    # PLAYER_STATE_WINDOW_MS (ミリ秒) 以内の getPlayerState は1回の取得結果を共有する (0 で無効)
+    player_state_window = float(os.environ.get("PLAYER_STATE_WINDOW_MS", 20)) / 1000
+    if player_state_window > 0:
+        state.player_state_cache = PlayerStateCache(window=player_state_window)
+
+    # CLIENT_QUEUE_SIZE が 0 でなければ、クライアントごとの待ち行列から公平に順番を割り当てる
+    # CLIENT_RATE (1秒あたりのコスト) を設定すると、クライアントごとにレート制限もかける
+    client_queue_size = int(os.environ.get("CLIENT_QUEUE_SIZE", 64))
+    if client_queue_size > 0:
+        client_rate = float(os.environ.get("CLIENT_RATE", 0))
+        client_burst = float(os.environ["CLIENT_BURST"]) if "CLIENT_BURST" in os.environ else None
+        scheduler = FairScheduler(rate=client_rate, burst=client_burst, max_queue=client_queue_size)
+
+    # DEDUP_WINDOW が 0 でなければ、seq を付けて送られたコマンドをクライアントごとに連番の順に実行し、
+    # 直近 DEDUP_WINDOW 件の結果を覚えておいて再送には同じ結果を返す
+    dedup_window = int(os.environ.get("DEDUP_WINDOW", 256))
+    if dedup_window > 0 and workers > 1:
+        # 再送が別のワーカーに届くと、そのワーカーは結果を覚えていないのでもう一度実行してしまう
+        # (デフォルトの値のままなら警告は出さずに無効にする)
+        if "DEDUP_WINDOW" in os.environ:
+            logger.warning("DEDUP_WINDOW is ignored with %s workers", workers)
+    elif dedup_window > 0:
+        sequencer = ClientSequencer(window=dedup_window, max_clients=int(os.environ.get("DEDUP_CLIENTS", 1024)),
+                                    order_wait=float(os.environ.get("SEQUENCE_WAIT_MS", 500)) / 1000)
+
+    # EVENT_POLL_INTERVAL (秒) を設定すると、バックグラウンドでイベントを取得して
+    # /events, /events/stream, /ws から複数のクライアントが同じイベントを読めるようにする
+    # イベントは種類ごとに EVENT_BUFFER_SIZE 件まで保持し、未読のイベントで溢れたら EVENT_OVERFLOW の方針に従う
+    event_poll_interval = float(os.environ.get("EVENT_POLL_INTERVAL", 0))
+    event_capacity = int(os.environ.get("EVENT_BUFFER_SIZE", 1024))
+    event_overflow = os.environ.get("EVENT_OVERFLOW", DROP_OLDEST)
+    if event_poll_interval > 0 and workers > 1:
+        # ワーカーごとのポーラーがゲームのイベントを取り合い、それぞれのクライアントには一部のイベントしか届かない
+        logger.warning("EVENT_POLL_INTERVAL is ignored with %s workers", workers)
+    elif event_poll_interval > 0:
+        # ブロックヒットの座標はキャッシュから無効化する
+        on_block_positions = state.world_cache.on_block_positions if state.world_cache is not None else None
+        state.event_poller = EventPoller(get_mc, lock, interval=event_poll_interval, capacity=event_capacity,
+                                         on_block_positions=on_block_positions, overflow=event_overflow)
+        state.event_poller.start()
+        logger.info("Polling Minecraft events every %ss", event_poll_interval)
+    elif workers == 1:
+        # ポーラーがなくても、pollBlockHits / pollChatPosts はゲームのイベントを同じ上限のバッファに移して少しずつ返す
+        # (ワーカーが2つ以上の場合は、バッファに残ったイベントが他のワーカーから読めないので、すべてをそのまま返す)
+        state.event_backlog = EventQueue(EventLog(event_capacity, event_overflow))
+
+    # WRITE_BUFFER_DELAY_MS を設定すると、setBlock をその時間だけためてから
+    # 同じブロックの範囲を setBlocks にまとめて送信する
+    write_buffer_delay = float(os.environ.get("WRITE_BUFFER_DELAY_MS", 0)) / 1000
+    if write_buffer_delay > 0:
+        state.write_buffer = BlockWriteBuffer(get_mc, lock, delay=write_buffer_delay)
+        state.write_buffer.start()
+        logger.info("Buffering setBlock writes for %gms", write_buffer_delay * 1000)
+
+    # NATIVE_GET_BLOCKS が true なら、getBlocks などの範囲の読み出しに world.getBlocks を使う
+    state.native_get_blocks = to_bool(os.environ.get("NATIVE_GET_BLOCKS", "false"))
+
+    # snapshot_dir が空なら snapshotRegion / restoreRegion は 501
+    state.snapshot_store = SnapshotStore(snapshot_dir) if snapshot_dir else None
+    return scheduler, sequencer
+
+
+def configure(workers=1):
+    """環境変数に従って Minecraft に接続し、キャッシュやスケジューラーなどを設定する
+
+    app.py を直接起動した場合のほか、gunicorn のワーカー (gunicorn.conf.py) や
+    ベンチマーク (bench.py) からも呼ばれます。
+    workers はブリッジのプロセスの数で、2以上の場合はプロセスごとに Minecraft に接続します。
+    """
+    global scheduler, event_poller, sequencer, journal, startup_seconds
+    # 接続を待たずにリクエストを受け付けられるように、接続は監視スレッドがバックグラウンドで行う
+    # (つながるまでのコマンドは最大 CONNECT_WAIT_TIMEOUT 秒待ってから 503、/readyz も 503)
+    logger.info("Connecting to Minecraft at %s:%s in the background", MINECRAFT_HOST, MINECRAFT_PORT)
+    connection.start()
+
+    # SNAPSHOT_DIR に snapshotRegion のスナップショットを保存する (未設定なら snapshotRegion / restoreRegion は 501)
+    # WORLDS のワールドのスナップショットは、ワールドの名前のサブディレクトリに保存する
+    snapshot_dir = os.environ.get("SNAPSHOT_DIR", "")
+    scheduler, sequencer = configure_world(commands, lambda: mc, mc_lock, workers, snapshot_dir)
+    event_poller = commands.event_poller
+
+    # WORLDS を設定すると、名前付きのワールドごとに接続し、同じ設定でキャッシュなどを用意する
+    addresses = parse_worlds(os.environ.get("WORLDS", ""), MINECRAFT_PORT)
+    if addresses:
+        # 応答しないワールドのリクエストが共有のスレッドを使い切らないように、既定では WEB_THREADS の半分まで
+        max_inflight = int(os.environ.get("WORLD_MAX_INFLIGHT", max(1, int(os.environ.get("WEB_THREADS", 16)) // 2)))
+        default_world.limit = InflightLimit(max_inflight)
+    for name, (host, port) in addresses.items():
+        world = World(name, host, port, create_minecraft, health_interval=HEALTH_INTERVAL, max_inflight=max_inflight)
+        logger.info("Connecting to world %s at %s:%s in the background", name, host, port)
+        world.connection.start()
+        world.scheduler, world.sequencer = configure_world(
+            world.state, lambda world=world: world.mc, world.mc_lock, workers,
+            os.path.join(snapshot_dir, name) if snapshot_dir else "")
+        worlds[name] = world
+
+    # JOURNAL_DIR を設定すると、実行した書き込み系のコマンドをそこに追記する (replay.py で再生できる)
+    journal_dir = os.environ.get("JOURNAL_DIR", "")
+    if journal_dir:
+        if workers > 1:
+            # ワーカーごとに別のディレクトリに書き、読むときに時刻の順に合わせる
+            journal_dir = os.path.join(journal_dir, f"worker-{os.getpid()}")
+        journal = CommandJournal(journal_dir,
+                                 fsync_interval=float(os.environ.get("JOURNAL_FSYNC_MS", 100)) / 1000,
+                                 segment_bytes=int(float(os.environ.get("JOURNAL_SEGMENT_MB", 64)) * (1 << 20)),
+                                 max_segments=int(os.environ.get("JOURNAL_MAX_SEGMENTS", 0)))
+        journal.start()
+        logger.info("Journaling write commands to %s", journal_dir)
+
+    startup_seconds = time.perf_counter() - STARTED
+    logger.info("Ready to accept requests after %.3fs", startup_seconds)
+
+
+def stop_world(state, connection, lock, current):
+    """ワールドのためている書き込みを送ってからポーラーと接続の監視を止め、接続 current を閉じる"""
+    if state.write_buffer is not None:
+        try:
+            count, calls = state.write_buffer.stop()
+            logger.info("Flushed %s buffered blocks in %s calls before shutdown", count, calls)
+        except Exception:
+            logger.exception("Could not flush buffered blocks before shutdown")
+        state.write_buffer = None
+    if state.event_poller is not None:
+        state.event_poller.stop()
+        state.event_poller = None
+    connection.stop()
+    with lock:
+        if current() is not None:
+            try:
+                # 送信済みの書き込みはソケットを閉じてもゲームに届く
+                current().conn.socket.close()
+            except Exception:
+                pass
+
+
+def shutdown():
+    """新しいリクエストの受け付けを止めた後に呼び、ためている書き込みを送ってから接続を閉じる"""
+    global event_poller, journal
+    stopping.set()
+    for world in list(worlds.values()):
+        stop_world(world.state, world.connection, world.mc_lock, lambda: world.mc)
+        world.mc = None
+    worlds.clear()
+    # ジャーナルは書き込みバッファの後に止める (実行したコマンドはすでに記録済み)
+    stop_world(commands, connection, mc_lock, lambda: mc)
+    set_minecraft(None)
+    event_poller = None
+    if journal is not None:
+        try:
+            journal.stop()
+        except OSError:
+            logger.exception("Could not write the journal before shutdown")
+        journal = None
+
+
+if __name__ == '__main__':
+    configure_logging()
+    configure()
 
     # Flaskサーバーを起動
     # host='0.0.0.0' でコンテナ外部からのアクセスを許可
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # リローダーはプロセスを2つにして Minecraft にも2回接続するので使わない (デバッグは FLASK_DEBUG=1)
+    app.run(host='0.0.0.0', port=5000, use_reloader=False)
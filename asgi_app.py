@@ -0,0 +1,323 @@
+# asyncio で動作するブリッジ (オプション)
+#
+# Flask 版 (app.py) はリクエストごとにスレッドが mcpi の応答を待ってブロックしますが、
+# こちらは ASGI アプリケーションとして1つのイベントループで動作し、
+# AsyncMinecraft で多数の要求を1本のソケットにパイプライン化したまま応答を待ちます。
+#
+# 起動例 (uvicorn が必要です):
+#     uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+#
+# /command と /batch の JSON の形式とエラーメッセージは Flask 版と同じです。
+# 引数の検証には commands.py の登録表をそのまま使います。
+
+import asyncio
+import json
+import logging
+import os
+
+from aio_mcpi import AsyncMinecraft
+from commands import COMMANDS, CommandError, encode_values, region_coords, region_size, sample_range
+from structured_log import setup_logging
+
+logger = logging.getLogger(__name__)
+
+MINECRAFT_HOST = os.environ.get("MINECRAFT_HOST", "localhost")
+MINECRAFT_PORT = int(os.environ.get("MINECRAFT_PORT", 4711))
+# 1回の /batch リクエストで受け付けるコマンド数の上限 (Flask 版と同じ)
+MAX_BATCH_SIZE = 10000
+# mcpi の BlockEvent.HIT と ChatEvent.POST の type
+BLOCK_HIT_TYPE = 0
+CHAT_POST_TYPE = 0
+
+
+# --- コマンドの非同期ハンドラ (レスポンスは commands.py のハンドラと同じ) ---
+
+async def post_to_chat(amc, message):
+    amc.postToChat(message)
+    return {"status": "success", "message": f"Posted '{message}' to chat"}
+
+
+async def set_block(amc, x, y, z, block_id):
+    amc.setBlock(x, y, z, block_id)
+    return {"status": "success", "message": f"Set block at ({x},{y},{z}) to {block_id}"}
+
+
+async def get_block(amc, x, y, z):
+    return {"status": "success", "block_id": await amc.getBlock(x, y, z)}
+
+
+async def set_blocks(amc, x1, y1, z1, x2, y2, z2, block_id, block_data=None):
+    if block_data is not None:
+        amc.setBlocks(x1, y1, z1, x2, y2, z2, block_id, block_data)
+    else:
+        amc.setBlocks(x1, y1, z1, x2, y2, z2, block_id)
+    return {"status": "success", "message": f"Set blocks in range ({x1}..{x2}, {y1}..{y2}, {z1}..{z2}) to {block_id}" + (f":{block_data}" if block_data is not None else "")}
+
+
+async def get_blocks(amc, x1, y1, z1, x2, y2, z2, encoding='list'):
+    dx, dy, dz = region_size(x1, y1, z1, x2, y2, z2)
+    # getBlock をすべて送ってから応答をまとめて待つ
+    blocks = await asyncio.gather(*(amc.getBlock(*coord) for coord in region_coords(x1, y1, z1, x2, y2, z2)))
+    return {"status": "success", "size": {"x": dx, "y": dy, "z": dz}, "encoding": encoding,
+            "blocks": encode_values(blocks, encoding)}
+
+
+async def get_height(amc, x, z):
+    return {"status": "success", "height": await amc.getHeight(x, z)}
+
+
+async def get_heights(amc, x1, z1, x2, z2, stride=1, encoding='list'):
+    xs = sample_range(x1, x2, stride)
+    zs = sample_range(z1, z2, stride)
+    heights = await asyncio.gather(*(amc.getHeight(x, z) for z in zs for x in xs))
+    return {"status": "success", "size": {"x": len(xs), "z": len(zs)}, "stride": stride, "encoding": encoding,
+            "heights": encode_values(heights, encoding)}
+
+
+async def get_player_pos(amc):
+    x, y, z = await amc.getPlayerPos()
+    return {"status": "success", "x": x, "y": y, "z": z}
+
+
+async def set_player_pos(amc, x, y, z):
+    amc.setPlayerPos(x, y, z)
+    return {"status": "success", "message": f"Set player position to ({x},{y},{z})"}
+
+
+async def get_player_tile_pos(amc):
+    x, y, z = await amc.getPlayerTilePos()
+    return {"status": "success", "x": x, "y": y, "z": z}
+
+
+async def get_player_direction(amc):
+    x, y, z = await amc.getPlayerDirection()
+    return {"status": "success", "x": x, "y": y, "z": z}
+
+
+async def get_player_rotation(amc):
+    return {"status": "success", "rotation": await amc.getPlayerRotation()}
+
+
+async def get_player_pitch(amc):
+    return {"status": "success", "pitch": await amc.getPlayerPitch()}
+
+
+async def get_player_state(amc):
+    pos, tile, direction, rotation, pitch = await asyncio.gather(
+        amc.getPlayerPos(), amc.getPlayerTilePos(), amc.getPlayerDirection(),
+        amc.getPlayerRotation(), amc.getPlayerPitch())
+    return {"status": "success",
+            "pos": dict(zip("xyz", pos)), "tilePos": dict(zip("xyz", tile)), "direction": dict(zip("xyz", direction)),
+            "rotation": rotation, "pitch": pitch}
+
+
+async def world_setting(amc, setting_name, status):
+    amc.setting(setting_name, status)
+    return {"status": "success", "message": f"Set world setting '{setting_name}' to {status}"}
+
+
+async def poll_block_hits(amc):
+    hits = await amc.pollBlockHits()
+    hits_data = [{"type": BLOCK_HIT_TYPE, "pos": {"x": x, "y": y, "z": z}, "face": face, "entityId": entity_id} for x, y, z, face, entity_id in hits]
+    return {"status": "success", "hits": hits_data}
+
+
+async def poll_chat_posts(amc):
+    posts = await amc.pollChatPosts()
+    posts_data = [{"type": CHAT_POST_TYPE, "entityId": entity_id, "message": message} for entity_id, message in posts]
+    return {"status": "success", "posts": posts_data}
+
+
+async def clear_events(amc):
+    amc.clearEvents()
+    return {"status": "success", "message": "Cleared all events"}
+
+
+# コマンド名 -> 非同期ハンドラ
+ASYNC_HANDLERS = {
+    'postToChat': post_to_chat,
+    'setBlock': set_block,
+    'getBlock': get_block,
+    'setBlocks': set_blocks,
+    'getBlocks': get_blocks,
+    'getHeight': get_height,
+    'getHeights': get_heights,
+    'getPlayerPos': get_player_pos,
+    'setPlayerPos': set_player_pos,
+    'getPlayerTilePos': get_player_tile_pos,
+    'getPlayerDirection': get_player_direction,
+    'getPlayerRotation': get_player_rotation,
+    'getPlayerPitch': get_player_pitch,
+    'getPlayerState': get_player_state,
+    'worldSetting': world_setting,
+    'pollBlockHits': poll_block_hits,
+    'pollChatPosts': poll_chat_posts,
+    'clearEvents': clear_events,
+}
+
+
+def prepare_async_command(name, args):
+    """コマンドを検証し、AsyncMinecraft を受け取るコルーチン関数を返す"""
+    handler = ASYNC_HANDLERS.get(name) if isinstance(name, str) else None
+    if handler is None:
+        if name in COMMANDS:
+            raise CommandError(f"Command not supported in async mode: {name}", 501)
+        raise CommandError(f"Unknown command: {name}")
+    values = COMMANDS[name].parse(args)
+    return lambda amc: handler(amc, *values)
+
+
+class AsyncBridge:
+    """AsyncMinecraft への接続を保持し、切断されていれば次の要求時に再接続する"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.amc = None
+        self._lock = None
+
+    async def get(self):
+        if self.amc is not None and not self.amc.closed:
+            return self.amc
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self.amc is None or self.amc.closed:
+                try:
+                    self.amc = await AsyncMinecraft.create(self.host, self.port)
+                except OSError as e:
+                    logger.warning("Could not connect to Minecraft at %s:%s - %s", self.host, self.port, e)
+                    self.amc = None
+        return self.amc
+
+    async def close(self):
+        if self.amc is not None:
+            await self.amc.close()
+            self.amc = None
+
+
+bridge = AsyncBridge(MINECRAFT_HOST, MINECRAFT_PORT)
+
+
+async def run_async_command(amc, command, args, action):
+    """検証済みのコマンドを実行し、(レスポンス dict, HTTPステータス) を返す"""
+    try:
+        return await action(amc), 200
+    except Exception as e:
+        logger.error("Error executing Minecraft command: %s", e, extra={"command": command, "arguments": args})
+        return {"status": "error", "message": f"Minecraft command failed: {e}"}, 500
+
+
+async def execute_async_command(command, args):
+    amc = await bridge.get()
+    if amc is None:
+        return {"status": "error", "message": "Minecraft not connected"}, 503 # Service Unavailable
+    try:
+        action = prepare_async_command(command, args)
+    except CommandError as e:
+        return {"status": "error", "message": e.message}, e.status
+    return await run_async_command(amc, command, args, action)
+
+
+async def execute_async_batch(items):
+    if not isinstance(items, list):
+        return {"status": "error", "message": "Invalid JSON (expected a list of commands)"}, 400
+    if len(items) > MAX_BATCH_SIZE:
+        return {"status": "error", "message": f"Too many commands in batch (max {MAX_BATCH_SIZE})"}, 413
+    amc = await bridge.get()
+    if amc is None:
+        return {"status": "error", "message": "Minecraft not connected"}, 503 # Service Unavailable
+
+    actions = []
+    errors = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({"index": index, "message": "Invalid command object"})
+            continue
+        command = item.get('command')
+        args = item.get('args', [])
+        try:
+            actions.append((command, args, prepare_async_command(command, args)))
+        except CommandError as e:
+            errors.append({"index": index, "message": e.message})
+    if errors:
+        return {"status": "error", "message": "Invalid commands in batch", "errors": errors}, 400
+
+    # すべての要求を送信順にソケットへ書き込んでから、応答をまとめて待つ
+    # (コルーチンは最初の await までを作成順に実行するので、書き込み順は送信順と一致する)
+    tasks = [asyncio.ensure_future(run_async_command(amc, command, args, action)) for command, args, action in actions]
+    results = []
+    for result, status in await asyncio.gather(*tasks):
+        result["code"] = status
+        results.append(result)
+    return {"status": "success", "results": results}, 200
+
+
+# --- ASGI アプリケーション ---
+
+async def read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def send_response(send, status, body, content_type=b"application/json"):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_json(send, payload, status):
+    await send_response(send, status, json.dumps(payload).encode())
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            setup_logging(level=os.environ.get("LOG_LEVEL", "INFO"), sample=os.environ.get("LOG_SAMPLE", ""),
+                          fmt=os.environ.get("LOG_FORMAT", "json"))
+            if await bridge.get() is not None:
+                logger.info("Successfully connected to Minecraft Pi Edition (Reborn)")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await bridge.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+    if path == "/" and method == "GET":
+        await send_response(send, 200, b"Minecraft Scratch Bridge is running!", b"text/plain; charset=utf-8")
+        return
+    if path not in ("/command", "/batch"):
+        await send_json(send, {"status": "error", "message": "Not found"}, 404)
+        return
+    if method != "POST":
+        await send_json(send, {"status": "error", "message": "Method not allowed"}, 405)
+        return
+
+    try:
+        data = json.loads(await read_body(receive))
+    except ValueError:
+        data = None
+
+    if path == "/command":
+        if not isinstance(data, dict) or not data:
+            await send_json(send, {"status": "error", "message": "Invalid JSON"}, 400)
+            return
+        payload, status = await execute_async_command(data.get('command'), data.get('args', []))
+    else:
+        items = data.get('commands') if isinstance(data, dict) else data
+        payload, status = await execute_async_batch(items)
+    await send_json(send, payload, status)
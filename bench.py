@@ -0,0 +1,331 @@
+# ブリッジのベンチマーク
+#
+# /command (と /batch) に、指定した並列数、コマンドの組み合わせ、データの大きさでリクエストを送り続け、
+# レイテンシの p50 / p95 / p99 と1秒あたりの処理数を測ります。
+# 結果は JSON で保存でき、--compare で以前の結果と比べて性能の低下を検出できます。
+#
+# --url を指定しない場合は、フェイクの Minecraft サーバー (fake_minecraft.py) を別プロセスで起動し、
+# ブリッジ (app.py) をこのプロセス内のスレッド対応サーバーで起動して測定します。
+#
+# 実行例:
+#     python bench.py --concurrency 1,4,16 --duration 10 --output results.json
+#     python bench.py --mix bulk --size 4,16 --compare results.json --max-regression 10
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
+
+# コマンドの組み合わせの名前 -> "コマンド=重み,..."
+MIXES = {
+    # 1ブロックずつのコマンド (/command の基本的な経路)
+    "single": "setBlock=60,getBlock=30,pollBlockHits=10",
+    # まとめて読み書きする経路 (setBlocks / getBlocks / /batch)
+    "bulk": "setBlocks=40,getBlocks=30,batch=30",
+    "read": "getBlock=50,getHeight=30,getPlayerPos=20",
+}
+# ブロックを読み書きする範囲 (x, z は -AREA..AREA)
+AREA = 64
+
+
+def parse_mix(text):
+    """"setBlock=60,getBlock=40" (または MIXES の名前) を [(コマンド, 重み), ...] に変換する"""
+    text = MIXES.get(text, text)
+    mix = []
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, weight = item.partition("=")
+        mix.append((name.strip(), float(weight) if weight else 1.0))
+    if not mix:
+        raise ValueError("empty command mix")
+    return mix
+
+
+def make_request(kind, rng, size, batch_size):
+    """(パス, ボディ, コマンド数) を作る
+
+    size は setBlocks / getBlocks の範囲の1辺の長さ、batch_size は /batch 1回あたりの setBlock の数です。
+    """
+    x, y, z = rng.randint(-AREA, AREA), rng.randint(0, 32), rng.randint(-AREA, AREA)
+    if kind == "batch":
+        items = [{"command": "setBlock", "args": [x + i % 16, y, z + i // 16 % 16, rng.randint(1, 5)]}
+                 for i in range(batch_size)]
+        return "/batch", {"commands": items}, batch_size
+    if kind == "setBlock":
+        args = [x, y, z, rng.randint(1, 5)]
+    elif kind == "setBlocks":
+        args = [x, y, z, x + size - 1, y + size - 1, z + size - 1, rng.randint(1, 5)]
+    elif kind == "getBlocks":
+        # 1回で読める体積の上限 (65536) を超えないように高さを抑える
+        height = min(size, max(1, 65536 // (size * size)))
+        args = [x, y, z, x + size - 1, y + height - 1, z + size - 1]
+    elif kind == "getBlock":
+        args = [x, y, z]
+    elif kind == "getHeight":
+        args = [x, z]
+    else:
+        args = []
+    return "/command", {"command": kind, "args": args}, 1
+
+
+def percentile(sorted_values, q):
+    """昇順に並んだ値の q パーセンタイル (最近接順位法)"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * q // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, elapsed, items=None, errors=0):
+    """レイテンシ (秒) のリストを集計する (時間はミリ秒で返す)"""
+    values = sorted(latencies)
+    count = len(values)
+    summary = {
+        "requests": count,
+        "errors": errors,
+        "opsPerSec": round(count / elapsed, 2) if elapsed > 0 else 0.0,
+    }
+    if items is not None:
+        summary["itemsPerSec"] = round(items / elapsed, 2) if elapsed > 0 else 0.0
+    for name, q in (("p50", 50), ("p95", 95), ("p99", 99)):
+        value = percentile(values, q)
+        summary[name] = round(value * 1000, 3) if value is not None else None
+    summary["mean"] = round(sum(values) / count * 1000, 3) if count else None
+    return summary
+
+
+class _Recorder:
+    """ワーカーのスレッドが記録するコマンドごとのレイテンシ"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.items = {}
+        self.errors = {}
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, seconds, items, status):
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status != 200:
+                self.errors[kind] = self.errors.get(kind, 0) + 1
+            self.latencies.setdefault(kind, []).append(seconds)
+            self.items[kind] = self.items.get(kind, 0) + items
+
+
+def _worker(url, mix, size, batch_size, seed, deadline, recorder, client, accept, terse):
+    parts = urlsplit(url)
+    rng = random.Random(seed)
+    kinds = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    headers = {"Content-Type": "application/json", "Accept": accept, "X-Client-Id": client}
+    query = "?terse=1" if terse else ""
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    try:
+        while time.perf_counter() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            path, body, items = make_request(kind, rng, size, batch_size)
+            payload = json.dumps(body)
+            started = time.perf_counter()
+            try:
+                conn.request("POST", path + query, payload, headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                # 接続が閉じられた場合はつなぎ直す
+                conn.close()
+                status = 0
+            recorder.record(kind, time.perf_counter() - started, items, status)
+    finally:
+        conn.close()
+
+
+def run_benchmark(url, mix, concurrency, duration, size=8, batch_size=100, seed=0,
+                  accept="application/json", terse=False):
+    """concurrency 本のクライアントで duration 秒間リクエストを送り、結果を集計する
+
+    accept はレスポンスの形式 (Accept ヘッダー)、terse は terse モードで受け取るかです。
+    """
+    recorder = _Recorder()
+    deadline = time.perf_counter() + duration
+    started = time.perf_counter()
+    threads = [threading.Thread(target=_worker, args=(url, mix, size, batch_size, seed + i, deadline,
+                                                      recorder, f"bench-{i}", accept, terse), daemon=True)
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    result = {
+        "concurrency": concurrency,
+        "size": size,
+        "batchSize": batch_size,
+        "duration": round(elapsed, 3),
+        "statuses": {str(status): count for status, count in sorted(recorder.statuses.items())},
+    }
+    result.update(summarize(all_latencies, elapsed, sum(recorder.items.values()), sum(recorder.errors.values())))
+    result["commands"] = {kind: summarize(values, elapsed, recorder.items[kind], recorder.errors.get(kind, 0))
+                          for kind, values in sorted(recorder.latencies.items())}
+    return result
+
+
+def run_key(run):
+    return (run["mix"], run["concurrency"], run["size"], run["batchSize"])
+
+
+def compare(baseline, current, max_regression=None):
+    """2つの結果の同じ条件の測定を比べて表を返す (max_regression % を超えて遅くなった測定も返す)"""
+    previous = {run_key(run): run for run in baseline.get("runs", [])}
+    lines = [f"{'mix':<8} {'conc':>4} {'size':>4} {'ops/s':>10} {'change':>8} {'p95 ms':>9} {'change':>8}"]
+    regressions = []
+    for run in current["runs"]:
+        base = previous.get(run_key(run))
+        if base is None:
+            continue
+        ops_change = (run["opsPerSec"] / base["opsPerSec"] - 1) * 100 if base["opsPerSec"] else 0.0
+        p95_change = (run["p95"] / base["p95"] - 1) * 100 if base.get("p95") and run.get("p95") else 0.0
+        lines.append(f"{run['mix']:<8} {run['concurrency']:>4} {run['size']:>4} {run['opsPerSec']:>10.1f} "
+                     f"{ops_change:>+7.1f}% {run['p95'] or 0:>9.2f} {p95_change:>+7.1f}%")
+        if max_regression is not None and ops_change < -max_regression:
+            regressions.append(run_key(run))
+    return "\n".join(lines), regressions
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def start_local_bridge(latency_ms, jitter_ms, seed):
+    """フェイクのサーバーを別プロセスで、ブリッジをこのプロセス内で起動し、(URL, 後片付け) を返す"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        # アクセスログの出力は測定の邪魔になるので出さない
+        def log_request(self, *args, **kwargs):
+            pass
+
+    game_port = _free_port()
+    fake = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_minecraft.py"),
+                             "--port", str(game_port), "--latency-ms", str(latency_ms),
+                             "--jitter-ms", str(jitter_ms), "--seed", str(seed)])
+    _wait_for_port(game_port)
+
+    import app
+    app.MINECRAFT_HOST, app.MINECRAFT_PORT = "127.0.0.1", game_port
+    app.configure()
+    # 接続はバックグラウンドで行われるので、測定を始める前につながるのを待つ
+    app.connection.wait_connected(10)
+    server = make_server("127.0.0.1", 0, app.app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def shutdown():
+        server.shutdown()
+        app.shutdown()
+        fake.terminate()
+        fake.wait()
+
+    return f"http://127.0.0.1:{server.server_port}", shutdown
+
+
+def _int_list(text):
+    return [int(value) for value in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Minecraft Scratch bridge")
+    parser.add_argument("--url", help="bridge to benchmark (default: start a local bridge and fake server)")
+    parser.add_argument("--mix", action="append",
+                        help=f"command mix, e.g. setBlock=70,getBlock=30 or one of {', '.join(MIXES)} (repeatable)")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16], help="clients, e.g. 1,4,16")
+    parser.add_argument("--size", type=_int_list, default=[8], help="edge length for setBlocks/getBlocks, e.g. 4,16")
+    parser.add_argument("--batch-size", type=int, default=100, help="setBlock commands per /batch request")
+    parser.add_argument("--accept", default="application/json",
+                        help="response format, e.g. application/msgpack or application/cbor")
+    parser.add_argument("--terse", action="store_true", help="ask for terse responses")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="fake server reply delay (local mode)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="fake server reply jitter (local mode)")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="bridge setting for local mode, e.g. WRITE_BUFFER_DELAY_MS=5 (repeatable)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="previous results (JSON) to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="exit with status 1 if ops/sec drops by more than this percentage")
+    options = parser.parse_args(argv)
+
+    mixes = options.mix or ["single", "bulk"]
+    shutdown = None
+    url = options.url
+    if url is None:
+        for item in options.env:
+            name, _, value = item.partition("=")
+            os.environ[name] = value
+        url, shutdown = start_local_bridge(options.latency_ms, options.jitter_ms, options.seed)
+
+    results = {
+        "url": options.url or "local",
+        "startedAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "latencyMs": options.latency_ms if options.url is None else None,
+        "env": options.env,
+        "accept": options.accept,
+        "terse": options.terse,
+        "runs": [],
+    }
+    try:
+        for mix_name in mixes:
+            mix = parse_mix(mix_name)
+            for size in options.size:
+                for concurrency in options.concurrency:
+                    run = {"mix": mix_name}
+                    run.update(run_benchmark(url, mix, concurrency, options.duration, size,
+                                             options.batch_size, options.seed, options.accept, options.terse))
+                    results["runs"].append(run)
+                    print(f"{mix_name:<8} conc={concurrency:<3} size={size:<3} {run['opsPerSec']:>9.1f} ops/s  "
+                          f"p50={run['p50']}ms p95={run['p95']}ms p99={run['p99']}ms errors={run['errors']}")
+    finally:
+        if shutdown is not None:
+            shutdown()
+
+    if options.output:
+        with open(options.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if options.compare:
+        with open(options.compare) as f:
+            table, regressions = compare(json.load(f), results, options.max_regression)
+        print(table)
+        if regressions:
+            print(f"Regression of more than {options.max_regression}% in {len(regressions)} run(s)")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
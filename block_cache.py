@@ -0,0 +1,193 @@
+# getBlock / getHeight の結果をメモリ上に保持する読み出しキャッシュ (オプション)
+#
+# ブリッジ自身の setBlock / setBlocks でキャッシュを更新し、ブロックヒットイベントで無効化します。
+# ブリッジを通らない変更 (プレイヤーの操作など) に備えて、各エントリには有効期限 (TTL) があります。
+#
+# ブロックは 16x16x16 のチャンク単位で保持し、チャンク数が上限を超えたら
+# 最も長く使われていないチャンクから捨てます (LRU)。
+
+import threading
+import time
+from collections import OrderedDict
+
+AIR = 0
+# チャンクの大きさ (1辺 2**CHUNK_SHIFT ブロック)
+CHUNK_SHIFT = 4
+# setBlocks でこの体積以下の範囲はキャッシュに書き込み、それより大きい範囲は無効化だけ行う
+MAX_FILL_VOLUME = 4096
+
+
+def normalize_region(x1, y1, z1, x2, y2, z2):
+    return min(x1, x2), min(y1, y2), min(z1, z2), max(x1, x2), max(y1, y2), max(z1, z2)
+
+
+class BlockCache:
+    """チャンク単位で LRU 管理するブロックIDのキャッシュ"""
+
+    def __init__(self, ttl=2.0, max_chunks=256, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_chunks = max_chunks
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._chunks = OrderedDict() # (cx, cy, cz) -> {(x, y, z): (block_id, 時刻)}
+        self._lock = threading.Lock()
+
+    def get(self, x, y, z):
+        """キャッシュにある有効なブロックIDを返す (なければ None)"""
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        with self._lock:
+            chunk = self._chunks.get(key)
+            entry = chunk.get((x, y, z)) if chunk is not None else None
+            if entry is None or self.clock() - entry[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._chunks.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, x, y, z, block_id):
+        with self._lock:
+            self._put(x, y, z, block_id, self.clock())
+
+    def put_region(self, x1, y1, z1, x2, y2, z2, block_id):
+        """範囲をすべて block_id にする (大きな範囲は無効化のみ)"""
+        x1, y1, z1, x2, y2, z2 = normalize_region(x1, y1, z1, x2, y2, z2)
+        if (x2 - x1 + 1) * (y2 - y1 + 1) * (z2 - z1 + 1) > MAX_FILL_VOLUME:
+            self.invalidate_region(x1, y1, z1, x2, y2, z2)
+            return
+        with self._lock:
+            now = self.clock()
+            for y in range(y1, y2 + 1):
+                for z in range(z1, z2 + 1):
+                    for x in range(x1, x2 + 1):
+                        self._put(x, y, z, block_id, now)
+
+    def invalidate(self, x, y, z):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        with self._lock:
+            chunk = self._chunks.get(key)
+            if chunk is not None:
+                chunk.pop((x, y, z), None)
+
+    def invalidate_region(self, x1, y1, z1, x2, y2, z2):
+        x1, y1, z1, x2, y2, z2 = normalize_region(x1, y1, z1, x2, y2, z2)
+        with self._lock:
+            for key in list(self._chunks):
+                cx, cy, cz = key
+                # チャンクの範囲が無効化する範囲と重ならなければ何もしない
+                if ((cx + 1) << CHUNK_SHIFT) <= x1 or (cx << CHUNK_SHIFT) > x2 \
+                        or ((cy + 1) << CHUNK_SHIFT) <= y1 or (cy << CHUNK_SHIFT) > y2 \
+                        or ((cz + 1) << CHUNK_SHIFT) <= z1 or (cz << CHUNK_SHIFT) > z2:
+                    continue
+                chunk = self._chunks[key]
+                for x, y, z in list(chunk):
+                    if x1 <= x <= x2 and y1 <= y <= y2 and z1 <= z <= z2:
+                        del chunk[(x, y, z)]
+                if not chunk:
+                    del self._chunks[key]
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+
+    def _put(self, x, y, z, block_id, now):
+        key = (x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT)
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._chunks[key] = {}
+            if len(self._chunks) > self.max_chunks:
+                self._chunks.popitem(last=False)
+        else:
+            self._chunks.move_to_end(key)
+        chunk[(x, y, z)] = (block_id, now)
+
+
+class HeightCache:
+    """getHeight の結果を列 (x, z) ごとに LRU 管理するキャッシュ"""
+
+    def __init__(self, ttl=2.0, max_columns=4096, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_columns = max_columns
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._columns = OrderedDict() # (x, z) -> (height, 時刻)
+        self._lock = threading.Lock()
+
+    def get(self, x, z):
+        with self._lock:
+            entry = self._columns.get((x, z))
+            if entry is None or self.clock() - entry[1] > self.ttl:
+                self.misses += 1
+                return None
+            self._columns.move_to_end((x, z))
+            self.hits += 1
+            return entry[0]
+
+    def put(self, x, z, height):
+        with self._lock:
+            self._columns[(x, z)] = (height, self.clock())
+            self._columns.move_to_end((x, z))
+            if len(self._columns) > self.max_columns:
+                self._columns.popitem(last=False)
+
+    def on_set_block(self, x, y, z, block_id):
+        """1ブロックの書き込みに合わせて列の高さを更新する"""
+        with self._lock:
+            entry = self._columns.get((x, z))
+            if entry is None:
+                return
+            height, stamp = entry
+            if block_id != AIR and y > height:
+                self._columns[(x, z)] = (y, stamp)
+            elif block_id == AIR and y == height:
+                # 一番上のブロックを消した場合、新しい高さはゲームに聞くまでわからない
+                del self._columns[(x, z)]
+
+    def invalidate_columns(self, x1, z1, x2, z2):
+        x1, x2 = min(x1, x2), max(x1, x2)
+        z1, z2 = min(z1, z2), max(z1, z2)
+        with self._lock:
+            if (x2 - x1 + 1) * (z2 - z1 + 1) > len(self._columns):
+                for x, z in list(self._columns):
+                    if x1 <= x <= x2 and z1 <= z <= z2:
+                        del self._columns[(x, z)]
+            else:
+                for x in range(x1, x2 + 1):
+                    for z in range(z1, z2 + 1):
+                        self._columns.pop((x, z), None)
+
+    def clear(self):
+        with self._lock:
+            self._columns.clear()
+
+
+class WorldCache:
+    """ブロックと高さのキャッシュをまとめ、書き込みとイベントに合わせて更新する"""
+
+    def __init__(self, ttl=2.0, max_chunks=256, max_columns=4096, clock=time.monotonic):
+        self.blocks = BlockCache(ttl, max_chunks, clock)
+        self.heights = HeightCache(ttl, max_columns, clock)
+
+    def on_set_block(self, x, y, z, block_id):
+        self.blocks.put(x, y, z, block_id)
+        self.heights.on_set_block(x, y, z, block_id)
+
+    def on_set_blocks(self, x1, y1, z1, x2, y2, z2, block_id):
+        self.blocks.put_region(x1, y1, z1, x2, y2, z2, block_id)
+        self.heights.invalidate_columns(x1, z1, x2, z2)
+
+    def on_block_hits(self, hits):
+        """ブロックヒットイベント (block_hit_to_dict の形式) の座標を無効化する"""
+        self.on_block_positions((hit["pos"]["x"], hit["pos"]["y"], hit["pos"]["z"]) for hit in hits)
+
+    def on_block_positions(self, positions):
+        """(x, y, z) の座標のブロックと、その列の高さを無効化する"""
+        for x, y, z in positions:
+            self.blocks.invalidate(x, y, z)
+            self.heights.invalidate_columns(x, z, x, z)
+
+    def clear(self):
+        self.blocks.clear()
+        self.heights.clear()
@@ -0,0 +1,828 @@
+# Scratchから受け付けるコマンドの登録表
+#
+# 各コマンドは引数のスキーマとハンドラを1度だけ宣言します。
+# /command や /batch などの入口はコマンド名で COMMANDS を引くだけで、
+# 引数の数と型の検証、変換をここにまとめて任せることができます。
+
+import base64
+import logging
+import sys
+from array import array
+from contextvars import ContextVar
+
+from events import (BLOCK_HIT, CHAT_POST, MAX_PAGE, block_hit_to_dict, block_hit_to_row, block_hit_values,
+                    chat_post_to_dict, chat_post_to_row, chat_post_values)
+from pipeline import query_many
+from snapshots import is_valid_name
+from write_buffer import merge_boxes
+
+# 図形のコマンドは NumPy が必要 (ない場合は図形のコマンドだけ 501 を返す)
+# NumPy の読み込みは起動を遅くする (Raspberry Pi では1秒ほど) ので、最初に図形を使うときに load_shapes() で読み込む
+_NOT_LOADED = object()
+shapes = _NOT_LOADED
+
+
+def load_shapes():
+    """shapes のモジュールを (まだなら読み込んで) 返す (NumPy がない場合は None)"""
+    global shapes
+    if shapes is _NOT_LOADED:
+        try:
+            import shapes as module
+        except ImportError:
+            module = None
+        shapes = module
+    return shapes
+
+logger = logging.getLogger(__name__)
+
+# バックグラウンドのイベントポーラー (有効な場合は app が設定する)
+# 設定されている場合、pollBlockHits などはゲームではなくポーラーから読み出します。
+event_poller = None
+# ポーラーがない場合に、pollBlockHits / pollChatPosts がゲームから取り出したイベントを移す
+# 上限付きのバッファ (events.EventQueue、有効な場合は app が設定する)
+# 1回に返しきれなかったイベントは、次の呼び出しで返します。
+event_backlog = None
+# setBlock をまとめて送る書き込みバッファ (有効な場合は app が設定する)
+write_buffer = None
+
+# getBlock / getHeight の読み出しキャッシュ (有効な場合は app が設定する)
+world_cache = None
+
+# getPlayerState の結果を短時間共有するキャッシュ (有効な場合は app が設定する)
+player_state_cache = None
+
+# snapshotRegion / restoreRegion のスナップショットを保存するストア (有効な場合は app が設定する)
+snapshot_store = None
+
+# ネイティブの world.getBlocks を使うか (app が NATIVE_GET_BLOCKS に従って設定する、失敗した場合は以降 getBlock のパイプラインで読む)
+# 対応していないサーバーは応答を返さないことがあり、Minecraft のロックを持ったまま止まってしまうので、デフォルトでは使わない
+native_get_blocks = False
+
+# リクエストごとのレスポンスの形式 (app がリクエストを処理する間だけ設定する)
+# terse_response: イベントを配列 (block_hit_to_row など) で返す (人が読むための message は app が省く)
+terse_response = ContextVar("terse_response", default=False)
+# binary_response: MessagePack / CBOR で返すので、uint8 / uint16 の配列を base64 にせずバイト列のまま返す
+binary_response = ContextVar("binary_response", default=False)
+
+# 既定以外のワールド (app の WORLDS) のコマンドを実行する間、app がそのワールドの WorldState を設定する
+# 設定されていない場合は、このモジュールの event_poller / write_buffer などを使う (既定のワールド)
+world_state = ContextVar("world_state", default=None)
+
+
+class WorldState:
+    """1つのワールドのキャッシュ、バッファ、ポーラーなど (このモジュールのフックと同じ名前の属性を持つ)"""
+
+    __slots__ = ('event_poller', 'event_backlog', 'write_buffer', 'world_cache', 'player_state_cache',
+                 'snapshot_store', 'native_get_blocks')
+
+    def __init__(self):
+        self.event_poller = None
+        self.event_backlog = None
+        self.write_buffer = None
+        self.world_cache = None
+        self.player_state_cache = None
+        self.snapshot_store = None
+        self.native_get_blocks = False
+
+
+def current_world():
+    """コマンドを実行しているワールドのフック (既定のワールドではこのモジュール自身)"""
+    return world_state.get() or sys.modules[__name__]
+
+
+# 書き込みバッファを直接扱うコマンド (それ以外のコマンドの前にはバッファを送信して順序を保つ)
+_BUFFER_AWARE_COMMANDS = frozenset(('setBlock', 'getBlock', 'flush'))
+
+
+class CommandError(Exception):
+    """コマンドの検証エラー (HTTPステータスとメッセージを保持)"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def to_bool(value):
+    """true/false または 1/0 を bool に変換する"""
+    text = str(value).lower()
+    if text in ('true', '1'):
+        return True
+    if text in ('false', '0'):
+        return False
+    raise ValueError(f"not a boolean: {value!r}")
+
+
+# 一括読み出しの結果の形式 (list は整数のリスト、それ以外は base64 にパックしたバイト列)
+ENCODINGS = ('list', 'uint8', 'uint16')
+# 1回の getBlocks で読み出せるブロック数の上限
+MAX_REGION_VOLUME = 65536
+
+
+def to_encoding(value):
+    """一括読み出しの結果の形式名を検証する"""
+    if value not in ENCODINGS:
+        raise ValueError(f"unknown encoding: {value!r}")
+    return value
+
+
+def to_page_limit(value):
+    """pollBlockHits / pollChatPosts の1回に返す最大件数 (1〜MAX_PAGE) を検証する"""
+    limit = int(value)
+    if not 1 <= limit <= MAX_PAGE:
+        raise ValueError(f"limit must be 1 to {MAX_PAGE}: {value!r}")
+    return limit
+
+
+def encode_values(values, encoding, raw=False):
+    """整数のリストを指定の形式に変換する (uint8 / uint16 はリトルエンディアンの base64、raw なら bytes)"""
+    if encoding == 'list':
+        return list(values)
+    try:
+        packed = array('B' if encoding == 'uint8' else 'H', values)
+    except OverflowError:
+        raise ValueError(f"values do not fit in {encoding}")
+    if packed.itemsize > 1 and sys.byteorder == 'big':
+        packed.byteswap()
+    if raw:
+        return packed.tobytes()
+    return base64.b64encode(packed.tobytes()).decode('ascii')
+
+
+def decode_values(data, encoding):
+    """encode_values の逆変換 (uint8 / uint16 は base64 の文字列または bytes)"""
+    if encoding == 'list':
+        if not isinstance(data, list):
+            raise ValueError("expected a list")
+        return [int(value) for value in data]
+    packed = array('B' if encoding == 'uint8' else 'H')
+    packed.frombytes(data if isinstance(data, bytes) else base64.b64decode(data, validate=True))
+    if packed.itemsize > 1 and sys.byteorder == 'big':
+        packed.byteswap()
+    return packed.tolist()
+
+
+def region_size(x1, y1, z1, x2, y2, z2):
+    """直方体の各辺の長さ (dx, dy, dz) を返す"""
+    return abs(x2 - x1) + 1, abs(y2 - y1) + 1, abs(z2 - z1) + 1
+
+
+def region_coords(x1, y1, z1, x2, y2, z2):
+    """直方体内の座標を y, z, x の順 (x が最も速く変わる) に並べたリストを返す"""
+    x1, x2 = min(x1, x2), max(x1, x2)
+    y1, y2 = min(y1, y2), max(y1, y2)
+    z1, z2 = min(z1, z2), max(z1, z2)
+    return [(x, y, z) for y in range(y1, y2 + 1) for z in range(z1, z2 + 1) for x in range(x1, x2 + 1)]
+
+
+# コマンドの重さの単位 (この数のブロックごとにコスト1を加える)
+BLOCKS_PER_COST = 1024
+
+
+def volume_cost(volume):
+    """扱うブロック数からコマンドの重さを求める"""
+    return 1 + volume // BLOCKS_PER_COST
+
+
+def region_cost(x1, y1, z1, x2, y2, z2, *rest):
+    dx, dy, dz = region_size(x1, y1, z1, x2, y2, z2)
+    return volume_cost(dx * dy * dz)
+
+
+def check_region(x1, y1, z1, x2, y2, z2, encoding='list'):
+    dx, dy, dz = region_size(x1, y1, z1, x2, y2, z2)
+    if dx * dy * dz > MAX_REGION_VOLUME:
+        raise CommandError(f"Region too large (max {MAX_REGION_VOLUME} blocks)", 413)
+
+
+def sample_range(a, b, stride):
+    """a と b の間 (両端を含む) を小さい方から stride おきに並べた range を返す"""
+    return range(min(a, b), max(a, b) + 1, stride)
+
+
+def check_heightmap(x1, z1, x2, z2, stride=1, encoding='list'):
+    if stride < 1:
+        raise CommandError("Invalid stride for getHeights (must be at least 1)")
+    if len(sample_range(x1, x2, stride)) * len(sample_range(z1, z2, stride)) > MAX_REGION_VOLUME:
+        raise CommandError(f"Region too large (max {MAX_REGION_VOLUME} columns)", 413)
+
+
+# 図形のコマンドで1度に置けるブロック数 (図形を囲む直方体の体積) の上限
+MAX_SHAPE_VOLUME = 1 << 21
+# fillPolygon の頂点の数の上限
+MAX_POLYGON_POINTS = 1024
+
+
+def to_points(value):
+    """[[x, z], ...] を整数の組のリストに変換する (3点以上)"""
+    if not isinstance(value, list) or not 3 <= len(value) <= MAX_POLYGON_POINTS:
+        raise ValueError("expected a list of at least 3 points")
+    points = []
+    for point in value:
+        if not isinstance(point, (list, tuple)) or len(point) != 2:
+            raise ValueError(f"not a point: {point!r}")
+        points.append((int(point[0]), int(point[1])))
+    return points
+
+
+def to_template(value):
+    """getBlocks のレスポンスと同じ形式のテンプレートを ((dx, dy, dz), ブロックIDのリスト) に変換する"""
+    if not isinstance(value, dict) or not isinstance(value.get('size'), dict):
+        raise ValueError("expected a template object")
+    size = tuple(int(value['size'][axis]) for axis in 'xyz')
+    if min(size) < 1 or size[0] * size[1] * size[2] > MAX_REGION_VOLUME:
+        raise ValueError(f"invalid template size: {size!r}")
+    blocks = decode_values(value.get('blocks'), to_encoding(value.get('encoding', 'list')))
+    if len(blocks) != size[0] * size[1] * size[2]:
+        raise ValueError("template size does not match its blocks")
+    return size, blocks
+
+
+def shape_check(name, volume):
+    """図形のコマンドの check を作る (volume は引数から図形を囲む直方体の体積を求める関数)"""
+    def check(*values):
+        if load_shapes() is None:
+            raise CommandError(f"{name} requires NumPy", 501)
+        if volume(*values) > MAX_SHAPE_VOLUME:
+            raise CommandError(f"Shape too large (max {MAX_SHAPE_VOLUME} blocks)", 413)
+    return check
+
+
+def shape_cost(volume):
+    return lambda *values: volume_cost(volume(*values))
+
+
+def _radius(radius):
+    if radius < 0:
+        raise CommandError("Invalid radius (must not be negative)")
+    return 2 * radius + 1
+
+
+def _line_volume(x1, y1, z1, x2, y2, z2, *rest):
+    return max(abs(x2 - x1), abs(y2 - y1), abs(z2 - z1)) + 1
+
+
+def _sphere_volume(x, y, z, radius, *rest):
+    return _radius(radius) ** 3
+
+
+def _cylinder_volume(x, y, z, radius, height, *rest):
+    return _radius(radius) ** 2 * abs(height)
+
+
+def _polygon_area(points, *rest):
+    xs = [x for x, _ in points]
+    zs = [z for _, z in points]
+    return (max(xs) - min(xs) + 1) * (max(zs) - min(zs) + 1)
+
+
+def _template_volume(x, y, z, template, *rest):
+    return len(template[1])
+
+
+# 引数の型ごとのエラーメッセージ用の説明
+_TYPE_LABELS = {int: "integers", float: "numbers"}
+
+
+class Command:
+    """1つのコマンドの引数スキーマとハンドラ
+
+    params は必須引数の変換関数、optional は省略可能な引数の変換関数です。
+    rest_ok が True の場合、スキーマを超える引数は無視されます。
+    check は変換済みの引数を受け取り、不正な場合に CommandError を送出する関数です。
+    cost は変換済みの引数からコマンドの重さ (スケジューラーが消費するトークン数) を求める関数です。
+    writes が True のコマンドはワールドを変更するので、ジャーナル (journal.py) に記録されます。
+    エラーメッセージは登録時に1度だけ組み立てておきます。
+    """
+
+    __slots__ = ('name', 'handler', 'converters', 'min_args', 'max_args',
+                 'arity_message', 'invalid_message', 'check', 'cost', 'writes')
+
+    def __init__(self, name, handler, params=(), optional=(), rest_ok=False,
+                 arity_message=None, invalid_message=None, check=None, cost=None, writes=False):
+        self.name = name
+        self.handler = handler
+        self.check = check
+        self.cost = cost
+        self.writes = writes
+        self.converters = tuple(params) + tuple(optional)
+        self.min_args = len(params)
+        self.max_args = None if rest_ok else len(self.converters)
+
+        if arity_message is None:
+            if not self.converters:
+                arity_message = f"{name} does not take any arguments"
+            elif optional:
+                expected = " or ".join(str(n) for n in range(self.min_args, len(self.converters) + 1))
+                arity_message = f"Incorrect number of arguments for {name} (expected {expected})"
+            else:
+                arity_message = f"Incorrect number of arguments for {name} (expected {self.min_args})"
+        if invalid_message is None:
+            labels = {_TYPE_LABELS.get(converter) for converter in self.converters}
+            label = labels.pop() if len(labels) == 1 else None
+            if label:
+                invalid_message = f"Invalid arguments for {name} (must be {label})"
+            else:
+                invalid_message = f"Invalid arguments for {name}"
+        self.arity_message = arity_message
+        self.invalid_message = invalid_message
+
+    def parse(self, args):
+        """引数の数と型を検証し、変換済みの引数リストを返す"""
+        if not isinstance(args, (list, tuple)):
+            raise CommandError(self.invalid_message)
+        count = len(args)
+        if count < self.min_args or (self.max_args is not None and count > self.max_args):
+            raise CommandError(self.arity_message)
+        try:
+            values = [convert(arg) for convert, arg in zip(self.converters, args)]
+        except (TypeError, ValueError):
+            raise CommandError(self.invalid_message)
+        if self.check is not None:
+            self.check(*values)
+        return values
+
+
+# コマンド名 -> Command
+COMMANDS = {}
+
+
+def command(name, *params, **options):
+    """ハンドラを COMMANDS に登録するデコレータ
+
+    ハンドラは Minecraft インスタンスと変換済みの引数を受け取り、
+    レスポンス用の dict を返します。
+    """
+    def register(handler):
+        COMMANDS[name] = Command(name, handler, params, **options)
+        return handler
+    return register
+
+
+def prepare_command(name, args):
+    """コマンドと引数を検証し、Minecraftに対して実行する関数を返す
+
+    検証に失敗した場合は CommandError を送出します。
+    返された関数は Minecraft インスタンスを受け取り、レスポンス用の dict を返します。
+    関数の cost 属性はコマンドの重さ、writes 属性はワールドを変更するコマンドかどうかです。
+    """
+    spec = COMMANDS.get(name) if isinstance(name, str) else None
+    if spec is None:
+        raise CommandError(f"Unknown command: {name}")
+    values = spec.parse(args)
+    handler = spec.handler
+    if name in _BUFFER_AWARE_COMMANDS:
+        run = lambda mc: handler(mc, *values)
+    else:
+        def run(mc):
+            buffer = current_world().write_buffer
+            if buffer is not None:
+                buffer.flush(mc)
+            return handler(mc, *values)
+    run.cost = spec.cost(*values) if spec.cost is not None else 1
+    run.writes = spec.writes
+    return run
+
+
+# --- コマンドの定義 ---
+
+@command('postToChat', str, rest_ok=True, writes=True,
+         arity_message="Missing message argument for postToChat")
+def post_to_chat(mc, message):
+    mc.postToChat(message)
+    return {"status": "success", "message": f"Posted '{message}' to chat"}
+
+
+@command('setBlock', int, int, int, int, writes=True) # x, y, z, block_id (block_dataはオプションなので省略)
+def set_block(mc, x, y, z, block_id):
+    world = current_world()
+    if world.write_buffer is not None:
+        try:
+            world.write_buffer.set_block(mc, x, y, z, block_id)
+        except Exception:
+            # バッファがいっぱいで送信に失敗した場合、書き込みはバッファに残って後で送られるので、
+            # キャッシュの古い値を返さないように消しておく
+            if world.world_cache is not None:
+                world.world_cache.on_block_positions([(x, y, z)])
+            raise
+    else:
+        mc.setBlock(x, y, z, block_id)
+    # 書き込み (またはバッファへの追加) に失敗した場合は、キャッシュを変えない
+    if world.world_cache is not None:
+        world.world_cache.on_set_block(x, y, z, block_id)
+    return {"status": "success", "message": f"Set block at ({x},{y},{z}) to {block_id}"}
+
+
+@command('getBlock', int, int, int) # x, y, z
+def get_block(mc, x, y, z):
+    world = current_world()
+    # まだ送信していない書き込みがあれば、それを読み出し結果とする
+    block_id = world.write_buffer.get_block(x, y, z) if world.write_buffer is not None else None
+    if block_id is None and world.world_cache is not None:
+        block_id = world.world_cache.blocks.get(x, y, z)
+    if block_id is None:
+        block_id = mc.getBlock(x, y, z)
+        if world.world_cache is not None:
+            world.world_cache.blocks.put(x, y, z, block_id)
+    return {"status": "success", "block_id": block_id}
+
+
+# 引数: x1, y1, z1, x2, y2, z2, block_id, [block_data] (block_dataはオプション)
+@command('setBlocks', int, int, int, int, int, int, int, optional=(int,), cost=region_cost, writes=True)
+def set_blocks(mc, x1, y1, z1, x2, y2, z2, block_id, block_data=None):
+    world = current_world()
+    if block_data is not None:
+        mc.setBlocks(x1, y1, z1, x2, y2, z2, block_id, block_data)
+    else:
+        mc.setBlocks(x1, y1, z1, x2, y2, z2, block_id)
+    if world.world_cache is not None:
+        world.world_cache.on_set_blocks(x1, y1, z1, x2, y2, z2, block_id)
+    return {"status": "success", "message": f"Set blocks in range ({x1}..{x2}, {y1}..{y2}, {z1}..{z2}) to {block_id}" + (f":{block_data}" if block_data is not None else "")}
+
+
+def read_region(mc, x1, y1, z1, x2, y2, z2):
+    """直方体内のブロックIDを region_coords の順に読み出す
+
+    native_get_blocks が有効 (ゲームが world.getBlocks に対応している) なら1回の呼び出しで、
+    そうでなければキャッシュにない座標の getBlock をパイプライン化して読み出します。
+    """
+    world = current_world()
+    coords = region_coords(x1, y1, z1, x2, y2, z2)
+    if world.native_get_blocks:
+        try:
+            native = [int(value) for value in mc.getBlocks(x1, y1, z1, x2, y2, z2)]
+        except (AttributeError, TypeError, ValueError):
+            native = None
+        if native is not None and len(native) == len(coords):
+            # world.getBlocks は y, x, z の順 (z が最も速く変わる) で返す
+            dx, dy, dz = region_size(x1, y1, z1, x2, y2, z2)
+            return [native[(j * dx + i) * dz + k] for j in range(dy) for k in range(dz) for i in range(dx)]
+        world.native_get_blocks = False
+        logger.info("world.getBlocks is not available, reading regions with pipelined getBlock")
+
+    blocks = [world.world_cache.blocks.get(*coord) if world.world_cache is not None else None for coord in coords]
+    missing = [index for index, block_id in enumerate(blocks) if block_id is None]
+    replies = query_many(mc, [("world.getBlock", coords[index]) for index in missing])
+    for index, reply in zip(missing, replies):
+        blocks[index] = int(reply)
+        if world.world_cache is not None:
+            world.world_cache.blocks.put(*coords[index], blocks[index])
+    return blocks
+
+
+# 引数: x1, y1, z1, x2, y2, z2, [encoding] (list / uint8 / uint16、デフォルトは list)
+@command('getBlocks', int, int, int, int, int, int, optional=(to_encoding,), check=check_region, cost=region_cost,
+         invalid_message="Invalid arguments for getBlocks (coordinates must be integers, encoding must be list, uint8 or uint16)")
+def get_blocks(mc, x1, y1, z1, x2, y2, z2, encoding='list'):
+    dx, dy, dz = region_size(x1, y1, z1, x2, y2, z2)
+    blocks = read_region(mc, x1, y1, z1, x2, y2, z2)
+    return {"status": "success", "size": {"x": dx, "y": dy, "z": dz}, "encoding": encoding,
+            "blocks": encode_values(blocks, encoding, binary_response.get())}
+
+
+@command('getHeight', int, int) # x, z
+def get_height(mc, x, z):
+    world = current_world()
+    height = world.world_cache.heights.get(x, z) if world.world_cache is not None else None
+    if height is None:
+        height = mc.getHeight(x, z)
+        if world.world_cache is not None:
+            world.world_cache.heights.put(x, z, height)
+    return {"status": "success", "height": height}
+
+
+# 引数: x1, z1, x2, z2, [stride], [encoding] (stride は何ブロックおきに読むか、デフォルトは 1)
+@command('getHeights', int, int, int, int, optional=(int, to_encoding), check=check_heightmap,
+         cost=lambda x1, z1, x2, z2, stride=1, *rest: volume_cost(len(sample_range(x1, x2, stride)) * len(sample_range(z1, z2, stride))),
+         invalid_message="Invalid arguments for getHeights (coordinates and stride must be integers, encoding must be list, uint8 or uint16)")
+def get_heights(mc, x1, z1, x2, z2, stride=1, encoding='list'):
+    world = current_world()
+    xs = sample_range(x1, x2, stride)
+    zs = sample_range(z1, z2, stride)
+    columns = [(x, z) for z in zs for x in xs]
+    heights = [world.world_cache.heights.get(x, z) if world.world_cache is not None else None for x, z in columns]
+    missing = [index for index, height in enumerate(heights) if height is None]
+    # キャッシュにない列の getHeight をまとめて送る
+    replies = query_many(mc, [("world.getHeight", columns[index]) for index in missing])
+    for index, reply in zip(missing, replies):
+        heights[index] = int(reply)
+        if world.world_cache is not None:
+            world.world_cache.heights.put(*columns[index], heights[index])
+    return {"status": "success", "size": {"x": len(xs), "z": len(zs)}, "stride": stride, "encoding": encoding,
+            "heights": encode_values(heights, encoding, binary_response.get())}
+
+
+@command('getPlayerPos')
+def get_player_pos(mc):
+    pos = mc.player.getPos()
+    # Vec3 オブジェクトは直接 JSON シリアライズできない場合があるので、属性を個別に返す
+    return {"status": "success", "x": pos.x, "y": pos.y, "z": pos.z}
+
+
+@command('setPlayerPos', float, float, float, writes=True) # x, y, z (座標は float もありうる)
+def set_player_pos(mc, x, y, z):
+    world = current_world()
+    mc.player.setPos(x, y, z)
+    if world.player_state_cache is not None:
+        world.player_state_cache.clear()
+    return {"status": "success", "message": f"Set player position to ({x},{y},{z})"}
+
+
+@command('getPlayerTilePos')
+def get_player_tile_pos(mc):
+    pos = mc.player.getTilePos()
+    return {"status": "success", "x": pos.x, "y": pos.y, "z": pos.z}
+
+
+@command('getPlayerDirection')
+def get_player_direction(mc):
+    direction = mc.player.getDirection()
+    return {"status": "success", "x": direction.x, "y": direction.y, "z": direction.z}
+
+
+@command('getPlayerRotation')
+def get_player_rotation(mc):
+    return {"status": "success", "rotation": mc.player.getRotation()}
+
+
+@command('getPlayerPitch')
+def get_player_pitch(mc):
+    return {"status": "success", "pitch": mc.player.getPitch()}
+
+
+def _parse_vec(reply, convert=float):
+    x, y, z = (convert(value) for value in reply.split(","))
+    return {"x": x, "y": y, "z": z}
+
+
+def fetch_player_state(mc):
+    """プレイヤーの位置、ブロック座標、向き、回転、ピッチを1回の往復でまとめて取得する"""
+    pos, tile, direction, rotation, pitch = query_many(mc, [
+        ("player.getPos", ()),
+        ("player.getTile", ()),
+        ("player.getDirection", ()),
+        ("player.getRotation", ()),
+        ("player.getPitch", ()),
+    ])
+    return {"pos": _parse_vec(pos), "tilePos": _parse_vec(tile, int), "direction": _parse_vec(direction),
+            "rotation": float(rotation), "pitch": float(pitch)}
+
+
+@command('getPlayerState')
+def get_player_state(mc):
+    world = current_world()
+    if world.player_state_cache is not None:
+        state = world.player_state_cache.get(lambda: fetch_player_state(mc))
+    else:
+        state = fetch_player_state(mc)
+    return {"status": "success", **state}
+
+
+# setting_name, status (True/False or 1/0)
+# 利用可能な設定名は制限せず、そのまま渡す
+@command('worldSetting', str, to_bool, writes=True,
+         arity_message="Incorrect number of arguments for worldSetting (expected 2: name, status)",
+         invalid_message="Invalid status for worldSetting (must be true/false or 1/0)")
+def world_setting(mc, setting_name, status):
+    mc.world.setting(setting_name, status)
+    return {"status": "success", "message": f"Set world setting '{setting_name}' to {status}"}
+
+
+def event_queue(mc, world, kind):
+    """pollBlockHits / pollChatPosts が読む events.EventQueue を返す (どちらもない場合は None)
+
+    ポーラーがなくバッファがある場合は、ゲームのイベントをバッファに移してから返します。
+    """
+    if world.event_poller is not None:
+        return world.event_poller.queue
+    queue = world.event_backlog
+    if queue is not None:
+        # イベントの dict は作らずに、1件ずつバッファの列に移す
+        if kind == BLOCK_HIT:
+            hits = mc.events.pollBlockHits()
+            if world.world_cache is not None:
+                world.world_cache.on_block_positions((hit.pos.x, hit.pos.y, hit.pos.z) for hit in hits)
+            queue.log.extend(BLOCK_HIT, map(block_hit_values, hits))
+        else:
+            queue.log.extend(CHAT_POST, map(chat_post_values, mc.events.pollChatPosts()))
+    return queue
+
+
+def page(key, items, more):
+    """最大 limit 件のイベントのレスポンス (残りがあれば more が true、次の呼び出しで続きを返す)"""
+    result = {"status": "success", key: items}
+    if more:
+        result["more"] = True
+    return result
+
+
+# 引数: [limit] (1回に返す最大件数、1〜500、デフォルトは500)
+@command('pollBlockHits', optional=(to_page_limit,),
+         invalid_message=f"Invalid limit for pollBlockHits (must be an integer from 1 to {MAX_PAGE})")
+def poll_block_hits(mc, limit=MAX_PAGE):
+    world = current_world()
+    terse = terse_response.get()
+    queue = event_queue(mc, world, BLOCK_HIT)
+    # Event オブジェクトやバッファの値をJSONシリアライズ可能な形式に変換 (terse の場合は dict を作らずに配列にする)
+    convert = block_hit_to_row if terse else block_hit_to_dict
+    if queue is not None:
+        rows, more = queue.take(BLOCK_HIT, limit)
+        return page("hits", [convert(values) for values in rows], more)
+    hits = mc.events.pollBlockHits()
+    if world.world_cache is not None:
+        world.world_cache.on_block_positions((hit.pos.x, hit.pos.y, hit.pos.z) for hit in hits)
+    return {"status": "success", "hits": [convert(block_hit_values(hit)) for hit in hits]}
+
+
+# 引数: [limit] (1回に返す最大件数、1〜500、デフォルトは500)
+@command('pollChatPosts', optional=(to_page_limit,),
+         invalid_message=f"Invalid limit for pollChatPosts (must be an integer from 1 to {MAX_PAGE})")
+def poll_chat_posts(mc, limit=MAX_PAGE):
+    terse = terse_response.get()
+    queue = event_queue(mc, current_world(), CHAT_POST)
+    # Event オブジェクトやバッファの値をJSONシリアライズ可能な形式に変換
+    convert = chat_post_to_row if terse else chat_post_to_dict
+    if queue is not None:
+        rows, more = queue.take(CHAT_POST, limit)
+        return page("posts", [convert(values) for values in rows], more)
+    posts = mc.events.pollChatPosts()
+    return {"status": "success", "posts": [convert(chat_post_values(post)) for post in posts]}
+
+
+@command('clearEvents')
+def clear_events(mc):
+    world = current_world()
+    mc.events.clearAll()
+    if world.event_poller is not None:
+        world.event_poller.queue.clear()
+    if world.event_backlog is not None:
+        world.event_backlog.clear()
+    return {"status": "success", "message": "Cleared all events"}
+
+@command('flush')
+def flush(mc):
+    buffer = current_world().write_buffer
+    blocks, calls = buffer.flush(mc) if buffer is not None else (0, 0)
+    return {"status": "success", "message": f"Flushed {blocks} blocks in {calls} calls"}
+
+# --- 図形のコマンド (shapes.py でボクセル化し、直方体に分解して setBlocks で送る) ---
+
+def place_boxes(mc, boxes, block_id, block_data=None):
+    """直方体のリストを setBlocks (1ブロックの場合は setBlock) で置き、置いたブロックの数を返す"""
+    world = current_world()
+    extra = () if block_data is None else (block_data,)
+    blocks = 0
+    for x1, y1, z1, x2, y2, z2 in boxes:
+        if (x1, y1, z1) == (x2, y2, z2):
+            mc.setBlock(x1, y1, z1, block_id, *extra)
+        else:
+            mc.setBlocks(x1, y1, z1, x2, y2, z2, block_id, *extra)
+        if world.world_cache is not None:
+            world.world_cache.on_set_blocks(x1, y1, z1, x2, y2, z2, block_id)
+        blocks += (x2 - x1 + 1) * (y2 - y1 + 1) * (z2 - z1 + 1)
+    return blocks
+
+
+def draw(mc, shape, points, block_id, block_data=None):
+    boxes = shapes.decompose(points)
+    blocks = place_boxes(mc, boxes, block_id, block_data)
+    return {"status": "success", "message": f"Drew {shape} with {blocks} blocks in {len(boxes)} calls"}
+
+
+# 引数: x1, y1, z1, x2, y2, z2, block_id, [block_data]
+@command('drawLine', int, int, int, int, int, int, int, optional=(int,),
+         check=shape_check('drawLine', _line_volume), cost=shape_cost(_line_volume), writes=True)
+def draw_line(mc, x1, y1, z1, x2, y2, z2, block_id, block_data=None):
+    return draw(mc, "line", shapes.line(x1, y1, z1, x2, y2, z2), block_id, block_data)
+
+
+# 引数: x, y, z (中心), radius, block_id, [hollow], [block_data]
+@command('drawSphere', int, int, int, int, int, optional=(to_bool, int),
+         check=shape_check('drawSphere', _sphere_volume), cost=shape_cost(_sphere_volume), writes=True)
+def draw_sphere(mc, x, y, z, radius, block_id, hollow=False, block_data=None):
+    return draw(mc, "sphere", shapes.sphere(x, y, z, radius, hollow), block_id, block_data)
+
+
+# 引数: x, y, z (底面の中心), radius, height, block_id, [hollow], [block_data]
+@command('drawCylinder', int, int, int, int, int, int, optional=(to_bool, int),
+         check=shape_check('drawCylinder', _cylinder_volume), cost=shape_cost(_cylinder_volume), writes=True)
+def draw_cylinder(mc, x, y, z, radius, height, block_id, hollow=False, block_data=None):
+    return draw(mc, "cylinder", shapes.cylinder(x, y, z, radius, height, hollow), block_id, block_data)
+
+
+# 引数: [[x, z], ...] (頂点), y, block_id, [block_data]
+@command('fillPolygon', to_points, int, int, optional=(int,),
+         check=shape_check('fillPolygon', _polygon_area), cost=shape_cost(_polygon_area), writes=True,
+         invalid_message="Invalid arguments for fillPolygon (expected [[x, z], ...] with at least 3 points, then integers)")
+def fill_polygon(mc, points, y, block_id, block_data=None):
+    return draw(mc, "polygon", shapes.polygon(points, y), block_id, block_data)
+
+
+# 引数: x, y, z (テンプレートの最小の角を置く位置), template (getBlocks のレスポンスと同じ形式), [include_air]
+@command('placeTemplate', int, int, int, to_template, optional=(to_bool,),
+         check=shape_check('placeTemplate', lambda *values: 0), cost=shape_cost(_template_volume), writes=True,
+         invalid_message="Invalid arguments for placeTemplate (expected x, y, z and a template like the getBlocks response)")
+def place_template(mc, x, y, z, template, include_air=False):
+    size, blocks = template
+    count = calls = 0
+    for block_id, boxes in shapes.template_boxes(x, y, z, size, blocks, include_air).items():
+        count += place_boxes(mc, boxes, block_id)
+        calls += len(boxes)
+    return {"status": "success", "message": f"Placed template with {count} blocks in {calls} calls"}
+
+
+# --- スナップショット (snapshots.py に保存し、戻すときは変わった場所だけを setBlocks で送る) ---
+
+# snapshotRegion で保存できるブロック数の上限
+MAX_SNAPSHOT_VOLUME = 1 << 21
+
+
+def to_snapshot_name(value):
+    if not is_valid_name(value):
+        raise ValueError(f"invalid snapshot name: {value!r}")
+    return value
+
+
+def _check_snapshot_store():
+    if current_world().snapshot_store is None:
+        raise CommandError("Snapshots are not enabled", 501)
+
+
+def check_snapshot(name, x1, y1, z1, x2, y2, z2):
+    _check_snapshot_store()
+    dx, dy, dz = region_size(x1, y1, z1, x2, y2, z2)
+    if dx * dy * dz > MAX_SNAPSHOT_VOLUME:
+        raise CommandError(f"Region too large (max {MAX_SNAPSHOT_VOLUME} blocks)", 413)
+
+
+def snapshot_volume(name):
+    """保存されているスナップショットのブロック数 (ない場合は 404、読めない場合は 500 の CommandError)"""
+    try:
+        with current_world().snapshot_store.open(name) as snapshot:
+            return snapshot.volume
+    except FileNotFoundError:
+        raise CommandError(f"Snapshot not found: {name}", 404)
+    except ValueError:
+        raise CommandError(f"Snapshot is corrupt: {name}", 500)
+
+
+def check_restore(name):
+    _check_snapshot_store()
+    snapshot_volume(name)
+
+
+def diff_boxes(x, y, z, size, saved, current):
+    """saved (y, z, x の順) と current が異なる場所を saved に戻す直方体をブロックIDごとに返す
+
+    NumPy がない場合は write_buffer の貪欲法で直方体にまとめます。
+    """
+    if load_shapes() is not None:
+        return shapes.diff_boxes(x, y, z, size, saved, current)
+    dx, dy, dz = size
+    changed = {}
+    for coord, old, new in zip(region_coords(x, y, z, x + dx - 1, y + dy - 1, z + dz - 1), saved, current):
+        if old != new:
+            changed.setdefault(old, []).append(coord)
+    return {block_id: merge_boxes(coords) for block_id, coords in changed.items()}
+
+
+# 引数: name, x1, y1, z1, x2, y2, z2
+# ブロックIDだけを保存します (羊毛の色などの block_data は保存しません)。
+@command('snapshotRegion', to_snapshot_name, int, int, int, int, int, int,
+         check=check_snapshot, cost=lambda name, *region: region_cost(*region),
+         invalid_message="Invalid arguments for snapshotRegion (name must be 1-64 letters, digits, _ or -, coordinates must be integers)")
+def snapshot_region(mc, name, x1, y1, z1, x2, y2, z2):
+    world = current_world()
+    dx, dy, dz = region_size(x1, y1, z1, x2, y2, z2)
+    x, y, z = min(x1, x2), min(y1, y2), min(z1, z2)
+    # getBlocks の上限に収まる数の層ずつ読み出して書き込む
+    layers = max(1, MAX_REGION_VOLUME // (dx * dz))
+    slabs = (read_region(mc, x, bottom, z, x + dx - 1, min(bottom + layers, y + dy) - 1, z + dz - 1)
+             for bottom in range(y, y + dy, layers))
+    length = world.snapshot_store.save(name, (x, y, z), (dx, dy, dz), layers, slabs)
+    return {"status": "success", "message": f"Saved snapshot {name} with {dx * dy * dz} blocks ({length} bytes)",
+            "size": {"x": dx, "y": dy, "z": dz}}
+
+
+# 引数: name
+# 現在のブロックと比べ、変わった場所だけをまとめた直方体の setBlocks で戻します。
+@command('restoreRegion', to_snapshot_name, check=check_restore,
+         cost=lambda name: volume_cost(snapshot_volume(name)), writes=True,
+         invalid_message="Invalid arguments for restoreRegion (name must be 1-64 letters, digits, _ or -)")
+def restore_region(mc, name):
+    world = current_world()
+    changed = calls = 0
+    with world.snapshot_store.open(name) as snapshot:
+        x, _, z = snapshot.origin
+        dx, _, dz = snapshot.size
+        for number in range(len(snapshot)):
+            bottom, layers, saved = snapshot.slab(number)
+            current = read_region(mc, x, bottom, z, x + dx - 1, bottom + layers - 1, z + dz - 1)
+            for block_id, boxes in diff_boxes(x, bottom, z, (dx, layers, dz), saved, current).items():
+                changed += place_boxes(mc, boxes, block_id)
+                calls += len(boxes)
+    return {"status": "success", "message": f"Restored snapshot {name}: {changed} blocks changed in {calls} calls",
+            "changed": changed, "calls": calls}
+
+
+# --- 他のMinecraftコマンドはここに @command で追加 ---
@@ -0,0 +1,164 @@
+# Minecraftへの接続を管理し、切断された場合にバックグラウンドで再接続する
+#
+# mcpi のプロトコルは1本のソケット上で要求と応答の順番が対応しているため、
+# 接続は1本だけ持ち、ロックで直列化して複数のリクエストスレッドから共有します。
+# (複数の接続を持つとゲーム側でのコマンドの実行順序が保証されなくなります)
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def default_health_check(mc):
+    """接続が応答するか確認する (ブロックを書き換えない軽いコマンドを送る)"""
+    mc.getHeight(0, 0)
+
+
+class ConnectionManager:
+    """Minecraftへの1本の接続と、その再接続を行う監視スレッド
+
+    factory は新しい Minecraft インスタンスを作る関数、
+    on_change は接続が変わるたびに新しいインスタンス (切断時は None) を受け取る関数です。
+    lock は接続を使う間に保持するロックで、他の部品 (イベントポーラーなど) と共有します。
+    """
+
+    def __init__(self, factory, lock=None, on_change=None, health_check=default_health_check,
+                 health_interval=5.0, min_backoff=0.5, max_backoff=30.0):
+        self.factory = factory
+        self.lock = lock if lock is not None else threading.RLock()
+        self.on_change = on_change
+        self.health_check = health_check
+        self.health_interval = health_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.mc = None
+        self.last_error = None
+        self.connects = 0
+        # 最後に応答を確認したときの往復時間 (秒、まだ確認していなければ None)
+        self.rtt = None
+        self._backoff = min_backoff
+        self._connected = threading.Event()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def connect(self):
+        """1回だけ接続を試みる。成功した場合は True を返す"""
+        try:
+            mc = self.factory()
+        except Exception as e:
+            self.last_error = e
+            return False
+        with self.lock:
+            self._set(mc)
+        self._backoff = self.min_backoff
+        return True
+
+    def mark_failed(self, mc=None, error=None):
+        """接続が使えなくなったことを通知し、監視スレッドに再接続させる
+
+        mc を指定した場合、それが現在の接続であるときだけ切断扱いにします
+        (すでに再接続済みの新しい接続を誤って捨てないため)。
+        """
+        with self.lock:
+            if self.mc is None or (mc is not None and mc is not self.mc):
+                return
+            old = self.mc
+            self._set(None)
+        self.last_error = error
+        self._close(old)
+        self._wake.set()
+
+    def wait_connected(self, timeout):
+        """接続されるまで最大 timeout 秒待つ (監視スレッドが動いていない場合は待たない)"""
+        if self.mc is not None:
+            return True
+        if not self.running:
+            return False
+        return self._connected.wait(timeout)
+
+    def probe(self, timeout=1.0):
+        """接続が応答するか確認し、往復時間 (秒) を返す (未接続、または応答しない場合は None)
+
+        他のスレッドが timeout 秒より長く接続を使っている場合は、確認せずに最後の往復時間を返します。
+        """
+        mc = self.mc
+        if mc is None:
+            return None
+        if not self.lock.acquire(timeout=timeout):
+            return self.rtt
+        try:
+            return self._check(mc)
+        except Exception as e:
+            logger.warning("Minecraft connection health check failed: %s", e)
+            self.mark_failed(mc, e)
+            return None
+        finally:
+            self.lock.release()
+
+    def _check(self, mc):
+        started = time.perf_counter()
+        self.health_check(mc)
+        self.rtt = time.perf_counter() - started
+        return self.rtt
+
+    def start(self):
+        """監視スレッドを起動する (未接続ならすぐにバックグラウンドで接続を始める)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="minecraft-connection", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _set(self, mc):
+        self.mc = mc
+        if mc is None:
+            self._connected.clear()
+        else:
+            self.connects += 1
+            self._connected.set()
+        if self.on_change is not None:
+            self.on_change(mc)
+
+    def _close(self, mc):
+        try:
+            mc.conn.socket.close()
+        except Exception:
+            pass
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.mc is None:
+                first = self.connects == 0
+                if self.connect():
+                    logger.info("Connected to Minecraft" if first else "Reconnected to Minecraft")
+                    continue
+                # 接続に失敗したら待ち時間を倍にしながら再試行する
+                delay = self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+                logger.warning("Could not connect to Minecraft (%s), retrying in %.1fs", self.last_error, delay)
+                self._stop.wait(delay)
+                continue
+
+            self._wake.wait(self.health_interval)
+            self._wake.clear()
+            mc = self.mc
+            if mc is None or self._stop.is_set():
+                continue
+            try:
+                with self.lock:
+                    self._check(mc)
+            except Exception as e:
+                logger.warning("Minecraft connection health check failed: %s", e)
+                self.mark_failed(mc, e)
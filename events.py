@@ -0,0 +1,347 @@
+# Minecraftのイベント (ブロックヒット、チャット投稿) をバックグラウンドで取得し、
+# 複数のクライアントが同じイベントを読めるようにメモリ上に保持する
+#
+# mc.events.pollBlockHits() などは読み出したイベントをゲーム側から消してしまうため、
+# ポーラーだけがゲームから取り出し、クライアントは連番 (seq) のカーソルで読み出します。
+#
+# イベントは種類ごとに固定長のリングバッファに、座標や entityId などの列ごとの array で保存します
+# (イベントごとの dict は読み出すときにだけ作る)。授業の間ずっと動かしても、メモリの使用量は容量で決まります。
+# まだ誰も読んでいないイベントでバッファがいっぱいになった場合は、overflow の方針に従います。
+#   drop-oldest: 最も古いイベントを捨てる (デフォルト)
+#   drop-newest: 新しく届いたイベントを捨てる
+#   coalesce:    同じブロックへのヒットがすでにバッファにあれば新しいヒットを捨て、なければ最も古いイベントを捨てる
+# 捨てたイベントより前のカーソルで読むと、missed (取りこぼし) が true になります。
+
+import heapq
+import logging
+import threading
+import time
+from array import array
+
+logger = logging.getLogger(__name__)
+
+BLOCK_HIT = 'blockHit'
+CHAT_POST = 'chatPost'
+
+DROP_OLDEST = 'drop-oldest'
+DROP_NEWEST = 'drop-newest'
+COALESCE = 'coalesce'
+OVERFLOW_POLICIES = (DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+# 1回の読み出し (/events、pollBlockHits など) で返すイベントの最大数
+MAX_PAGE = 500
+
+# 種類ごとに保存する列 (名前, array の型コード、None は Python のオブジェクトのリスト)
+FIELDS = {
+    BLOCK_HIT: (("x", "i"), ("y", "i"), ("z", "i"), ("face", "b"), ("entityId", "q"), ("type", "i")),
+    CHAT_POST: (("entityId", "q"), ("type", "i"), ("message", None)),
+}
+
+
+def block_hit_to_dict(values):
+    """ブロックヒットイベント (FIELDS の順の値) をJSONシリアライズ可能な形式に変換する"""
+    x, y, z, face, entity_id, hit_type = values
+    return {"type": hit_type, "pos": {"x": x, "y": y, "z": z}, "face": face, "entityId": entity_id}
+
+
+def chat_post_to_dict(values):
+    """チャット投稿イベント (FIELDS の順の値) をJSONシリアライズ可能な形式に変換する"""
+    entity_id, post_type, message = values
+    return {"type": post_type, "entityId": entity_id, "message": message}
+
+
+def block_hit_to_row(values):
+    """ブロックヒットイベント (FIELDS の順の値) を [x, y, z, face, entityId] の配列に変換する (terse のレスポンス用)"""
+    return list(values[:5])
+
+
+def chat_post_to_row(values):
+    """チャット投稿イベント (FIELDS の順の値) を [entityId, message] の配列に変換する (terse のレスポンス用)"""
+    return [values[0], values[2]]
+
+
+def block_hit_values(hit):
+    """ブロックヒットイベントを FIELDS の順の値に変換する (EventLog.extend 用)"""
+    return hit.pos.x, hit.pos.y, hit.pos.z, hit.face, hit.entityId, hit.type
+
+
+def chat_post_values(post):
+    """チャット投稿イベントを FIELDS の順の値に変換する (EventLog.extend 用)"""
+    return post.entityId, post.type, post.message
+
+
+def _event_dict(seq, kind, values):
+    data = block_hit_to_dict(values) if kind == BLOCK_HIT else chat_post_to_dict(values)
+    return {"seq": seq, "kind": kind, **data}
+
+
+class EventRing:
+    """1種類のイベントを最大 capacity 件まで、列ごとの固定長の array に保持するリングバッファ
+
+    lost は捨てたイベントの最大の連番 (取りこぼしの判定用)、read は読み出されたカーソルの最大値です。
+    """
+
+    __slots__ = ("capacity", "lost", "read", "_seqs", "_columns", "_start", "_count")
+
+    def __init__(self, capacity, fields):
+        self.capacity = capacity
+        self.lost = 0
+        self.read = 0
+        self._seqs = array('q', bytes(8 * capacity))
+        self._columns = [array(code, bytes(array(code).itemsize * capacity)) if code else [None] * capacity
+                         for _, code in fields]
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def full(self):
+        return self._count == self.capacity
+
+    def seq(self, offset):
+        """古い方から offset 番目のイベントの連番"""
+        return self._seqs[(self._start + offset) % self.capacity]
+
+    def values(self, offset):
+        """古い方から offset 番目のイベントの値 (FIELDS の順)"""
+        index = (self._start + offset) % self.capacity
+        return tuple(column[index] for column in self._columns)
+
+    def after(self, seq):
+        """seq より新しい最初のイベントの位置 (古い方から数える) を二分探索で求める"""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.seq(middle) <= seq:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def push(self, seq, values):
+        """イベントを追加する (いっぱいの場合は最も古いイベントを上書きする)"""
+        if self._count == self.capacity:
+            index = self._start
+            self.lost = self._seqs[index]
+            self._start = (index + 1) % self.capacity
+        else:
+            index = (self._start + self._count) % self.capacity
+            self._count += 1
+        self._seqs[index] = seq
+        for column, value in zip(self._columns, values):
+            column[index] = value
+
+
+class EventLog:
+    """連番付きのイベントを種類ごとに最大 capacity 件まで保持するリングバッファ
+
+    overflow はまだ読まれていないイベントでいっぱいのときの方針 (OVERFLOW_POLICIES) です。
+    読まれたイベントは、容量を超えると方針に関係なく古い方から捨てられます。
+    wait() で新しいイベントが届くまで待つことができます (ロングポーリング用)。
+    """
+
+    def __init__(self, capacity=1024, overflow=DROP_OLDEST):
+        if capacity < 1:
+            raise ValueError("event buffer capacity must be at least 1")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown event overflow policy: {overflow}")
+        self.capacity = capacity
+        self.overflow = overflow
+        # まだ読まれていないのに捨てたイベントと、まとめたブロックヒットの数
+        self.dropped = 0
+        self.coalesced = 0
+        self._rings = {kind: EventRing(capacity, fields) for kind, fields in FIELDS.items()}
+        # coalesce の場合に、バッファにあるブロックヒットの座標ごとの数
+        self._hit_blocks = {}
+        self._last_seq = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def __len__(self):
+        return sum(len(ring) for ring in self._rings.values())
+
+    def sizes(self):
+        """種類ごとの保持しているイベントの数"""
+        with self._cond:
+            return {kind: len(ring) for kind, ring in self._rings.items()}
+
+    def extend(self, kind, rows):
+        """複数のイベント (FIELDS の順の値) をまとめて追加し、追加した数を返す (待機中のクライアントへの通知は1回)
+
+        rows はイテレーターでもよく、1件ずつバッファに移すので、全体のリストは作りません。
+        """
+        ring = self._rings[kind]
+        coalesce = self.overflow == COALESCE and kind == BLOCK_HIT
+        added = 0
+        with self._cond:
+            for values in rows:
+                if ring.full:
+                    # 最も古いイベントが読まれていなければ、バッファは未読のイベントでいっぱい
+                    unread = ring.seq(0) > ring.read
+                    if unread and self.overflow == DROP_NEWEST:
+                        self.dropped += 1
+                        ring.lost = self._last_seq + 1
+                        continue
+                    if unread and coalesce and values[:3] in self._hit_blocks:
+                        self.coalesced += 1
+                        continue
+                    if unread:
+                        self.dropped += 1
+                    if coalesce:
+                        self._forget_hit(ring.values(0)[:3])
+                self._last_seq += 1
+                ring.push(self._last_seq, values)
+                if coalesce:
+                    key = tuple(values[:3])
+                    self._hit_blocks[key] = self._hit_blocks.get(key, 0) + 1
+                added += 1
+            if added:
+                self._cond.notify_all()
+        return added
+
+    def _forget_hit(self, key):
+        count = self._hit_blocks.get(key, 0)
+        if count > 1:
+            self._hit_blocks[key] = count - 1
+        else:
+            self._hit_blocks.pop(key, None)
+
+    def since(self, seq, kinds=None, limit=None):
+        """seq より新しいイベントを最大 limit 件返す
+
+        戻り値は (イベントのリスト, 次回のカーソル, 取りこぼしがあったか) です。
+        イベントは {"seq": ..., "kind": ..., **data} の形式です。
+        """
+        with self._cond:
+            rings = [(kind, ring) for kind, ring in self._rings.items() if kinds is None or kind in kinds]
+            missed = any(ring.lost > seq for _, ring in rings)
+            result = []
+            cursor = self._last_seq
+            # 種類ごとのバッファは連番の順なので、新しいものだけを連番の順に合わせて取り出す
+            for event_seq, kind, ring, offset in heapq.merge(*(self._iter_after(kind, ring, seq) for kind, ring in rings)):
+                if limit is not None and len(result) >= limit:
+                    cursor = result[-1]["seq"]
+                    break
+                result.append(_event_dict(event_seq, kind, ring.values(offset)))
+            for _, ring in rings:
+                ring.read = max(ring.read, cursor)
+            return result, cursor, missed
+
+    def values_since(self, seq, kind, limit=None):
+        """seq より新しい1種類のイベントを、dict にせずに FIELDS の順の値のまま最大 limit 件返す
+
+        戻り値は (値のタプルのリスト, 次回のカーソル) です。
+        """
+        with self._cond:
+            ring = self._rings[kind]
+            start = ring.after(seq)
+            end = len(ring) if limit is None else min(len(ring), start + limit)
+            result = [ring.values(offset) for offset in range(start, end)]
+            cursor = ring.seq(end - 1) if end < len(ring) else self._last_seq
+            ring.read = max(ring.read, cursor)
+            return result, cursor
+
+    @staticmethod
+    def _iter_after(kind, ring, seq):
+        for offset in range(ring.after(seq), len(ring)):
+            yield ring.seq(offset), kind, ring, offset
+
+    def pending(self, seq, kinds=None):
+        """seq より新しいイベントの数"""
+        with self._cond:
+            return sum(len(ring) - ring.after(seq) for kind, ring in self._rings.items()
+                       if kinds is None or kind in kinds)
+
+    def wait(self, seq, timeout):
+        """seq より新しいイベントが届くまで最大 timeout 秒待つ"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._last_seq > seq, timeout)
+
+
+class EventQueue:
+    """従来の pollBlockHits / pollChatPosts 用に、種類ごとに読み出すと進むカーソルで EventLog を読む"""
+
+    def __init__(self, log):
+        self.log = log
+        self._cursors = {BLOCK_HIT: 0, CHAT_POST: 0}
+        self._lock = threading.Lock()
+
+    def take(self, kind, limit=MAX_PAGE):
+        """前回の take 以降のイベントを、FIELDS の順の値のまま最大 limit 件返す
+
+        戻り値は (値のタプルのリスト, 返しきれなかったイベントがあるか) です。
+        レスポンスの形式には block_hit_to_dict / block_hit_to_row などで変換します。
+        """
+        with self._lock:
+            rows, cursor = self.log.values_since(self._cursors[kind], kind, limit)
+            self._cursors[kind] = cursor
+        return rows, self.log.pending(cursor, (kind,)) > 0
+
+    def clear(self):
+        """カーソルを最新まで進める"""
+        with self._lock:
+            # 最新のカーソルで読み出して、それまでのイベントを読み済みにする
+            _, cursor, _ = self.log.since(self.log.last_seq)
+            for kind in self._cursors:
+                self._cursors[kind] = cursor
+
+
+class EventPoller:
+    """一定間隔で mc.events を読み出し、EventLog に追加するバックグラウンドスレッド
+
+    get_connection は現在の Minecraft インスタンス (未接続なら None) を返す関数、
+    lock は Minecraft への接続を他のスレッドと共有するためのロックです。
+    on_block_positions を指定すると、ヒットしたブロックの (x, y, z) のリストが渡されます (キャッシュの無効化用)。
+    capacity と overflow は EventLog の容量と方針です。
+    """
+
+    def __init__(self, get_connection, lock, interval=0.1, capacity=1024, on_block_positions=None,
+                 overflow=DROP_OLDEST):
+        self.get_connection = get_connection
+        self.lock = lock
+        self.on_block_positions = on_block_positions
+        self.interval = interval
+        self.log = EventLog(capacity, overflow)
+        # 従来の pollBlockHits / pollChatPosts 用 (読み出すと進む)
+        self.queue = EventQueue(self.log)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="event-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def poll_once(self):
+        """ゲームからイベントを1回読み出して EventLog に追加する"""
+        mc = self.get_connection()
+        if mc is None:
+            return
+        with self.lock:
+            hits = mc.events.pollBlockHits()
+            posts = mc.events.pollChatPosts()
+        if hits and self.on_block_positions is not None:
+            self.on_block_positions([(hit.pos.x, hit.pos.y, hit.pos.z) for hit in hits])
+        # イベントの dict は作らずに、1件ずつバッファの列に移す
+        self.log.extend(BLOCK_HIT, map(block_hit_values, hits))
+        self.log.extend(CHAT_POST, map(chat_post_values, posts))
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.warning("Event poller failed: %s", e)
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
@@ -0,0 +1,386 @@
+# 負荷試験とベンチマーク用の Minecraft Pi Edition (Reborn) の代わりになるサーバー
+#
+# mcpi のテキストプロトコルを TCP で話し、メモリ上のボクセルの世界
+# (16x16x16 のチャンクを必要になったときだけ確保する疎な配列) に対して
+# world.*, player.*, chat.post, events.* のコマンドを実行します。
+# 応答の前に遅延 (とランダムなゆらぎ) を入れて、Raspberry Pi 上のゲームとの往復を模擬できます。
+# 乱数は seed で固定されるため、同じ設定なら同じ結果になります。
+#
+# 起動例 (ブリッジは MINECRAFT_HOST=localhost MINECRAFT_PORT=4711 で接続する):
+#     python fake_minecraft.py --port 4711 --latency-ms 5 --jitter-ms 2
+
+import argparse
+import logging
+import math
+import random
+import socketserver
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+AIR = 0
+STONE = 1
+GRASS = 2
+DIRT = 3
+# ワールドの高さの範囲 (API の座標)
+MIN_Y = -64
+MAX_Y = 63
+CHUNK_SHIFT = 4
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+CHUNK_MASK = CHUNK_SIZE - 1
+
+
+class Chunk:
+    """16x16x16 ブロックのIDとデータ値"""
+
+    __slots__ = ('ids', 'data')
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.data = bytearray(len(ids))
+
+
+def chunk_index(x, y, z):
+    return (((y & CHUNK_MASK) << CHUNK_SHIFT | (z & CHUNK_MASK)) << CHUNK_SHIFT) | (x & CHUNK_MASK)
+
+
+class VoxelWorld:
+    """平らな地形から始まり、書き込まれたチャンクだけを保持する世界
+
+    ground 以下は石 (一番上は土と草) で、それより上は空気です。
+    """
+
+    def __init__(self, ground=-1):
+        self.ground = ground
+        self._chunks = {}
+        self._lock = threading.Lock()
+
+    def generated(self, y):
+        """書き込まれていない場所の高さ y のブロック"""
+        if y > self.ground or y < MIN_Y:
+            return AIR
+        if y == self.ground:
+            return GRASS
+        if y >= self.ground - 3:
+            return DIRT
+        return STONE
+
+    def _generate_chunk(self, cy):
+        layers = bytearray()
+        for dy in range(CHUNK_SIZE):
+            layers += bytes([self.generated((cy << CHUNK_SHIFT) + dy)]) * (CHUNK_SIZE * CHUNK_SIZE)
+        return Chunk(layers)
+
+    def _chunk(self, cx, cy, cz):
+        key = (cx, cy, cz)
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._chunks[key] = self._generate_chunk(cy)
+        return chunk
+
+    @property
+    def chunk_count(self):
+        return len(self._chunks)
+
+    def get_block(self, x, y, z):
+        return self.get_block_with_data(x, y, z)[0]
+
+    def get_block_with_data(self, x, y, z):
+        with self._lock:
+            chunk = self._chunks.get((x >> CHUNK_SHIFT, y >> CHUNK_SHIFT, z >> CHUNK_SHIFT))
+            if chunk is None:
+                return self.generated(y), 0
+            index = chunk_index(x, y, z)
+            return chunk.ids[index], chunk.data[index]
+
+    def set_blocks(self, x1, y1, z1, x2, y2, z2, block_id, data=0):
+        """範囲をすべて block_id にする (ワールドの高さの範囲外は無視する)"""
+        x1, x2 = min(x1, x2), max(x1, x2)
+        y1, y2 = max(min(y1, y2), MIN_Y), min(max(y1, y2), MAX_Y)
+        z1, z2 = min(z1, z2), max(z1, z2)
+        if y1 > y2:
+            return
+        block_id &= 0xFF
+        data &= 0xFF
+        with self._lock:
+            for cy in range(y1 >> CHUNK_SHIFT, (y2 >> CHUNK_SHIFT) + 1):
+                for cz in range(z1 >> CHUNK_SHIFT, (z2 >> CHUNK_SHIFT) + 1):
+                    for cx in range(x1 >> CHUNK_SHIFT, (x2 >> CHUNK_SHIFT) + 1):
+                        chunk = self._chunk(cx, cy, cz)
+                        # チャンク内の範囲の x 方向の行をまとめて書き換える
+                        lx1, lx2 = max(x1, cx << CHUNK_SHIFT), min(x2, (cx << CHUNK_SHIFT) + CHUNK_MASK)
+                        run = lx2 - lx1 + 1
+                        for y in range(max(y1, cy << CHUNK_SHIFT), min(y2, (cy << CHUNK_SHIFT) + CHUNK_MASK) + 1):
+                            for z in range(max(z1, cz << CHUNK_SHIFT), min(z2, (cz << CHUNK_SHIFT) + CHUNK_MASK) + 1):
+                                start = chunk_index(lx1, y, z)
+                                chunk.ids[start:start + run] = bytes([block_id]) * run
+                                chunk.data[start:start + run] = bytes([data]) * run
+
+    def set_block(self, x, y, z, block_id, data=0):
+        self.set_blocks(x, y, z, x, y, z, block_id, data)
+
+    def get_height(self, x, z):
+        """(x, z) の列で最も高い空気以外のブロックの y"""
+        with self._lock:
+            for cy in range(MAX_Y >> CHUNK_SHIFT, (MIN_Y >> CHUNK_SHIFT) - 1, -1):
+                chunk = self._chunks.get((x >> CHUNK_SHIFT, cy, z >> CHUNK_SHIFT))
+                top = min(MAX_Y, (cy << CHUNK_SHIFT) + CHUNK_MASK)
+                bottom = max(MIN_Y, cy << CHUNK_SHIFT)
+                if chunk is None:
+                    if bottom <= self.ground:
+                        return min(top, self.ground)
+                    continue
+                for y in range(top, bottom - 1, -1):
+                    if chunk.ids[chunk_index(x, y, z)] != AIR:
+                        return y
+        return MIN_Y
+
+
+class FakeGame:
+    """ワールド、プレイヤー、イベントを持ち、mcpi の1行の要求を処理する"""
+
+    def __init__(self, ground=-1):
+        self.world = VoxelWorld(ground)
+        self.player_pos = [0.5, float(ground + 1), 0.5]
+        self.rotation = 0.0
+        self.pitch = 0.0
+        self.settings = {}
+        self.chat = []
+        self.block_hits = []
+        self.chat_posts = []
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    # --- テストやベンチマークからイベントを起こす ---
+
+    def hit_block(self, x, y, z, face=1, entity_id=1):
+        with self._lock:
+            self.block_hits.append((x, y, z, face, entity_id))
+
+    def post_chat(self, message, entity_id=1):
+        with self._lock:
+            self.chat_posts.append((entity_id, message))
+
+    # --- プロトコル ---
+
+    def handle(self, line):
+        """1行の要求を処理し、応答の行 (応答のないコマンドは None) を返す"""
+        self.requests += 1
+        function, _, rest = line.partition("(")
+        params = rest[:-1] if rest.endswith(")") else rest
+        handler = self.HANDLERS.get(function)
+        if handler is None:
+            return "Fail"
+        try:
+            return handler(self, params)
+        except (ValueError, IndexError):
+            return "Fail"
+
+    def _ints(self, params):
+        return [int(float(value)) for value in params.split(",")]
+
+    def _get_block(self, params):
+        return str(self.world.get_block(*self._ints(params)[:3]))
+
+    def _get_block_with_data(self, params):
+        block_id, data = self.world.get_block_with_data(*self._ints(params)[:3])
+        return f"{block_id},{data}"
+
+    def _get_blocks(self, params):
+        x1, y1, z1, x2, y2, z2 = self._ints(params)[:6]
+        # y, x, z の順 (z が最も速く変わる) で返す
+        return ",".join(str(self.world.get_block(x, y, z))
+                        for y in range(min(y1, y2), max(y1, y2) + 1)
+                        for x in range(min(x1, x2), max(x1, x2) + 1)
+                        for z in range(min(z1, z2), max(z1, z2) + 1))
+
+    def _set_block(self, params):
+        values = self._ints(params)
+        self.world.set_block(*values[:5])
+
+    def _set_blocks(self, params):
+        values = self._ints(params)
+        self.world.set_blocks(*values[:8])
+
+    def _get_height(self, params):
+        x, z = self._ints(params)[:2]
+        return str(self.world.get_height(x, z))
+
+    def _setting(self, params):
+        name, _, value = params.partition(",")
+        self.settings[name] = value == "1"
+
+    def _chat_post(self, params):
+        self.chat.append(params)
+
+    def _get_pos(self, params):
+        return ",".join(str(value) for value in self.player_pos)
+
+    def _set_pos(self, params):
+        self.player_pos = [float(value) for value in params.split(",")][:3]
+
+    def _get_tile(self, params):
+        return ",".join(str(math.floor(value)) for value in self.player_pos)
+
+    def _set_tile(self, params):
+        self.player_pos = [value + 0.5 for value in self._ints(params)[:3]]
+
+    def _get_direction(self, params):
+        rotation, pitch = math.radians(self.rotation), math.radians(self.pitch)
+        x = -math.sin(rotation) * math.cos(pitch)
+        y = -math.sin(pitch)
+        z = math.cos(rotation) * math.cos(pitch)
+        return f"{x},{y},{z}"
+
+    def _get_rotation(self, params):
+        return str(self.rotation)
+
+    def _set_rotation(self, params):
+        self.rotation = float(params)
+
+    def _get_pitch(self, params):
+        return str(self.pitch)
+
+    def _set_pitch(self, params):
+        self.pitch = float(params)
+
+    def _block_hits(self, params):
+        with self._lock:
+            hits, self.block_hits = self.block_hits, []
+        return "|".join(",".join(str(value) for value in hit) for hit in hits)
+
+    def _chat_posts(self, params):
+        with self._lock:
+            posts, self.chat_posts = self.chat_posts, []
+        return "|".join(f"{entity_id},{message}" for entity_id, message in posts)
+
+    def _clear_events(self, params):
+        with self._lock:
+            self.block_hits = []
+            self.chat_posts = []
+
+    HANDLERS = {
+        "world.getBlock": _get_block,
+        "world.getBlockWithData": _get_block_with_data,
+        "world.getBlocks": _get_blocks,
+        "world.setBlock": _set_block,
+        "world.setBlocks": _set_blocks,
+        "world.getHeight": _get_height,
+        "world.setting": _setting,
+        "chat.post": _chat_post,
+        "player.getPos": _get_pos,
+        "player.setPos": _set_pos,
+        "player.getTile": _get_tile,
+        "player.setTile": _set_tile,
+        "player.getDirection": _get_direction,
+        "player.getRotation": _get_rotation,
+        "player.setRotation": _set_rotation,
+        "player.getPitch": _get_pitch,
+        "player.setPitch": _set_pitch,
+        "events.block.hits": _block_hits,
+        "events.chat.posts": _chat_posts,
+        "events.clear": _clear_events,
+    }
+
+
+class _ConnectionHandler(socketserver.BaseRequestHandler):
+    """1つのクライアント接続の要求を順番に処理する
+
+    一度に届いた要求 (パイプライン化された要求) をまとめて処理し、
+    遅延を1回だけ入れてから応答をまとめて送ります。
+    """
+
+    def handle(self):
+        server = self.server
+        buffer = b""
+        while True:
+            try:
+                received = self.request.recv(65536)
+            except OSError:
+                return
+            if not received:
+                return
+            buffer += received
+            *lines, buffer = buffer.split(b"\n")
+            replies = []
+            for line in lines:
+                reply = server.game.handle(line.decode(errors="replace").rstrip("\r"))
+                if reply is not None:
+                    replies.append(reply + "\n")
+            if replies:
+                delay = server.next_delay()
+                if delay > 0:
+                    time.sleep(delay)
+                try:
+                    self.request.sendall("".join(replies).encode())
+                except OSError:
+                    return
+
+
+class FakeMinecraftServer(socketserver.ThreadingTCPServer):
+    """FakeGame を TCP で公開するサーバー (接続ごとにスレッドで処理する)
+
+    latency 秒の遅延と、0 から jitter 秒までのランダムなゆらぎを応答の前に入れます。
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 4711), latency=0.0, jitter=0.0, seed=0, ground=-1):
+        super().__init__(address, _ConnectionHandler)
+        self.game = FakeGame(ground)
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def next_delay(self):
+        if self.jitter <= 0:
+            return self.latency
+        with self._random_lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def start(self):
+        """バックグラウンドのスレッドで要求の受け付けを始める"""
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-minecraft", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Minecraft Pi Edition server for load testing")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4711)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay before each reply")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="random extra delay (0..jitter)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ground", type=int, default=-1, help="y of the top block of the flat world")
+    options = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    server = FakeMinecraftServer((options.host, options.port), latency=options.latency_ms / 1000,
+                                 jitter=options.jitter_ms / 1000, seed=options.seed, ground=options.ground)
+    logger.info("Fake Minecraft server listening on %s:%s", options.host, server.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# 本番用の起動方法 (gunicorn の設定)
+#
+#     gunicorn -c gunicorn.conf.py app:app
+#
+# 各ワーカーは gthread (スレッドプール) で、Minecraft への接続、キャッシュ、イベントのポーラー、
+# 書き込みバッファ、メトリクスはワーカー (プロセス) ごとに持ちます。
+# 接続はフォークの後、ワーカーの中で開きます (ソケットとバックグラウンドのスレッドはフォークを越えられないため)。
+#
+# ワーカーが1つ (デフォルト) なら Minecraft への接続も1本で、すべてのコマンドが1つの順番で実行されます。
+# 2以上にすると CPU のコアを使えますが、コマンドの順番が保証されるのはワーカーの中だけです
+# (キープアライブで同じ TCP 接続を使い続けるクライアントのコマンドは、同じワーカーで順番に実行されます)。
+#
+# SIGTERM を受け取ると新しい接続の受け付けを止め、処理中のリクエストが終わるのを待ってから
+# ためている setBlock を送信し、Minecraft との接続を閉じます。
+
+import os
+import signal
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_WORKERS", 1))
+threads = int(os.environ.get("WEB_THREADS", 16))
+# Scratch から連続して送られるリクエストで TCP 接続を使い回せるように、少し長めに開いておく
+keepalive = int(os.environ.get("WEB_KEEPALIVE", 15))
+# 終了時に処理中のリクエスト (と SSE / WebSocket の接続) を待つ時間 (秒)
+graceful_timeout = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", 30))
+# アプリケーションはワーカーの中で読み込む (フォーク前に Minecraft に接続しない)
+preload_app = False
+accesslog = None
+# ログは app が JSON Lines で書き出すので、gunicorn 自身のログは標準エラーに出す
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    """ワーカーのプロセスで、Minecraft への接続とバックグラウンドの処理を始める"""
+    import app
+
+    app.configure_logging()
+    app.configure(workers=worker.cfg.workers)
+
+    # SIGTERM を受け取ったら、長い接続 (SSE / WebSocket) を閉じ始める
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        app.stopping.set()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """処理中のリクエストが終わった後に、ためている書き込みを送信して接続を閉じる"""
+    import app
+
+    app.shutdown()
@@ -0,0 +1,200 @@
+# 書き込み系のコマンドのジャーナル (追記のみ、オプション)
+#
+# ブリッジが実行した書き込み系のコマンド (setBlock、setBlocks、図形、postToChat など) を、
+# 時刻とクライアントの識別子と一緒に1行1つの JSON (JSON Lines) でファイルに追記します。
+# 遅かったセッションの再現や、クラッシュ後のワールドの作り直しに replay.py で使います。
+#
+# リクエストの処理中はメモリ上のリストに追加するだけで、バックグラウンドのスレッドが
+# fsync_interval 秒ごとにまとめて書き込み、1回の fsync でディスクに書き込みます (グループコミット)。
+# ファイル (セグメント) が segment_bytes を超えると新しいセグメントに切り替え、
+# max_segments を超えた古いセグメントは削除します。
+#
+# 1行の形式: {"t": UNIX時刻 (秒), "client": クライアントの識別子, "command": コマンド名, "args": [...]}
+# 既定以外のワールド (WORLDS) のコマンドには "world": ワールド名 が加わります。
+
+import heapq
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# セグメントのファイル名 (番号の順に読む)
+_SEGMENT = re.compile(r"journal-(\d{8})\.jsonl")
+
+
+def segment_paths(directory):
+    """directory にあるセグメントのパスを古い順に返す"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    numbered = sorted((int(match.group(1)), name) for match, name in
+                      ((_SEGMENT.fullmatch(name), name) for name in names) if match)
+    return [os.path.join(directory, name) for _, name in numbered]
+
+
+def read_journal(path):
+    """ジャーナル (ディレクトリまたは1つのセグメント) の記録を古い順に返すイテレーター
+
+    ディレクトリにセグメントがなく、ワーカーごとのサブディレクトリ (worker-<pid>) がある場合は、
+    それぞれの記録を時刻の順に合わせて返します。
+    最後の行が途中までしか書かれていない場合 (書き込み中のクラッシュなど) は読み飛ばします。
+    """
+    if not os.path.isdir(path):
+        return _read_segments([path])
+    paths = segment_paths(path)
+    if paths:
+        return _read_segments(paths)
+    workers = sorted(entry.path for entry in os.scandir(path) if entry.is_dir() and entry.name.startswith("worker-"))
+    return heapq.merge(*(_read_segments(segment_paths(worker)) for worker in workers), key=lambda record: record["t"])
+
+
+def _read_segments(paths):
+    for segment in paths:
+        with open(segment, encoding="utf-8") as f:
+            for number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning("Skipping unreadable journal line %s:%s", segment, number)
+                    continue
+                if isinstance(record, dict) and isinstance(record.get("command"), str) \
+                        and isinstance(record.get("t"), (int, float)):
+                    yield record
+
+
+class CommandJournal:
+    """書き込み系のコマンドを directory のセグメントに追記するジャーナル
+
+    fsync_interval 秒ごと (または max_pending 件たまるごと) にまとめて書き込んで fsync します。
+    segment_bytes を超えたセグメントは閉じて次のセグメントに切り替え、
+    max_segments (0 で無制限) を超えた古いセグメントは削除します。
+    """
+
+    def __init__(self, directory, fsync_interval=0.1, segment_bytes=64 << 20, max_segments=0,
+                 max_pending=4096, clock=time.time):
+        self.directory = directory
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.max_pending = max_pending
+        self.clock = clock
+        self.records = 0
+        self.syncs = 0
+        self._pending = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._file = None
+        self._size = 0
+        os.makedirs(directory, exist_ok=True)
+        existing = segment_paths(directory)
+        # 前回のセグメントには追記せず (最後の行が途中までかもしれない)、次の番号から始める
+        self._number = int(_SEGMENT.fullmatch(os.path.basename(existing[-1])).group(1)) if existing else 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="journal", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """バックグラウンドの書き込みを止め、残っている記録を書き込んでファイルを閉じる"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.sync()
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def append(self, client, command, args, world=None):
+        """実行したコマンドを記録する (ディスクへの書き込みはバックグラウンドで行う)
+
+        world は既定以外のワールド (app の WORLDS) の名前で、その場合だけ記録に含めます。
+        """
+        record = {"t": round(self.clock(), 6), "client": client, "command": command, "args": args}
+        if world is not None:
+            record["world"] = world
+        with self._lock:
+            self._pending.append(record)
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def sync(self):
+        """たまっている記録を書き込んで fsync し、書き込んだ件数を返す
+
+        書き込みに失敗した場合 (OSError) は、記録をリストの先頭に戻してから例外を送出します。
+        書きかけのデータはセグメントから切り詰め (できなかった場合も、途中までの行は読み飛ばされます)、
+        次の書き込みは新しいセグメントに行います。
+        """
+        # ファイルへの書き込み中も append は待たせない (記録のリストのロックは入れ替えの間だけ持つ)
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            data = "".join(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n"
+                           for record in pending).encode("utf-8")
+            try:
+                if self._file is None or self._size >= self.segment_bytes:
+                    self._rotate()
+                self._file.write(data)
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except OSError:
+                # 記録を失わないように戻し、次の sync でもう一度書き込む
+                with self._lock:
+                    self._pending[:0] = pending
+                self._close_failed(self._size)
+                raise
+            self._size += len(data)
+            self.records += len(pending)
+            self.syncs += 1
+            return len(pending)
+
+    def _close_failed(self, size):
+        """書き込みに失敗したセグメントを size に切り詰めて閉じる (次の書き込みで新しいセグメントを開く)"""
+        if self._file is not None:
+            # 戻した記録を再び書き込んだときに、同じ記録が2回残らないようにする
+            try:
+                self._file.truncate(size)
+            except (OSError, ValueError):
+                pass
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        self._number += 1
+        path = os.path.join(self.directory, f"journal-{self._number:08d}.jsonl")
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+        if self.max_segments > 0:
+            for old in segment_paths(self.directory)[:-self.max_segments]:
+                os.remove(old)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.fsync_interval)
+            self._wake.clear()
+            try:
+                self.sync()
+            except OSError as e:
+                logger.warning("Journal write failed, %s records kept for retry: %s", len(self._pending), e)
@@ -0,0 +1,137 @@
+# Prometheus のテキスト形式で公開するメトリクス (/metrics)
+#
+# コマンドごとのリクエスト数、ステータスコードごとのエラー数、
+# ブリッジ全体の処理時間とゲームとの往復時間のヒストグラムを記録します。
+# 記録する側ではあらかじめ用意したカウンターを数値で更新するだけで、
+# 文字列の組み立ては /metrics が読まれたときにまとめて行います。
+
+import threading
+import time
+from bisect import bisect_left
+
+# ヒストグラムのバケットの上限 (秒)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 登録表にないコマンド名をまとめるラベル (任意の文字列でラベルが増え続けないように)
+UNKNOWN_COMMAND = "unknown"
+
+
+class Histogram:
+    """固定のバケットを持つヒストグラム"""
+
+    __slots__ = ('counts', 'sum')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    def render(self, name, labels, lines):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        cumulative += self.counts[-1]
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+
+class CommandStats:
+    """1つのコマンドのカウンターとヒストグラム"""
+
+    __slots__ = ('requests', 'errors', 'bridge', 'game')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = {} # HTTPステータス -> 回数
+        self.bridge = Histogram()
+        self.game = Histogram()
+
+
+class Metrics:
+    """コマンドのメトリクスと、読み出し時に値を求めるゲージの集まり
+
+    names は記録するコマンド名です (それ以外の名前は UNKNOWN_COMMAND として記録します)。
+    """
+
+    def __init__(self, names, clock=time.perf_counter):
+        self.clock = clock
+        self.in_flight = 0
+        self._commands = {name: CommandStats() for name in names}
+        self._unknown = self._commands.setdefault(UNKNOWN_COMMAND, CommandStats())
+        self._gauges = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """リクエストの処理を始めたときに呼び、開始時刻を返す"""
+        with self._lock:
+            self.in_flight += 1
+        return self.clock()
+
+    def finish(self, command, status, started):
+        """リクエストの処理が終わったときに呼ぶ (started は start() の戻り値)"""
+        elapsed = self.clock() - started
+        stats = self._commands.get(command, self._unknown) if isinstance(command, str) else self._unknown
+        with self._lock:
+            self.in_flight -= 1
+            stats.requests += 1
+            if status != 200:
+                stats.errors[status] = stats.errors.get(status, 0) + 1
+            stats.bridge.observe(elapsed)
+
+    def observe_game(self, command, seconds):
+        """ゲームとの往復 (接続のロックを取ってからコマンドが終わるまで) の時間を記録する"""
+        stats = self._commands.get(command, self._unknown)
+        with self._lock:
+            stats.game.observe(seconds)
+
+    def gauge(self, name, help_text, read, kind="gauge"):
+        """読み出し時に read() で値を求めるメトリクスを登録する
+
+        read() は数値、または {ラベルの文字列: 数値} の dict を返します。
+        """
+        self._gauges.append((name, help_text, read, kind))
+
+    def render(self):
+        """Prometheus のテキスト形式に変換する"""
+        lines = []
+        with self._lock:
+            # 1度も使われていないコマンドは出力しない
+            used = [(name, stats) for name, stats in sorted(self._commands.items())
+                    if stats.requests or sum(stats.game.counts)]
+            lines.append("# HELP bridge_requests_total Requests handled, by command")
+            lines.append("# TYPE bridge_requests_total counter")
+            for name, stats in used:
+                lines.append(f'bridge_requests_total{{command="{name}"}} {stats.requests}')
+            lines.append("# HELP bridge_errors_total Requests that did not succeed, by command and HTTP status")
+            lines.append("# TYPE bridge_errors_total counter")
+            for name, stats in used:
+                for status, count in sorted(stats.errors.items()):
+                    lines.append(f'bridge_errors_total{{command="{name}",code="{status}"}} {count}')
+            lines.append("# HELP bridge_request_seconds Time spent in the bridge per request, including queueing and the game")
+            lines.append("# TYPE bridge_request_seconds histogram")
+            for name, stats in used:
+                if stats.requests:
+                    stats.bridge.render("bridge_request_seconds", f'command="{name}"', lines)
+            lines.append("# HELP bridge_game_seconds Time spent talking to Minecraft per command (batch items included)")
+            lines.append("# TYPE bridge_game_seconds histogram")
+            for name, stats in used:
+                if sum(stats.game.counts):
+                    stats.game.render("bridge_game_seconds", f'command="{name}"', lines)
+            lines.append("# HELP bridge_in_flight_requests Requests currently being handled")
+            lines.append("# TYPE bridge_in_flight_requests gauge")
+            lines.append(f"bridge_in_flight_requests {self.in_flight}")
+
+        for name, help_text, read, kind in self._gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            value = read()
+            if isinstance(value, dict):
+                for labels, item in value.items():
+                    lines.append(f"{name}{{{labels}}} {item}")
+            else:
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,46 @@
+# mcpi の1本のソケットに多数の問い合わせをまとめて送る (パイプライン化)
+#
+# mcpi ライブラリの問い合わせは「1行送って1行受け取る」を1回ずつ繰り返すため、
+# 4096 個の getBlock にはゲームとの往復が 4096 回かかります。
+# 応答は要求の順番どおりに届くので、要求を続けて書き込んでから応答をまとめて読めば、
+# 往復の待ち時間は最初の1回分だけになります。
+#
+# 呼び出し側は接続のロックを保持していること (他のスレッドの要求と応答が混ざらないように)。
+
+from aio_mcpi import format_request
+
+# 応答を読まずに送っておく要求の最大数
+# (ゲーム側の送信バッファが詰まって双方が書き込みで止まらないようにする)
+DEFAULT_WINDOW = 512
+
+
+def query_many(mc, requests, window=DEFAULT_WINDOW):
+    """(関数名, 引数のタプル) のリストを送り、応答の行 (文字列) のリストを順番どおりに返す
+
+    ゲームが "Fail" を返した場合もそのまま文字列として返します。
+    接続が切れた場合は OSError (ConnectionError) を送出します。
+    """
+    requests = list(requests)
+    if not requests:
+        return []
+    conn = mc.conn
+    # mcpi と同じく、前の要求の読み残しがあれば捨ててから送る
+    conn.drain()
+    sock = conn.socket
+    reader = sock.makefile("rb")
+    replies = []
+    sent = 0
+    try:
+        while len(replies) < len(requests):
+            in_flight = sent - len(replies)
+            if sent < len(requests) and in_flight <= window // 2:
+                chunk = requests[sent:sent + window - in_flight]
+                sock.sendall(b"".join(format_request(function, args) for function, args in chunk))
+                sent += len(chunk)
+            line = reader.readline()
+            if not line:
+                raise ConnectionError("connection closed by Minecraft")
+            replies.append(line.decode().rstrip("\n"))
+    finally:
+        reader.close()
+    return replies
@@ -0,0 +1,57 @@
+# getPlayerState の結果を短時間だけ共有するキャッシュ
+#
+# プレイヤーを追いかけるスプライトは毎フレーム位置や向きを問い合わせるため、
+# 多数のクライアントが同時に動くと同じ値を何度もゲームに聞くことになります。
+# window 秒以内の要求には前回の結果を返し、取得中の要求があればその結果を待って共有します
+# (single-flight)。これにより、1回の描画周期あたりのゲームへの問い合わせはほぼ1回になります。
+
+import threading
+import time
+
+
+class PlayerStateCache:
+    """プレイヤーの状態を window 秒だけ共有するキャッシュ"""
+
+    def __init__(self, window=0.02, clock=time.monotonic):
+        self.window = window
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._state = None
+        self._stamp = None
+        self._fetching = False
+        self._cond = threading.Condition()
+
+    def get(self, fetch):
+        """有効な状態があればそれを、なければ fetch() の結果を返す
+
+        他のスレッドが取得中の場合は、その結果を待って同じ値を返します。
+        fetch() が例外を送出した場合は、待っていたスレッドの1つが取得をやり直します。
+        """
+        with self._cond:
+            while True:
+                if self._stamp is not None and self.clock() - self._stamp <= self.window:
+                    self.hits += 1
+                    return self._state
+                if not self._fetching:
+                    break
+                self._cond.wait()
+            self._fetching = True
+            self.misses += 1
+        try:
+            state = fetch()
+        except BaseException:
+            with self._cond:
+                self._fetching = False
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._state, self._stamp = state, self.clock()
+            self._fetching = False
+            self._cond.notify_all()
+        return state
+
+    def clear(self):
+        """保持している状態を捨てる (setPlayerPos などでプレイヤーが動いた場合)"""
+        with self._cond:
+            self._state = self._stamp = None
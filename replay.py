@@ -0,0 +1,191 @@
+# ジャーナル (journal.py) の再生
+#
+# JOURNAL_DIR に記録された書き込み系のコマンドを、ブリッジの /command にもう一度送ります。
+#   * 遅かったセッションを再現する: 記録された時刻の間隔どおりに送る (--speed 1、2 なら2倍速)
+#   * クラッシュの後にワールドを作り直す: 間隔を空けずにできるだけ速く送る (--speed 0)
+# コマンドは元のクライアントごとに別々の接続 (と X-Client-Id) で、クライアントの中では記録の順に送るので、
+# スケジューラーなどには元のセッションと同じように複数のクライアントが見えます。
+# ただし --speed 0 (と --ordered) の場合は、ジャーナル全体の順序を保つために1つの接続で記録の順に送ります
+# (別々の接続では、複数のクライアントが同じブロックに書き込んだときに、最後に記録された書き込みが最後に届くとは限らないため)。
+# 既定以外のワールド (WORLDS) で実行されたコマンドは、/w/<ワールド名>/command に送ります
+# (フェイクのサーバーで再生する場合と --ignore-worlds の場合は、すべて /command に送ります)。
+#
+# --url を指定しない場合は bench.py と同じく、フェイクの Minecraft サーバーとブリッジをこの場で起動して
+# 再生するので、実際のセッションを負荷試験のデータとして使えます。
+#
+# 実行例:
+#     python replay.py journal/ --url http://localhost:5000 --speed 0
+#     python replay.py journal/ --speed 4 --latency-ms 2 --output replay.json
+
+import argparse
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+from bench import start_local_bridge, summarize
+from journal import read_journal
+
+
+class _Recorder:
+    """クライアントのスレッドが記録する結果"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.statuses = {}
+        self.lags = []
+        self._lock = threading.Lock()
+
+    def record(self, command, seconds, status, lag):
+        with self._lock:
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if status != 200:
+                self.errors[command] = self.errors.get(command, 0) + 1
+            self.latencies.setdefault(command, []).append(seconds)
+            self.lags.append(lag)
+
+
+def _stream(url, records, start, first, speed, recorder, prefix, route_worlds):
+    """記録を1つの接続で順に送る (speed が 0 でなければ記録された時刻に合わせる)
+
+    X-Client-Id は記録ごとの元のクライアントです。
+    """
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    try:
+        for record in records:
+            headers = {"Content-Type": "application/json", "X-Client-Id": prefix + str(record.get("client"))}
+            due = start + (record["t"] - first) / speed if speed > 0 else time.perf_counter()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            payload = json.dumps({"command": record["command"], "args": record.get("args", [])})
+            # 既定以外のワールドのコマンドは、同じ名前のワールドに送る
+            world = record.get("world") if route_worlds else None
+            path = f"/w/{quote(world, safe='')}/command" if world else "/command"
+            started = time.perf_counter()
+            try:
+                conn.request("POST", path, payload, headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                status = 0
+            recorder.record(record["command"], time.perf_counter() - started, status, max(0.0, started - due))
+    finally:
+        conn.close()
+
+
+def replay(url, records, speed=1.0, prefix="", route_worlds=True, ordered=None):
+    """記録 (古い順) をクライアントごとのスレッドで url に送り、結果を集計する
+
+    speed は再生の速さ (1 で記録どおり、0 で間隔を空けない)、prefix は X-Client-Id の先頭に付ける文字列です。
+    ordered が True の場合は、クライアントごとのスレッドではなく1つの接続で記録の順に送り、
+    ジャーナル全体の順序 (同じブロックへの書き込みは最後の記録が勝つ) を保ちます。None の場合は speed が 0 のときだけです。
+    route_worlds が False の場合は、ワールドの記録を無視してすべて既定のワールドに送ります。
+    結果の lag は、記録どおりの時刻からどれだけ遅れて送ったか (ミリ秒) です。
+    """
+    by_client = {}
+    for record in records:
+        by_client.setdefault(record.get("client"), []).append(record)
+    if not by_client:
+        raise ValueError("the journal has no records")
+    first = min(records[0]["t"] for records in by_client.values())
+    last = max(records[-1]["t"] for records in by_client.values())
+
+    if ordered is None:
+        ordered = speed == 0
+    # 1つの接続で送る場合は、記録全体を1つのストリームにする
+    streams = [records] if ordered else list(by_client.values())
+
+    recorder = _Recorder()
+    start = time.perf_counter()
+    threads = [threading.Thread(target=_stream, daemon=True,
+                                args=(url, stream, start, first, speed, recorder, prefix, route_worlds))
+               for stream in streams]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    all_latencies = [value for values in recorder.latencies.values() for value in values]
+    result = {
+        "clients": len(by_client),
+        "speed": speed,
+        "recordedDuration": round(last - first, 3),
+        "duration": round(elapsed, 3),
+        "statuses": {str(status): count for status, count in sorted(recorder.statuses.items())},
+    }
+    result.update(summarize(all_latencies, elapsed, errors=sum(recorder.errors.values())))
+    lag = summarize(recorder.lags, elapsed)
+    result["lag"] = {name: lag[name] for name in ("p50", "p95", "p99")}
+    result["commands"] = {command: summarize(values, elapsed, errors=recorder.errors.get(command, 0))
+                          for command, values in sorted(recorder.latencies.items())}
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a command journal through the Minecraft Scratch bridge")
+    parser.add_argument("journal", help="journal directory (JOURNAL_DIR) or a single segment file")
+    parser.add_argument("--url", help="bridge to replay into (default: start a local bridge and fake server)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 replays at the recorded timing, 2 twice as fast, 0 as fast as possible")
+    parser.add_argument("--ordered", action="store_true",
+                        help="send every record on one connection in journal order (always on with --speed 0)")
+    parser.add_argument("--client-prefix", default="", help="prefix added to each X-Client-Id")
+    parser.add_argument("--ignore-worlds", action="store_true",
+                        help="send commands recorded for named worlds to the default world")
+    parser.add_argument("--limit", type=int, help="replay only the first N records")
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="fake server reply delay (local mode)")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="fake server reply jitter (local mode)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE",
+                        help="bridge setting for local mode, e.g. WRITE_BUFFER_DELAY_MS=5 (repeatable)")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    options = parser.parse_args(argv)
+    if options.speed < 0:
+        parser.error("--speed must not be negative")
+
+    records = list(read_journal(options.journal))
+    if options.limit is not None:
+        records = records[:options.limit]
+    if not records:
+        print(f"No records in {options.journal}")
+        return 1
+
+    shutdown = None
+    url = options.url
+    if url is None:
+        for item in options.env:
+            name, _, value = item.partition("=")
+            os.environ[name] = value
+        # 再生したコマンドをもう一度記録しないようにする
+        os.environ.pop("JOURNAL_DIR", None)
+        url, shutdown = start_local_bridge(options.latency_ms, options.jitter_ms, options.seed)
+    try:
+        result = replay(url, records, options.speed, options.client_prefix,
+                        options.url is not None and not options.ignore_worlds, options.ordered or None)
+    finally:
+        if shutdown is not None:
+            shutdown()
+
+    print(f"replayed {result['requests']} commands from {result['clients']} clients in {result['duration']}s "
+          f"(recorded {result['recordedDuration']}s): {result['opsPerSec']} ops/s "
+          f"p50={result['p50']}ms p95={result['p95']}ms p99={result['p99']}ms "
+          f"lag p95={result['lag']['p95']}ms errors={result['errors']}")
+    if options.output:
+        result["url"] = options.url or "local"
+        result["journal"] = options.journal
+        with open(options.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return 0 if result["errors"] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+# クライアントごとの公平なスケジューラーとレート制限
+#
+# Minecraft への接続は1本だけなので、コマンドは1つずつしか実行できません。
+# ロックの取り合いに任せると、最も速くリクエストを送るクライアント (タブ) が他を押しのけてしまいます。
+# ここではクライアント (X-Client-Id ヘッダーまたは IP アドレス) ごとに待ち行列を持ち、
+# 不足ラウンドロビン (DRR) でコストに応じて順番を割り当てます。
+#
+# さらにクライアントごとのトークンバケットで、1秒あたりに使えるコストを制限します。
+# setBlocks のように重いコマンドはブロック数に応じて多くのコストを消費します。
+# 待ち行列が一杯の場合とトークンが足りない場合は Overloaded (HTTP 429) になります。
+
+import math
+import threading
+import time
+from collections import deque
+
+
+class Overloaded(Exception):
+    """待ち行列が一杯、またはレート制限を超えた場合のエラー (retry_after 秒後の再試行を促す)"""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.message = message
+        self.status = 429
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """1秒あたり rate、最大 burst までたまるトークンバケット"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'stamp')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = now
+
+    def take(self, cost, now):
+        """cost 分のトークンを使う。足りない場合は使わずに、たまるまでの秒数を返す"""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def full(self, now):
+        """now の時点でトークンが burst までたまっているか"""
+        return self.tokens + (now - self.stamp) * self.rate >= self.burst
+
+
+class _Ticket:
+    __slots__ = ('cost', 'granted')
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.granted = False
+
+
+class FairScheduler:
+    """クライアントごとの待ち行列から DRR で1つずつ実行の順番を割り当てる
+
+    rate が 0 の場合はレート制限をせず、公平な順番の割り当てだけを行います。
+    max_queue は1つのクライアントが同時に待たせられるコマンド (またはバッチ) の数です。
+    """
+
+    def __init__(self, rate=0.0, burst=None, max_queue=64, quantum=1.0, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate * 2, 1.0)
+        self.max_queue = max_queue
+        self.quantum = quantum
+        self.clock = clock
+        self.rejected = 0
+        self._queues = {}   # クライアント -> 待っている _Ticket の deque
+        self._deficit = {}  # クライアント -> たまっている実行枠
+        self._ring = deque() # 待っているクライアントの巡回順
+        self._buckets = {}  # クライアント -> TokenBucket
+        self._next_prune = 0.0
+        self._busy = False
+        self._cond = threading.Condition()
+
+    def depth(self):
+        """待っているコマンドの数の合計"""
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def run(self, client, cost, action):
+        """client の順番が来たら action() を実行し、その戻り値を返す"""
+        self._enqueue(client, cost)
+        try:
+            return action()
+        finally:
+            with self._cond:
+                self._busy = False
+                self._dispatch()
+
+    def _enqueue(self, client, cost):
+        with self._cond:
+            if len(self._queues.get(client, ())) >= self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"Too many queued commands (max {self.max_queue})")
+            if self.rate > 0:
+                now = self.clock()
+                if now >= self._next_prune:
+                    self._prune_buckets(now)
+                bucket = self._buckets.get(client)
+                if bucket is None:
+                    bucket = self._buckets[client] = TokenBucket(self.rate, self.burst, now)
+                # バースト量を超えるコストのコマンドでも、トークンが満タンなら実行できるようにする
+                wait = bucket.take(min(cost, self.burst), now)
+                if wait > 0:
+                    self.rejected += 1
+                    raise Overloaded(f"Rate limit exceeded, retry after {wait:.2f}s", wait)
+            queue = self._queues.get(client)
+            if queue is None:
+                queue = self._queues[client] = deque()
+                self._deficit[client] = 0.0
+                self._ring.append(client)
+            ticket = _Ticket(min(cost, self.burst) if self.rate > 0 else cost)
+            queue.append(ticket)
+            self._dispatch()
+            while not ticket.granted:
+                self._cond.wait()
+
+    def _prune_buckets(self, now):
+        """待ちがなく、トークンが満タンに戻ったクライアントのバケットを捨てる (_cond を保持して呼ぶ)
+
+        満タンのバケットは新しく作ったバケットと同じなので、捨てても制限は変わりません。
+        空のバケットが満タンに戻るまでの時間ごとに1回だけ調べます。
+        """
+        self._buckets = {client: bucket for client, bucket in self._buckets.items()
+                         if client in self._queues or not bucket.full(now)}
+        self._next_prune = now + self.burst / self.rate
+
+    def _dispatch(self):
+        """実行中のコマンドがなければ、次に実行するコマンドに順番を割り当てる (_cond を保持して呼ぶ)"""
+        if self._busy:
+            return
+        skipped = 0
+        while self._ring:
+            client = self._ring[0]
+            queue = self._queues[client]
+            ticket = queue[0]
+            if self._deficit[client] >= ticket.cost:
+                self._deficit[client] -= ticket.cost
+                queue.popleft()
+                if not queue:
+                    # 待ちがなくなったクライアントの実行枠は持ち越さない
+                    self._ring.popleft()
+                    del self._queues[client]
+                    del self._deficit[client]
+                ticket.granted = True
+                self._busy = True
+                self._cond.notify_all()
+                return
+            self._deficit[client] += self.quantum
+            self._ring.rotate(-1)
+            skipped += 1
+            if skipped >= len(self._ring):
+                # 1周しても順番が来なければ、誰かの順番が来るまでの周回数の実行枠をまとめて足す
+                # (コストの大きなコマンドでも、ロックを持ったまま1周ずつ回さない)
+                rounds = min(math.ceil((self._queues[waiting][0].cost - self._deficit[waiting]) / self.quantum)
+                             for waiting in self._ring)
+                if rounds > 0:
+                    for waiting in self._ring:
+                        self._deficit[waiting] += rounds * self.quantum
+                skipped = 0
@@ -0,0 +1,115 @@
+# クライアントごとの連番による重複の排除と順番どおりの実行
+#
+# Scratch のクライアントはタイムアウトすると同じコマンドを送り直すため、
+# そのままでは setBlocks や postToChat が2回実行されてしまいます (チャットに同じ行が2回出るなど)。
+# クライアントがコマンドごとに増えていく連番 (seq) を付けて送ると、ここで
+#   * 実行済みの連番の結果を覚えておき (クライアントごとに最大 window 件)、再送には保存した結果を返す
+#   * 実行中の連番が再送された場合は、実行が終わるのを待って同じ結果を返す
+#   * 別々のスレッドに届いた場合も、同じクライアントのコマンドを連番の順に1つずつ実行する
+# ようにします。前の連番が届かない場合は、最大 order_wait 秒待ってから先に進みます。
+
+import threading
+import time
+from collections import OrderedDict
+
+# 実行されなかった (再送すべき) ことを表す HTTP ステータス。この結果は保存しない
+RETRYABLE_STATUSES = frozenset({429, 503})
+
+
+class SequenceError(Exception):
+    """連番が不正、またはすでに過ぎた連番のコマンドが届いた場合のエラー"""
+
+    def __init__(self, message, status=409):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class _ClientState:
+    __slots__ = ('last', 'results', 'running')
+
+    def __init__(self, last):
+        self.last = last                 # 最後に実行を始めた連番
+        self.results = OrderedDict()     # 連番 -> (レスポンス dict, HTTPステータス)
+        self.running = set()             # 実行中の連番 (前の連番が order_wait 秒で終わらなければ2つ以上)
+
+
+class ClientSequencer:
+    """クライアントごとの連番で、コマンドを重複なく順番どおりに実行する
+
+    window はクライアントごとに結果を保存する件数、max_clients は覚えておくクライアントの数です
+    (それを超えると、最も長く使われていないクライアントの記録を捨てます)。
+    """
+
+    def __init__(self, window=256, max_clients=1024, order_wait=0.5, clock=time.monotonic):
+        self.window = window
+        self.max_clients = max_clients
+        self.order_wait = order_wait
+        self.clock = clock
+        self.replayed = 0
+        self._clients = OrderedDict()
+        self._cond = threading.Condition()
+
+    def run(self, client, seq, action):
+        """client の連番 seq のコマンドを action() で実行し、(レスポンス dict, HTTPステータス) を返す
+
+        再送された連番には、保存した結果 (または実行中の結果) を返します。
+        """
+        if isinstance(seq, bool) or not isinstance(seq, int) or seq < 0:
+            raise SequenceError("seq must be a non-negative integer", 400)
+        with self._cond:
+            state = self._state(client, seq)
+            deadline = self.clock() + self.order_wait
+            while True:
+                if seq in state.results:
+                    self.replayed += 1
+                    result, status = state.results[seq]
+                    return dict(result), status
+                if seq <= state.last and seq not in state.running:
+                    raise SequenceError(f"seq {seq} is older than the last executed seq {state.last}")
+                remaining = deadline - self.clock()
+                if state.running:
+                    # 前の連番 (または再送された同じ連番) の実行が終わるのを最大 order_wait 秒待つ
+                    # (ゲームへの接続が止まっていても、再送のスレッドが止まり続けないようにする)
+                    if remaining > 0:
+                        self._cond.wait(remaining)
+                        continue
+                    if seq in state.running:
+                        raise SequenceError(f"seq {seq} is still running, retry later", 503)
+                    # 前の連番が終わらなければ先に進む
+                    break
+                if seq == state.last + 1:
+                    break
+                # 前の連番が届くのを待つ (届かなければ先に進む)
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            previous, state.last = state.last, seq
+            state.running.add(seq)
+
+        result = None
+        try:
+            result = action()
+            return result
+        finally:
+            with self._cond:
+                state.running.discard(seq)
+                if result is not None and result[1] not in RETRYABLE_STATUSES:
+                    state.results[seq] = (dict(result[0]), result[1])
+                    while len(state.results) > self.window:
+                        state.results.popitem(last=False)
+                elif state.last == seq:
+                    # 実行されなかったので、同じ連番で再送できるようにする
+                    state.last = previous
+                self._cond.notify_all()
+
+    def _state(self, client, seq):
+        """client の記録を返す (初めてのクライアントは seq の直前まで実行済みとみなす)"""
+        state = self._clients.get(client)
+        if state is None:
+            state = self._clients[client] = _ClientState(seq - 1)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client)
+        return state
@@ -0,0 +1,65 @@
+# /command と /batch のリクエストとレスポンスのボディの形式 (JSON / MessagePack / CBOR)
+#
+# クライアントは Accept ヘッダーで返してほしい形式を、Content-Type ヘッダーで送ったボディの形式を指定します。
+# MessagePack と CBOR はオプションで、msgpack / cbor2 パッケージがない場合は JSON だけを使います。
+# バイナリの形式では、getBlocks などの uint8 / uint16 の配列を base64 にせずバイト列のまま送ります。
+
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+CBOR = "application/cbor"
+# 同じ形式を表す別のメディアタイプ
+_ALIASES = {"application/x-msgpack": MSGPACK, "application/vnd.msgpack": MSGPACK}
+
+
+def available():
+    """この環境で使えるメディアタイプ (別名を含む、優先する順)"""
+    types = [JSON]
+    if msgpack is not None:
+        types += [MSGPACK, *_ALIASES]
+    if cbor2 is not None:
+        types.append(CBOR)
+    return types
+
+
+def canonical(mimetype):
+    """メディアタイプの別名を正式な名前にする (知らない形式はそのまま返す)"""
+    return _ALIASES.get(mimetype, mimetype)
+
+
+def is_binary(fmt):
+    return fmt in (MSGPACK, CBOR)
+
+
+def encode(obj, fmt=JSON):
+    """obj を fmt の形式のバイト列にする"""
+    if fmt == MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    if fmt == CBOR:
+        return cbor2.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def decode(data, fmt=JSON):
+    """fmt の形式のバイト列を読み込む (不正なデータや使えない形式は ValueError)"""
+    if fmt not in available():
+        raise ValueError(f"unsupported format: {fmt}")
+    try:
+        if fmt == MSGPACK:
+            return msgpack.unpackb(data)
+        if fmt == CBOR:
+            return cbor2.loads(data)
+        return json.loads(data)
+    except Exception as e:
+        raise ValueError(f"invalid {fmt} body: {e}") from e
@@ -0,0 +1,147 @@
+# 図形 (線、球、円柱、多角形、テンプレート) をブリッジ側でボクセルに変換する (NumPy が必要)
+#
+# Scratch 側でボクセルを計算して1つずつ setBlock を送る代わりに、図形のパラメータだけを受け取り、
+# ここで NumPy を使ってまとめてボクセル化します。
+# ボクセルは x 方向の連続 (ラン) を求め、同じ範囲のランを隣の行、隣の層と順に結合して
+# 直方体に分解するので、半径20の球 (約3万6千ブロック) でも setBlocks は数百回で済みます。
+#
+# 座標の配列はすべて (x, y, z) の列を持つ N x 3 の整数配列です。
+
+import numpy as np
+
+# 軸の並べ方 (ランを作る軸、次に結合する軸、最後に結合する軸) の候補
+_AXIS_ORDERS = ((0, 2, 1), (0, 1, 2), (2, 0, 1), (2, 1, 0), (1, 0, 2), (1, 2, 0))
+
+
+def _merge(spans, keys, lo, hi):
+    """keys の列が等しく、lo..hi の範囲が隣り合う行を1つにまとめる"""
+    order = np.lexsort([spans[:, lo]] + [spans[:, key] for key in reversed(keys)])
+    spans = spans[order]
+    joined = np.all(spans[1:, keys] == spans[:-1, keys], axis=1) & (spans[1:, lo] == spans[:-1, hi] + 1)
+    first = np.concatenate(([True], ~joined))
+    last = np.concatenate((first[1:], [True]))
+    merged = spans[first]
+    merged[:, hi] = spans[last, hi]
+    return merged
+
+
+def _boxes_for_order(points, order):
+    a, b, c = order
+    # 列: a1, a2, b1, b2, c1, c2 (まず a 方向のランを作り、b 方向、c 方向の順に結合する)
+    spans = np.column_stack([points[:, a], points[:, a], points[:, b], points[:, b], points[:, c], points[:, c]])
+    spans = _merge(spans, [2, 4], 0, 1)
+    spans = _merge(spans, [0, 1, 4], 2, 3)
+    spans = _merge(spans, [0, 1, 2, 3], 4, 5)
+    boxes = np.empty_like(spans)
+    boxes[:, [a, a + 3]] = spans[:, [0, 1]]
+    boxes[:, [b, b + 3]] = spans[:, [2, 3]]
+    boxes[:, [c, c + 3]] = spans[:, [4, 5]]
+    return boxes
+
+
+def decompose(points):
+    """座標の集合を、それをちょうど埋める直方体 (x1, y1, z1, x2, y2, z2) のリストに分解する
+
+    軸の並べ方をすべて試し、直方体の数が最も少ないものを返します。
+    """
+    points = np.unique(np.asarray(points, dtype=np.int64).reshape(-1, 3), axis=0)
+    if len(points) == 0:
+        return []
+    best = min((_boxes_for_order(points, order) for order in _AXIS_ORDERS), key=len)
+    return [tuple(int(value) for value in box) for box in best]
+
+
+def _mask_points(mask, origin):
+    """[y, z, x] の順の真偽値配列の真の要素を、origin からの座標の配列にする"""
+    y, z, x = np.nonzero(mask)
+    return np.column_stack([x, y, z]) + np.asarray(origin, dtype=np.int64)
+
+
+def _shell(mask, axes=(0, 1, 2)):
+    """塗りつぶした立体の表面 (axes 方向の隣のいずれかが外側にあるボクセル) だけを残す"""
+    padded = np.pad(mask, 1)
+    inner = padded[1:-1, 1:-1, 1:-1].copy()
+    for axis in axes:
+        for shift in (1, -1):
+            inner &= np.roll(padded, shift, axis=axis)[1:-1, 1:-1, 1:-1]
+    return mask & ~inner
+
+
+def line(x1, y1, z1, x2, y2, z2):
+    """2点を結ぶ線のボクセル (最も長い軸で1ブロックずつ進む DDA)"""
+    start = np.array([x1, y1, z1], dtype=np.float64)
+    delta = np.array([x2, y2, z2], dtype=np.float64) - start
+    steps = int(np.abs(delta).max())
+    if steps == 0:
+        return start.astype(np.int64).reshape(1, 3)
+    t = np.arange(steps + 1, dtype=np.float64)[:, None] / steps
+    return np.floor(start + delta * t + 0.5).astype(np.int64)
+
+
+def sphere(x, y, z, radius, hollow=False):
+    """中心 (x, y, z)、半径 radius の球のボクセル"""
+    r = np.arange(-radius, radius + 1)
+    dy, dz, dx = np.meshgrid(r, r, r, indexing='ij', sparse=True)
+    mask = dx * dx + dy * dy + dz * dz <= (radius + 0.5) ** 2
+    if hollow:
+        mask = _shell(mask)
+    return _mask_points(mask, (x - radius, y - radius, z - radius))
+
+
+def cylinder(x, y, z, radius, height, hollow=False):
+    """底面の中心 (x, y, z)、半径 radius、高さ height (負なら下向き) の縦向きの円柱のボクセル"""
+    r = np.arange(-radius, radius + 1)
+    dz, dx = np.meshgrid(r, r, indexing='ij', sparse=True)
+    disk = dx * dx + dz * dz <= (radius + 0.5) ** 2
+    if hollow:
+        # 円の縁だけを残す (上下のふたは作らない)
+        disk = _shell(disk[None], axes=(1, 2))[0]
+    count = abs(height)
+    mask = np.broadcast_to(disk, (count,) + disk.shape)
+    bottom = y if height > 0 else y - count + 1
+    return _mask_points(mask, (x - radius, bottom, z - radius))
+
+
+def polygon(points, y):
+    """高さ y の水平面上で、頂点 [(x, z), ...] の多角形の内部と辺を塗りつぶしたボクセル"""
+    vertices = np.asarray(points, dtype=np.float64)
+    (x_min, z_min), (x_max, z_max) = vertices.min(axis=0).astype(np.int64), vertices.max(axis=0).astype(np.int64)
+    zs, xs = np.mgrid[z_min:z_max + 1, x_min:x_max + 1]
+    # ブロックの中心が多角形の内側にあるか (偶奇規則)
+    inside = np.zeros(xs.shape, dtype=bool)
+    for (ax, az), (bx, bz) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        if az == bz:
+            continue
+        crosses = (az > zs) != (bz > zs)
+        x_cross = ax + (zs - az) * (bx - ax) / (bz - az)
+        inside ^= crosses & (xs < x_cross)
+    interior = np.column_stack([xs[inside], np.full(inside.sum(), y), zs[inside]])
+    edges = [line(ax, y, az, bx, y, bz) for (ax, az), (bx, bz) in zip(points, list(points[1:]) + list(points[:1]))]
+    return np.concatenate([interior.astype(np.int64)] + edges)
+
+
+def template_boxes(x, y, z, size, blocks, include_air=False):
+    """テンプレート (y, z, x の順のブロックIDの並び) を置く直方体をブロックIDごとに返す
+
+    戻り値は {block_id: [(x1, y1, z1, x2, y2, z2), ...]} です。
+    """
+    dx, dy, dz = size
+    grid = np.asarray(blocks, dtype=np.int64).reshape(dy, dz, dx)
+    result = {}
+    for block_id in np.unique(grid):
+        if block_id == 0 and not include_air:
+            continue
+        result[int(block_id)] = decompose(_mask_points(grid == block_id, (x, y, z)))
+    return result
+
+
+def diff_boxes(x, y, z, size, saved, current):
+    """saved (y, z, x の順のブロックIDの並び) と current が異なる場所を saved に戻す直方体をブロックIDごとに返す
+
+    戻り値は template_boxes と同じ {block_id: [(x1, y1, z1, x2, y2, z2), ...]} です (空気も含む)。
+    """
+    dx, dy, dz = size
+    saved = np.asarray(saved, dtype=np.int64).reshape(dy, dz, dx)
+    changed = saved != np.asarray(current, dtype=np.int64).reshape(dy, dz, dx)
+    return {int(block_id): decompose(_mask_points(changed & (saved == block_id), (x, y, z)))
+            for block_id in np.unique(saved[changed])}
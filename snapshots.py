@@ -0,0 +1,155 @@
+# 直方体の範囲のブロックIDを保存するスナップショット (snapshotRegion / restoreRegion)
+#
+# ファイルの形式 (数値はすべてリトルエンディアン):
+#   ヘッダー   : マジック "MCSNAP1\0"、最小の角 (x, y, z)、大きさ (x, y, z)、1つのまとまりの層の数
+#   目次       : まとまりごとの (ファイル内の位置, 長さ)
+#   データ     : まとまりごとに zlib で圧縮した uint16 の配列 (y, z, x の順、x が最も速く変わる)
+# まとまりは下から順に「層の数」ずつの y の層で、最後のまとまりだけ層が少ないことがあります。
+#
+# 読み込むときはファイルを mmap で開き、まとまりを1つずつ必要になったときに展開するので、
+# 大きな範囲でもメモリには1つのまとまりの分しか展開しません。
+
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+
+MAGIC = b"MCSNAP1\0"
+_HEADER = struct.Struct("<8s3i3II")
+_INDEX_ENTRY = struct.Struct("<QI")
+# スナップショットの名前 (ファイル名になるので、使える文字を制限する)
+_NAME = re.compile(r"[A-Za-z0-9_-]{1,64}")
+SUFFIX = ".snap"
+
+
+def is_valid_name(name):
+    return isinstance(name, str) and _NAME.fullmatch(name) is not None
+
+
+def _pack(values):
+    packed = array('H', values)
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return zlib.compress(packed.tobytes(), 6)
+
+
+def _unpack(data):
+    packed = array('H')
+    packed.frombytes(zlib.decompress(data))
+    if sys.byteorder == 'big':
+        packed.byteswap()
+    return packed
+
+
+def write_snapshot(path, origin, size, layers, slabs):
+    """slabs (下のまとまりから順に、ブロックIDのリストを返すイテレーター) をファイルに書き込み、ファイルの大きさを返す
+
+    書き込みは一時ファイルに行い、最後に置き換えるので、途中で失敗しても前のスナップショットは残ります (一時ファイルは削除します)。
+    """
+    dx, dy, dz = size
+    count = -(-dy // layers)
+    temp = f"{path}.tmp"
+    try:
+        with open(temp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, *origin, dx, dy, dz, layers))
+            index_at = f.tell()
+            f.write(b"\0" * (_INDEX_ENTRY.size * count))
+            index = []
+            for number, values in enumerate(slabs):
+                expected = dx * dz * min(layers, dy - number * layers)
+                if len(values) != expected:
+                    raise ValueError(f"slab {number} has {len(values)} blocks, expected {expected}")
+                data = _pack(values)
+                index.append((f.tell(), len(data)))
+                f.write(data)
+            if len(index) != count:
+                raise ValueError(f"expected {count} slabs, got {len(index)}")
+            f.seek(index_at)
+            for entry in index:
+                f.write(_INDEX_ENTRY.pack(*entry))
+            f.flush()
+            os.fsync(f.fileno())
+            length = f.seek(0, os.SEEK_END)
+        os.replace(temp, path)
+    except BaseException:
+        # 失敗した一時ファイルを SNAPSHOT_DIR に残さない
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+    return length
+
+
+class Snapshot:
+    """mmap で開いたスナップショットのファイル"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ValueError(f"empty snapshot file: {path}")
+        try:
+            magic, x, y, z, dx, dy, dz, layers = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC or layers < 1:
+                raise ValueError(f"not a snapshot file: {path}")
+            self.origin = (x, y, z)
+            self.size = (dx, dy, dz)
+            self.layers = layers
+            count = -(-dy // layers)
+            self._index = [_INDEX_ENTRY.unpack_from(self._map, _HEADER.size + i * _INDEX_ENTRY.size)
+                           for i in range(count)]
+        except (struct.error, ValueError):
+            self._map.close()
+            raise ValueError(f"not a snapshot file: {path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._map.close()
+
+    @property
+    def volume(self):
+        dx, dy, dz = self.size
+        return dx * dy * dz
+
+    def __len__(self):
+        return len(self._index)
+
+    def slab(self, number):
+        """number 番目のまとまりを (最初の層の y, 層の数, ブロックIDの配列) で返す"""
+        offset, length = self._index[number]
+        values = _unpack(self._map[offset:offset + length])
+        dx, dy, dz = self.size
+        layers = min(self.layers, dy - number * self.layers)
+        if len(values) != dx * dz * layers:
+            raise ValueError(f"corrupt snapshot slab {number}")
+        return self.origin[1] + number * self.layers, layers, values
+
+
+class SnapshotStore:
+    """ディレクトリにスナップショットを名前で保存する"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def path(self, name):
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def exists(self, name):
+        return os.path.isfile(self.path(name))
+
+    def save(self, name, origin, size, layers, slabs):
+        os.makedirs(self.directory, exist_ok=True)
+        return write_snapshot(self.path(name), origin, size, layers, slabs)
+
+    def open(self, name):
+        return Snapshot(self.path(name))
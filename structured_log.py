@@ -0,0 +1,114 @@
+# JSON Lines 形式の構造化ログを、バックグラウンドのスレッドで書き出す
+#
+# リクエストを処理するスレッドはログのレコードをキューに入れるだけで、
+# メッセージの組み立てと標準出力 (SD カードなど) への書き込みは QueueListener のスレッドが行います。
+# 頻繁なコマンド (setBlock など) のログはコマンドごとに間引くことができます。
+#
+# 各モジュールは logging.getLogger(__name__) でロガーを取得し、
+# 構造化したい値は extra={"command": ..., ...} で渡します。
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# LogRecord が標準で持つ属性 (これ以外の属性を extra として出力する)
+_STANDARD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """レコードを1行の JSON にする"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class CommandSampler(logging.Filter):
+    """extra に command を持つ WARNING 未満のレコードを、コマンドごとに N 件に1件だけ通す
+
+    rates は {コマンド名: N} で、"*" はそれ以外のコマンドに使います。
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = dict(rates)
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        command = getattr(record, "command", None)
+        if command is None or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(command, self.rates.get("*", 1))
+        if rate <= 1:
+            return True
+        with self._lock:
+            count = self._counts.get(command, 0)
+            self._counts[command] = count + 1
+        return count % rate == 0
+
+
+def parse_sample_rates(text):
+    """"setBlock=100,getBlock=10,*=1" を {コマンド名: N} に変換する"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = int(rate)
+    return rates
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """レコードをそのままキューに入れる (メッセージの組み立ても書き出し側のスレッドで行う)"""
+
+    def prepare(self, record):
+        return record
+
+
+_listener = None
+
+
+def setup_logging(level="INFO", sample="", fmt="json", stream=None):
+    """ルートロガーにキュー経由のハンドラーを設定し、書き出し用のスレッドを起動する
+
+    2回目以降の呼び出しでは何もしません。
+    """
+    global _listener
+    if _listener is not None:
+        return _listener
+    output = logging.StreamHandler(stream if stream is not None else sys.stdout)
+    if fmt == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        formatter.converter = time.gmtime
+        output.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    rates = parse_sample_rates(sample)
+    if rates:
+        handler.addFilter(CommandSampler(rates))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(handler)
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # 終了時にキューに残っているレコードを書き出す
+    atexit.register(_listener.stop)
+    return _listener
@@ -1,6 +1,19 @@
+import socket
+import threading
+from types import SimpleNamespace
+
 import pytest
 from flask import Flask, jsonify
 from app import app as flask_app # app.py から Flask アプリケーションインスタンスをインポート
+import app as app_module
+import commands
+from app import create_minecraft, handle_ws_message, shutdown
+from connection import ConnectionManager
+from events import EventPoller
+from journal import CommandJournal, read_journal
+from scheduler import FairScheduler
+from sequencing import ClientSequencer
+from write_buffer import BlockWriteBuffer
 from mcpi.minecraft import Minecraft # モック対象のクラスをインポート
 
 # pytest フィクスチャ: テスト用の Flask クライアントを提供
@@ -14,9 +27,9 @@ def client():
 # mocker は pytest-mock によって提供されるフィクスチャ
 @pytest.fixture
 def mock_minecraft(mocker):
-    # app.Minecraft.create をモックし、モックされたインスタンスを返すように設定
+    # Minecraft.create をモックし、モックされたインスタンスを返すように設定 (app は接続するときに mcpi を読み込む)
     mock_mc_instance = mocker.MagicMock(spec=Minecraft)
-    mocker.patch('app.Minecraft.create', return_value=mock_mc_instance)
+    mocker.patch('mcpi.minecraft.Minecraft.create', return_value=mock_mc_instance)
 
     # app モジュール内のグローバル変数 mc もモックされたインスタンスに置き換える
     # これにより、リクエストハンドラ内で正しいモックが使用される
@@ -439,17 +452,25 @@ def test_command_world_setting_invalid_status(client, mock_minecraft):
     mock_minecraft.world.setting.assert_not_called()
 
 def test_command_poll_block_hits_with_args(client, mock_minecraft):
-    """pollBlockHits に引数が渡された場合にエラーを返すかテスト"""
-    response = client.post('/command', json={"command": "pollBlockHits", "args": [1]})
+    """pollBlockHits に余分な引数や範囲外の limit が渡された場合にエラーを返すかテスト"""
+    response = client.post('/command', json={"command": "pollBlockHits", "args": [1, 2]})
     assert response.status_code == 400
-    assert b"pollBlockHits does not take any arguments" in response.data
+    assert b"Incorrect number of arguments for pollBlockHits (expected 0 or 1)" in response.data
+    for limit in (0, 501, "x", None):
+        response = client.post('/command', json={"command": "pollBlockHits", "args": [limit]})
+        assert response.status_code == 400
+        assert b"Invalid limit for pollBlockHits" in response.data
     mock_minecraft.events.pollBlockHits.assert_not_called()
 
 def test_command_poll_chat_posts_with_args(client, mock_minecraft):
-    """pollChatPosts に引数が渡された場合にエラーを返すかテスト"""
-    response = client.post('/command', json={"command": "pollChatPosts", "args": [1]})
+    """pollChatPosts に余分な引数や範囲外の limit が渡された場合にエラーを返すかテスト"""
+    response = client.post('/command', json={"command": "pollChatPosts", "args": [1, 2]})
     assert response.status_code == 400
-    assert b"pollChatPosts does not take any arguments" in response.data
+    assert b"Incorrect number of arguments for pollChatPosts (expected 0 or 1)" in response.data
+    for limit in (0, 501, "x", None):
+        response = client.post('/command', json={"command": "pollChatPosts", "args": [limit]})
+        assert response.status_code == 400
+        assert b"Invalid limit for pollChatPosts" in response.data
     mock_minecraft.events.pollChatPosts.assert_not_called()
 
 def test_command_clear_events_with_args(client, mock_minecraft):
@@ -497,7 +518,7 @@ def test_command_invalid_json(client):
 def test_minecraft_connection_error(mocker, client):
     """Minecraft 接続時に例外が発生するケースをテスト"""
     # Minecraft.create が例外を送出するようにモック
-    mocker.patch('app.Minecraft.create', side_effect=Exception("Connection refused"))
+    mocker.patch('mcpi.minecraft.Minecraft.create', side_effect=Exception("Connection refused"))
     # mc を None に設定 (接続失敗時の挙動)
     mocker.patch('app.mc', None)
 
@@ -506,3 +527,532 @@ def test_minecraft_connection_error(mocker, client):
     response = client.post('/command', json={"command": "postToChat", "args": ["Test"]})
     assert response.status_code == 503
     assert b"Minecraft not connected" in response.data
+
+# --- Batch Endpoint Tests ---
+
+def test_batch_success(client, mock_minecraft):
+    """'/batch' で複数のコマンドが順番に実行され、結果がまとめて返るかテスト"""
+    mock_minecraft.getBlock.return_value = 1
+    response = client.post('/batch', json={"commands": [
+        {"command": "setBlock", "args": [1, 2, 3, 4]},
+        {"command": "postToChat", "args": ["hi"]},
+        {"command": "getBlock", "args": [1, 2, 3]},
+    ]})
+    assert response.status_code == 200
+    json_data = response.get_json()
+    assert json_data['status'] == 'success'
+    results = json_data['results']
+    assert len(results) == 3
+    assert results[0]['message'] == "Set block at (1,2,3) to 4"
+    assert results[1]['message'] == "Posted 'hi' to chat"
+    assert results[2]['block_id'] == 1
+    assert all(result['code'] == 200 for result in results)
+    mock_minecraft.setBlock.assert_called_once_with(1, 2, 3, 4)
+    mock_minecraft.postToChat.assert_called_once_with("hi")
+
+def test_batch_accepts_plain_list(client, mock_minecraft):
+    """'/batch' がコマンドのリストをそのまま受け付けるかテスト"""
+    response = client.post('/batch', json=[{"command": "clearEvents", "args": []}])
+    assert response.status_code == 200
+    assert response.get_json()['results'][0]['message'] == "Cleared all events"
+
+def test_batch_validates_before_executing(client, mock_minecraft):
+    """'/batch' に不正なコマンドが含まれる場合、何も実行せずにエラーを返すかテスト"""
+    response = client.post('/batch', json={"commands": [
+        {"command": "setBlock", "args": [1, 2, 3, 4]},
+        {"command": "setBlock", "args": [1, 2, "x", 4]},
+        {"command": "unknownAction"},
+    ]})
+    assert response.status_code == 400
+    json_data = response.get_json()
+    assert json_data['status'] == 'error'
+    assert [error['index'] for error in json_data['errors']] == [1, 2]
+    assert "Invalid arguments for setBlock" in json_data['errors'][0]['message']
+    mock_minecraft.setBlock.assert_not_called()
+
+def test_batch_reports_per_item_failure(client, mock_minecraft):
+    """'/batch' の途中でMinecraftのエラーが起きても、他のコマンドの結果が返るかテスト"""
+    mock_minecraft.getHeight.side_effect = Exception("boom")
+    response = client.post('/batch', json={"commands": [
+        {"command": "getHeight", "args": [0, 0]},
+        {"command": "setBlock", "args": [0, 0, 0, 1]},
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert results[0]['code'] == 500
+    assert "Minecraft command failed: boom" in results[0]['message']
+    assert results[1]['code'] == 200
+    mock_minecraft.setBlock.assert_called_once_with(0, 0, 0, 1)
+
+def test_batch_invalid_json(client, mock_minecraft):
+    """'/batch' にコマンドのリスト以外が送信された場合にエラーを返すかテスト"""
+    response = client.post('/batch', json={"command": "setBlock"})
+    assert response.status_code == 400
+    assert b"Invalid JSON" in response.data
+
+def test_batch_minecraft_not_connected(client, mocker):
+    """'/batch' で Minecraft に接続されていない場合にエラーを返すかテスト"""
+    mocker.patch('app.mc', None)
+    response = client.post('/batch', json=[{"command": "postToChat", "args": ["Test"]}])
+    assert response.status_code == 503
+
+# --- WebSocket Message Tests ---
+
+def test_ws_message_success(mock_minecraft):
+    """WebSocket のメッセージが実行され、同じ id で返信されるかテスト"""
+    mock_minecraft.getHeight.return_value = 12
+    reply = handle_ws_message('{"id": 7, "command": "getHeight", "args": [1, 2]}')
+    assert reply == {"status": "success", "height": 12, "id": 7, "code": 200}
+    mock_minecraft.getHeight.assert_called_once_with(1, 2)
+
+def test_ws_message_invalid_command(mock_minecraft):
+    """WebSocket で不正なコマンドを送信した場合にエラーが返るかテスト"""
+    reply = handle_ws_message('{"id": "a", "command": "setBlock", "args": [1]}')
+    assert reply['id'] == "a"
+    assert reply['code'] == 400
+    assert "Incorrect number of arguments for setBlock" in reply['message']
+    mock_minecraft.setBlock.assert_not_called()
+
+def test_ws_message_invalid_json(mock_minecraft):
+    """WebSocket で無効な JSON を送信した場合にエラーが返るかテスト"""
+    reply = handle_ws_message("this is not json")
+    assert reply['code'] == 400
+    assert reply['message'] == "Invalid JSON"
+
+# --- Event Stream Tests ---
+
+@pytest.fixture
+def event_poller(mocker, mock_minecraft):
+    """バックグラウンドのイベントポーラーを (スレッドを起動せずに) 有効にする"""
+    poller = EventPoller(lambda: mock_minecraft, threading.RLock())
+    mocker.patch('app.event_poller', poller)
+    mocker.patch('commands.event_poller', poller)
+    return poller
+
+def test_events_not_running(client):
+    """イベントポーラーが無効な場合は /events が 503 を返すかテスト"""
+    response = client.get('/events')
+    assert response.status_code == 503
+    assert b"Event poller is not running" in response.data
+
+def test_events_since_cursor(client, event_poller):
+    """/events がカーソルより新しいイベントだけを返すかテスト"""
+    event_poller.log.extend('blockHit', [(1, 0, 0, 1, 10, 0), (2, 0, 0, 1, 10, 0)])
+    event_poller.log.extend('chatPost', [(11, 0, "hi")])
+    response = client.get('/events?since=1')
+    assert response.status_code == 200
+    json_data = response.get_json()
+    assert json_data['cursor'] == 3
+    assert [event['seq'] for event in json_data['events']] == [2, 3]
+
+    response = client.get('/events?since=0&type=chatPost')
+    assert [event['kind'] for event in response.get_json()['events']] == ['chatPost']
+
+def test_events_pagination(client, event_poller):
+    """/events が limit 件ずつ返し、残りがあれば more が true になるかテスト"""
+    event_poller.log.extend('blockHit', [(x, 0, 0, 1, 10, 0) for x in range(5)])
+    json_data = client.get('/events?since=0&limit=2').get_json()
+    assert [event['pos']['x'] for event in json_data['events']] == [0, 1]
+    assert json_data['cursor'] == 2 and json_data['more'] is True
+    json_data = client.get('/events?since=4&limit=2').get_json()
+    assert [event['pos']['x'] for event in json_data['events']] == [4]
+    assert json_data['more'] is False
+    assert client.get('/events?limit=0').status_code == 400
+
+def test_events_invalid_params(client, event_poller):
+    """/events に不正なパラメータを渡した場合にエラーを返すかテスト"""
+    assert client.get('/events?since=abc').status_code == 400
+    assert client.get('/events?type=explosion').status_code == 400
+
+def test_poll_commands_share_events(client, event_poller, mock_minecraft):
+    """ポーラー有効時に pollBlockHits がゲームではなくポーラーから読み出すかテスト"""
+    event_poller.log.extend('blockHit', [(1, 2, 3, 1, 10, 4)])
+    response = client.post('/command', json={"command": "pollBlockHits", "args": []})
+    assert response.get_json()['hits'] == [{"type": 4, "pos": {"x": 1, "y": 2, "z": 3}, "face": 1, "entityId": 10}]
+    mock_minecraft.events.pollBlockHits.assert_not_called()
+    # 同じイベントは /events からも読める
+    assert len(client.get('/events').get_json()['events']) == 1
+
+def test_poll_commands_page_through_backlog(client, mock_minecraft, mocker):
+    """ポーラーがない場合も、ゲームのイベントを上限付きのバッファに移して少しずつ返すかテスト"""
+    from events import MAX_PAGE, EventLog, EventQueue
+    mocker.patch('commands.event_backlog', EventQueue(EventLog(capacity=MAX_PAGE * 2)))
+    hits = []
+    for x in range(MAX_PAGE + 3):
+        hit = mocker.MagicMock(type=0, face=1, entityId=10)
+        hit.pos.x, hit.pos.y, hit.pos.z = x, 0, 0
+        hits.append(hit)
+    mock_minecraft.events.pollBlockHits.side_effect = [hits, []]
+    first = client.post('/command', json={"command": "pollBlockHits", "args": []}).get_json()
+    assert len(first['hits']) == MAX_PAGE and first['more'] is True
+    second = client.post('/command', json={"command": "pollBlockHits", "args": []}).get_json()
+    assert [hit['pos']['x'] for hit in second['hits']] == [MAX_PAGE, MAX_PAGE + 1, MAX_PAGE + 2]
+    assert 'more' not in second
+    # limit を指定すると、その件数ずつ返す
+    mock_minecraft.events.pollBlockHits.side_effect = None
+    mock_minecraft.events.pollBlockHits.return_value = hits[:3]
+    limited = client.post('/command', json={"command": "pollBlockHits", "args": [2]}).get_json()
+    assert [hit['pos']['x'] for hit in limited['hits']] == [0, 1] and limited['more'] is True
+    mock_minecraft.events.pollBlockHits.return_value = []
+    limited = client.post('/command', json={"command": "pollBlockHits", "args": ["2"]}).get_json()
+    assert [hit['pos']['x'] for hit in limited['hits']] == [2] and 'more' not in limited
+    mock_minecraft.events.pollChatPosts.return_value = [mocker.MagicMock(type=0, entityId=11, message="hi")]
+    response = client.post('/command?terse=1', json={"command": "pollChatPosts", "args": []})
+    assert response.get_json() == {"status": "success", "posts": [[11, "hi"]]}
+
+def test_ws_subscribe_events(event_poller):
+    """WebSocket の subscribeEvents が購読を開始するかテスト"""
+    subscriptions = []
+    subscribe = lambda since, kinds: subscriptions.append((since, kinds)) or True
+    reply = handle_ws_message('{"id": 1, "command": "subscribeEvents", "args": [5, "blockHit"]}', subscribe)
+    assert reply == {"status": "success", "cursor": 5, "id": 1, "code": 200}
+    assert subscriptions == [(5, {"blockHit"})]
+
+# --- Connection Management Tests ---
+
+def test_command_socket_error_triggers_reconnect(client, mock_minecraft, mocker):
+    """ソケットのエラーが起きた場合に接続が切断扱いになるかテスト"""
+    mark_failed = mocker.patch('app.connection.mark_failed')
+    mock_minecraft.setBlock.side_effect = BrokenPipeError("broken pipe")
+    response = client.post('/command', json={"command": "setBlock", "args": [1, 2, 3, 4]})
+    assert response.status_code == 500
+    mark_failed.assert_called_once()
+    assert mark_failed.call_args[0][0] is mock_minecraft
+
+def test_command_waits_for_reconnect(client, mocker):
+    """未接続の場合に、再接続されればコマンドが実行されるかテスト"""
+    mock_mc = mocker.MagicMock()
+    mocker.patch('app.mc', None)
+    def reconnect(timeout):
+        mocker.patch('app.mc', mock_mc)
+        return True
+    mocker.patch('app.connection.wait_connected', side_effect=reconnect)
+    response = client.post('/command', json={"command": "postToChat", "args": ["Test"]})
+    assert response.status_code == 200
+    mock_mc.postToChat.assert_called_once_with("Test")
+
+# --- スケジューラーのテスト ---
+
+def test_command_rate_limited(client, mock_minecraft, mocker):
+    """レート制限を超えたクライアントに 429 と Retry-After を返し、他のクライアントは実行できるかテスト"""
+    mocker.patch('app.scheduler', FairScheduler(rate=1, burst=1))
+    response = client.post('/command', json={"command": "postToChat", "args": ["hi"]}, headers={"X-Client-Id": "tab-1"})
+    assert response.status_code == 200
+    response = client.post('/command', json={"command": "postToChat", "args": ["hi"]}, headers={"X-Client-Id": "tab-1"})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert response.get_json()["message"].startswith("Rate limit exceeded")
+    response = client.post('/batch', json=[{"command": "postToChat", "args": ["hi"]}], headers={"X-Client-Id": "tab-2"})
+    assert response.status_code == 200
+    assert mock_minecraft.postToChat.call_count == 2
+
+# --- /metrics のテスト ---
+
+def test_metrics(client, mock_minecraft):
+    """コマンドの回数、エラー、処理時間と接続状態が /metrics に出力されるかテスト"""
+    client.post('/command', json={"command": "postToChat", "args": ["hi"]})
+    client.post('/command', json={"command": "setBlock", "args": [1]})
+    client.post('/command', json={"command": "noSuchCommand", "args": []})
+    client.post('/batch', json=[{"command": "postToChat", "args": ["hi"]}])
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    text = response.get_data(as_text=True)
+    assert 'bridge_requests_total{command="batch"}' in text
+    assert 'bridge_errors_total{command="setBlock",code="400"}' in text
+    assert 'bridge_errors_total{command="unknown",code="400"}' in text
+    assert 'bridge_request_seconds_bucket{command="postToChat",le="+Inf"}' in text
+    assert 'bridge_game_seconds_count{command="postToChat"}' in text
+    assert 'bridge_in_flight_requests 0' in text
+    assert 'bridge_minecraft_connected ' in text
+
+# --- Minecraft への接続のテスト ---
+
+def test_create_minecraft_disables_nagle(mocker):
+    """Minecraft へのソケットで Nagle アルゴリズムが無効になるかテスト"""
+    listener = socket.create_server(("127.0.0.1", 0))
+    sock = socket.create_connection(listener.getsockname())
+    other, _ = listener.accept()
+    listener.close()
+    fake_mc = SimpleNamespace(conn=SimpleNamespace(socket=sock), postToChat=mocker.MagicMock())
+    mocker.patch('mcpi.minecraft.Minecraft.create', return_value=fake_mc)
+    try:
+        assert create_minecraft() is fake_mc
+        assert sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY) != 0
+    finally:
+        sock.close()
+        other.close()
+
+def test_shutdown_flushes_write_buffer(mocker, mock_minecraft):
+    """終了時に、ためている setBlock を送信してから接続を閉じるかテスト"""
+    buffer = BlockWriteBuffer(lambda: app_module.mc, app_module.mc_lock, delay=10)
+    buffer.set_block(mock_minecraft, 1, 2, 3, 4)
+    mocker.patch('commands.write_buffer', buffer)
+    mocker.patch('app.event_poller', None)
+    mocker.patch('app.stopping', threading.Event())
+    manager = mocker.patch('app.connection')
+    shutdown()
+    mock_minecraft.setBlock.assert_called_once_with(1, 2, 3, 4)
+    assert commands.write_buffer is None
+    assert app_module.stopping.is_set()
+    manager.stop.assert_called_once()
+    assert app_module.mc is None
+
+# --- 連番による再送の検出のテスト ---
+
+def test_command_retry_with_seq_runs_once(client, mock_minecraft, mocker):
+    """同じ seq で再送された postToChat が1回だけ実行され、同じレスポンスが返るかテスト"""
+    mocker.patch('app.sequencer', ClientSequencer())
+    body = {"command": "postToChat", "args": ["hi"], "seq": 1}
+    first = client.post('/command', json=body, headers={"X-Client-Id": "tab-1"})
+    again = client.post('/command', json=body, headers={"X-Client-Id": "tab-1"})
+    assert first.status_code == again.status_code == 200
+    assert first.get_json() == again.get_json()
+    mock_minecraft.postToChat.assert_called_once_with("hi")
+    # ボディの client でもクライアントを区別できる
+    client.post('/command', json=dict(body, client="tab-2"))
+    assert mock_minecraft.postToChat.call_count == 2
+    response = client.post('/batch', json={"commands": [{"command": "postToChat", "args": ["b"]}], "seq": 2},
+                           headers={"X-Client-Id": "tab-1"})
+    assert response.status_code == 200
+    client.post('/batch', json={"commands": [{"command": "postToChat", "args": ["b"]}], "seq": 2},
+                headers={"X-Client-Id": "tab-1"})
+    assert mock_minecraft.postToChat.call_count == 3
+    response = client.post('/command', json=dict(body, seq="x"), headers={"X-Client-Id": "tab-1"})
+    assert response.status_code == 400
+
+def test_command_seq_requires_client_id(client, mock_minecraft, mocker):
+    """X-Client-Id も client もない seq 付きのコマンドは、IP アドレスで区別せずに 400 になるかテスト"""
+    mocker.patch('app.sequencer', ClientSequencer())
+    for tab in ("from tab A", "from tab B"):
+        response = client.post('/command', json={"seq": 1, "command": "postToChat", "args": [tab]})
+        assert response.status_code == 400
+        assert "client id" in response.get_json()["message"]
+    mock_minecraft.postToChat.assert_not_called()
+    # seq がなければ今までどおり実行する
+    assert client.post('/command', json={"command": "postToChat", "args": ["hi"]}).status_code == 200
+    reply = handle_ws_message('{"id": 1, "seq": 1, "command": "postToChat", "args": ["ws"]}')
+    assert reply["code"] == 400
+    reply = handle_ws_message('{"id": 2, "seq": 1, "client": "tab-9", "command": "postToChat", "args": ["ws"]}')
+    assert reply["code"] == 200
+
+# --- MessagePack / CBOR と terse モードのテスト ---
+
+def test_command_msgpack_response(client, mock_minecraft, mocker):
+    """Accept で MessagePack を指定すると、uint8 の配列がバイト列のまま返るかテスト"""
+    import msgpack
+    mocker.patch('commands.read_region', return_value=[1, 2, 3])
+    response = client.post('/command', json={"command": "getBlocks", "args": [0, 0, 0, 2, 0, 0, "uint8"]},
+                           headers={"Accept": "application/msgpack"})
+    assert response.status_code == 200
+    assert response.mimetype == 'application/msgpack'
+    data = msgpack.unpackb(response.get_data())
+    assert data["blocks"] == b"\x01\x02\x03"
+    # JSON では今までどおり base64
+    response = client.post('/command', json={"command": "getBlocks", "args": [0, 0, 0, 2, 0, 0, "uint8"]})
+    assert response.get_json()["blocks"] == "AQID"
+
+def test_command_cbor_request_and_response(client, mock_minecraft):
+    """CBOR で送ったコマンドが実行され、CBOR で返るかテスト"""
+    import cbor2
+    body = cbor2.dumps({"command": "postToChat", "args": ["hi"]})
+    response = client.post('/command', data=body, content_type='application/cbor', headers={"Accept": "application/cbor"})
+    assert response.status_code == 200
+    assert cbor2.loads(response.get_data())["status"] == "success"
+    mock_minecraft.postToChat.assert_called_once_with("hi")
+    response = client.post('/command', data=b"\xff\xff", content_type='application/cbor')
+    assert response.status_code == 400
+
+def test_terse_mode(client, mock_minecraft, mocker):
+    """terse モードでは message が省かれ、イベントが配列で返るかテスト (エラーの message は残す)"""
+    response = client.post('/command?terse=1', json={"command": "setBlock", "args": [1, 2, 3, 4]})
+    assert response.get_json() == {"status": "success"}
+    hit = mocker.MagicMock(type=4, face=1, entityId=10)
+    hit.pos.x, hit.pos.y, hit.pos.z = 1, 2, 3
+    mock_minecraft.events.pollBlockHits.return_value = [hit]
+    response = client.post('/command', json={"command": "pollBlockHits", "args": [], "terse": True})
+    assert response.get_json() == {"status": "success", "hits": [[1, 2, 3, 1, 10]]}
+    response = client.post('/command?terse=1', json={"command": "setBlock", "args": [1]})
+    assert "message" in response.get_json()
+    response = client.post('/batch?terse=1', json=[{"command": "setBlock", "args": [1, 2, 3, 4]}])
+    assert response.get_json()["results"] == [{"status": "success", "code": 200}]
+
+# --- ジャーナルのテスト ---
+
+def test_journal_records_write_commands(client, mock_minecraft, mocker, tmp_path):
+    """成功した書き込み系のコマンドだけが、クライアントの識別子と一緒に記録されるかテスト"""
+    journal = CommandJournal(str(tmp_path))
+    mocker.patch('app.journal', journal)
+    mock_minecraft.getBlock.return_value = 1
+    client.post('/command', json={"command": "setBlock", "args": [1, 2, 3, 4]}, headers={"X-Client-Id": "tab-1"})
+    client.post('/command', json={"command": "getBlock", "args": [1, 2, 3]}, headers={"X-Client-Id": "tab-1"})
+    client.post('/command', json={"command": "setBlock", "args": [1]}, headers={"X-Client-Id": "tab-1"})
+    client.post('/batch', json=[{"command": "postToChat", "args": ["hi"]}], headers={"X-Client-Id": "tab-2"})
+    mock_minecraft.setBlocks.side_effect = OSError("broken pipe")
+    mocker.patch('app.connection')
+    client.post('/command', json={"command": "setBlocks", "args": [0, 0, 0, 1, 1, 1, 1]})
+    journal.stop()
+    assert [(record["client"], record["command"], record["args"]) for record in read_journal(str(tmp_path))] == [
+        ("tab-1", "setBlock", [1, 2, 3, 4]), ("tab-2", "postToChat", ["hi"])]
+
+# --- 複数のワールドのテスト ---
+
+@pytest.fixture
+def lab_world(mocker):
+    """WORLDS の "lab" ワールド (既定のワールドとは別のモックに接続済み)"""
+    from block_cache import WorldCache
+    from worlds import World
+    world = World("lab", "lab-host", 4711, mocker.MagicMock())
+    world.mc = mocker.MagicMock(spec=Minecraft)
+    world.state.world_cache = WorldCache(ttl=60)
+    mocker.patch.dict('app.worlds', {"lab": world})
+    return world
+
+def test_world_routing(client, mock_minecraft, lab_world):
+    """パスまたはボディの world で指定したワールドのサーバーとキャッシュが使われるかテスト"""
+    response = client.post('/w/lab/command', json={"command": "setBlock", "args": [1, 2, 3, 4]})
+    assert response.status_code == 200
+    lab_world.mc.setBlock.assert_called_once_with(1, 2, 3, 4)
+    mock_minecraft.setBlock.assert_not_called()
+    lab_world.mc.getBlock.return_value = 7
+    for _ in range(2):
+        response = client.post('/command', json={"command": "getBlock", "args": [5, 5, 5], "world": "lab"})
+        assert response.get_json()["block_id"] == 7
+    assert lab_world.mc.getBlock.call_count == 1
+    response = client.post('/batch', json={"commands": [{"command": "postToChat", "args": ["hi"]}], "world": "lab"})
+    assert response.status_code == 200
+    lab_world.mc.postToChat.assert_called_once_with("hi")
+    client.post('/command', json={"command": "postToChat", "args": ["default"]})
+    mock_minecraft.postToChat.assert_called_once_with("default")
+    assert commands.world_cache is None
+
+def test_unknown_world(client, mock_minecraft, lab_world):
+    """知らないワールドは 404 になるかテスト"""
+    response = client.post('/w/nope/command', json={"command": "postToChat", "args": ["hi"]})
+    assert response.status_code == 404
+    assert response.get_json()["message"] == "Unknown world: nope"
+    assert client.post('/command', json={"command": "postToChat", "args": ["hi"], "world": "nope"}).status_code == 404
+    assert client.get('/w/nope/events').status_code == 404
+    mock_minecraft.postToChat.assert_not_called()
+
+def test_world_inflight_limit(client, mock_minecraft, lab_world):
+    """ワールドの同時リクエストが上限に達すると 503 になり、他のワールドには影響しないかテスト"""
+    from worlds import InflightLimit
+    lab_world.limit = InflightLimit(1)
+    assert lab_world.limit.acquire()
+    response = client.post('/w/lab/command', json={"command": "postToChat", "args": ["hi"]})
+    assert response.status_code == 503
+    assert response.get_json()["message"] == "Too many requests for world lab"
+    assert lab_world.limit.rejected == 1
+    assert client.post('/command', json={"command": "postToChat", "args": ["hi"]}).status_code == 200
+    lab_world.limit.release()
+    assert client.post('/w/lab/command', json={"command": "postToChat", "args": ["hi"]}).status_code == 200
+
+def test_disconnected_world_does_not_affect_default(client, mock_minecraft, lab_world):
+    """接続できないワールドは 503 になり、既定のワールドはそのまま使えるかテスト"""
+    lab_world.mc = None
+    response = client.post('/w/lab/command', json={"command": "postToChat", "args": ["hi"]})
+    assert response.status_code == 503
+    assert client.post('/command', json={"command": "postToChat", "args": ["hi"]}).status_code == 200
+    response = client.get('/worlds')
+    assert [(world["name"], world["connected"]) for world in response.get_json()["worlds"]] == [
+        ("default", False), ("lab", False)]
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'bridge_world_inflight{world="lab"} 0' in text
+    assert 'bridge_world_connected{world="default"}' in text
+
+def test_journal_records_world(client, mock_minecraft, lab_world, mocker, tmp_path):
+    """既定以外のワールドのコマンドだけが、ワールドの名前と一緒に記録されるかテスト"""
+    journal = CommandJournal(str(tmp_path))
+    mocker.patch('app.journal', journal)
+    client.post('/command', json={"command": "setBlock", "args": [1, 2, 3, 4]})
+    client.post('/w/lab/command', json={"command": "setBlock", "args": [1, 2, 3, 5]})
+    journal.stop()
+    assert [record.get("world") for record in read_journal(str(tmp_path))] == [None, "lab"]
+
+# --- 起動と状態の確認のテスト ---
+
+def test_import_does_not_load_mcpi_or_numpy():
+    """app の読み込みで mcpi と NumPy を読み込まないかテスト (最初に使うときまで遅らせる)"""
+    import subprocess
+    import sys
+    code = "import sys, app; print('mcpi.minecraft' in sys.modules, 'numpy' in sys.modules)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["False", "False"]
+
+def test_healthz(client, mocker):
+    """/healthz は Minecraft に接続していなくても 200 を返すかテスト"""
+    mocker.patch('app.mc', None)
+    response = client.get('/healthz')
+    assert response.status_code == 200
+    assert response.get_json()["uptime"] >= 0
+
+def test_readyz(client, mock_minecraft, mocker):
+    """/readyz が接続と応答を確認して往復時間を返し、未接続や終了中は 503 になるかテスト"""
+    manager = ConnectionManager(lambda: mock_minecraft)
+    mocker.patch('app.connection', manager)
+    mocker.patch('app.stopping', threading.Event())
+    response = client.get('/readyz')
+    assert response.status_code == 503
+    assert response.get_json()["message"] == "Minecraft not connected"
+    manager.connect()
+    response = client.get('/readyz')
+    assert response.status_code == 200
+    assert response.get_json()["world"] == "default" and response.get_json()["rttMs"] >= 0
+    mock_minecraft.getHeight.assert_called_with(0, 0)
+    assert client.get('/w/nope/readyz').status_code == 404
+    app_module.stopping.set()
+    assert client.get('/readyz').status_code == 503
+
+def test_configure_connects_in_background(mocker, monkeypatch):
+    """configure() が接続を待たずに終わり、起動にかかった時間を /metrics に出すかテスト (SNAPSHOT_DIR は未設定で無効)"""
+    connected = threading.Event()
+    def slow_create(*args):
+        connected.wait(5)
+        return mocker.MagicMock()
+    mocker.patch('mcpi.minecraft.Minecraft.create', side_effect=slow_create)
+    manager = ConnectionManager(create_minecraft, lock=app_module.mc_lock, on_change=app_module.set_minecraft)
+    mocker.patch('app.connection', manager)
+    mocker.patch('app.mc', None)
+    mocker.patch('app.first_connect_seconds', None)
+    for name in ("EVENT_POLL_INTERVAL", "WRITE_BUFFER_DELAY_MS", "JOURNAL_DIR", "WORLDS", "SNAPSHOT_DIR"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setattr(commands, "player_state_cache", None)
+    monkeypatch.setattr(commands, "snapshot_store", None)
+    mocker.patch('app.scheduler', None)
+    mocker.patch('app.sequencer', None)
+    try:
+        app_module.configure()
+        assert app_module.mc is None and app_module.startup_seconds is not None
+        # SNAPSHOT_DIR を設定しなければスナップショットは無効
+        assert commands.snapshot_store is None
+        connected.set()
+        assert manager.wait_connected(5)
+        assert app_module.first_connect_seconds is not None
+        text = flask_app.test_client().get('/metrics').get_data(as_text=True)
+        assert 'bridge_startup_seconds ' in text and 'bridge_first_connect_seconds ' in text
+    finally:
+        connected.set()
+        manager.stop()
+
+def test_configure_world_ignores_per_worker_state_with_workers(monkeypatch, caplog):
+    """ワーカーが2つ以上の場合、キャッシュ、イベントのポーラー、重複の排除を警告して無効にするかテスト"""
+    for name, value in (("BLOCK_CACHE_TTL", "5"), ("EVENT_POLL_INTERVAL", "0.5"), ("DEDUP_WINDOW", "16")):
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv("WRITE_BUFFER_DELAY_MS", raising=False)
+    state = commands.WorldState()
+    scheduler, sequencer = app_module.configure_world(state, lambda: None, threading.RLock(), 2, "")
+    assert state.world_cache is None and state.event_poller is None and state.event_backlog is None
+    assert sequencer is None and scheduler is not None
+    for name in ("BLOCK_CACHE_TTL", "EVENT_POLL_INTERVAL", "DEDUP_WINDOW"):
+        assert f"{name} is ignored with 2 workers" in caplog.text
+
+def test_configure_world_native_get_blocks_opt_in(monkeypatch):
+    """world.getBlocks は NATIVE_GET_BLOCKS を true にした場合だけ使うかテスト"""
+    monkeypatch.delenv("NATIVE_GET_BLOCKS", raising=False)
+    state = commands.WorldState()
+    app_module.configure_world(state, lambda: None, threading.RLock(), 1, "")
+    assert state.native_get_blocks is False
+    monkeypatch.setenv("NATIVE_GET_BLOCKS", "true")
+    app_module.configure_world(state, lambda: None, threading.RLock(), 1, "")
+    assert state.native_get_blocks is True
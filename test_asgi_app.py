@@ -0,0 +1,165 @@
+import asyncio
+import json
+
+import asgi_app
+from aio_mcpi import AsyncMinecraft, AsyncMinecraftError, format_request
+
+# テスト用の簡易 mcpi サーバーの応答 (応答のないコマンドは記録するだけ)
+REPLIES = {
+    "world.getBlock": "7",
+    "world.getHeight": "63",
+    "player.getPos": "1.5,64.0,-3.25",
+    "events.block.hits": "1,2,3,1,10|4,5,6,2,11",
+    "events.chat.posts": "11,hello, world",
+}
+
+
+async def start_fake_server(received):
+    async def handle(reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            line = line.decode().rstrip("\n")
+            received.append(line)
+            function = line.split("(", 1)[0]
+            if function in REPLIES:
+                writer.write((REPLIES[function] + "\n").encode())
+                await writer.drain()
+        writer.close()
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+# --- AsyncMinecraft のテスト ---
+
+def test_format_request():
+    """要求がカンマ区切りの1行に変換されるかテスト"""
+    assert format_request("world.setBlock", (1, 2, 3, 4)) == b"world.setBlock(1,2,3,4)\n"
+    assert format_request("world.setting", ("autojump", True)) == b"world.setting(autojump,1)\n"
+    assert format_request("chat.post", ("a\nb",)) == b"chat.post(a b)\n"
+
+def test_async_client_pipelines_queries():
+    """多数の要求を同時に送り、応答が順番どおりに対応付けられるかテスト"""
+    async def scenario():
+        received = []
+        server, port = await start_fake_server(received)
+        amc = await AsyncMinecraft.create("127.0.0.1", port)
+        amc.setBlock(1, 2, 3, 4)
+        results = await asyncio.gather(*[amc.getBlock(i, 0, 0) for i in range(50)], amc.getHeight(0, 0))
+        pos = await amc.getPlayerPos()
+        hits = await amc.pollBlockHits()
+        posts = await amc.pollChatPosts()
+        await amc.close()
+        server.close()
+        return received, results, pos, hits, posts
+
+    received, results, pos, hits, posts = run(scenario())
+    assert received[0] == "world.setBlock(1,2,3,4)"
+    assert received[1:51] == [f"world.getBlock({i},0,0)" for i in range(50)]
+    assert results == [7] * 50 + [63]
+    assert pos == (1.5, 64.0, -3.25)
+    assert hits == [(1, 2, 3, 1, 10), (4, 5, 6, 2, 11)]
+    assert posts == [(11, "hello, world")]
+
+def test_async_client_connection_lost():
+    """接続が切れた場合に応答待ちの要求がエラーになるかテスト"""
+    async def scenario():
+        async def handle(reader, writer):
+            await reader.readline()
+            writer.close()
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        amc = await AsyncMinecraft.create("127.0.0.1", server.sockets[0].getsockname()[1])
+        try:
+            await amc.getBlock(0, 0, 0)
+        except AsyncMinecraftError:
+            return amc.closed
+        finally:
+            server.close()
+    assert run(scenario()) is True
+
+# --- ASGI アプリケーションのテスト ---
+
+async def call_app(method, path, body=None):
+    messages = [{"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}]
+    sent = []
+    async def receive():
+        return messages.pop(0)
+    async def send(message):
+        sent.append(message)
+    await asgi_app.app({"type": "http", "method": method, "path": path}, receive, send)
+    body = sent[1]["body"]
+    return sent[0]["status"], (json.loads(body) if path != "/" else body)
+
+
+def with_bridge(coro_factory):
+    """簡易 mcpi サーバーに接続した状態で ASGI アプリケーションを呼び出す"""
+    async def scenario():
+        received = []
+        server, port = await start_fake_server(received)
+        original = asgi_app.bridge
+        asgi_app.bridge = asgi_app.AsyncBridge("127.0.0.1", port)
+        try:
+            return await coro_factory(), received
+        finally:
+            await asgi_app.bridge.close()
+            asgi_app.bridge = original
+            server.close()
+    return run(scenario())
+
+def test_asgi_index():
+    """ルートURL ('/') が期待通りのレスポンスを返すかテスト"""
+    status, body = run(call_app("GET", "/"))
+    assert status == 200
+    assert body == b"Minecraft Scratch Bridge is running!"
+
+def test_asgi_command_success():
+    """ASGI 版の /command が Flask 版と同じ形式で応答するかテスト"""
+    (status, body), received = with_bridge(lambda: call_app("POST", "/command", {"command": "getBlock", "args": [1, 2, 3]}))
+    assert status == 200
+    assert body == {"status": "success", "block_id": 7}
+    assert received == ["world.getBlock(1,2,3)"]
+
+def test_asgi_command_validation_error():
+    """ASGI 版でも引数の検証エラーが Flask 版と同じメッセージになるかテスト"""
+    (status, body), received = with_bridge(lambda: call_app("POST", "/command", {"command": "setBlock", "args": [1, 2, "abc", 1]}))
+    assert status == 400
+    assert "Invalid arguments for setBlock" in body["message"]
+    assert received == []
+
+def test_asgi_command_invalid_json():
+    """ASGI 版で無効な JSON が送信された場合にエラーを返すかテスト"""
+    status, body = run(call_app("POST", "/command"))
+    assert status == 400
+    assert body["message"] == "Invalid JSON"
+
+def test_asgi_batch():
+    """ASGI 版の /batch が送信順に実行し、結果を順番どおりに返すかテスト"""
+    commands = [
+        {"command": "setBlock", "args": [0, 0, 0, 1]},
+        {"command": "getHeight", "args": [5, 5]},
+        {"command": "pollBlockHits", "args": []},
+    ]
+    (status, body), received = with_bridge(lambda: call_app("POST", "/batch", commands))
+    assert status == 200
+    assert [result["code"] for result in body["results"]] == [200, 200, 200]
+    assert body["results"][1]["height"] == 63
+    assert body["results"][2]["hits"][0] == {"type": 0, "pos": {"x": 1, "y": 2, "z": 3}, "face": 1, "entityId": 10}
+    assert received == ["world.setBlock(0,0,0,1)", "world.getHeight(5,5)", "events.block.hits()"]
+
+def test_asgi_get_blocks():
+    """ASGI 版の getBlocks が getBlock をパイプライン化して読み出すかテスト"""
+    (status, body), received = with_bridge(lambda: call_app("POST", "/command", {"command": "getBlocks", "args": [0, 0, 0, 1, 0, 1]}))
+    assert status == 200
+    assert body["blocks"] == [7, 7, 7, 7]
+    assert received == ["world.getBlock(0,0,0)", "world.getBlock(1,0,0)", "world.getBlock(0,0,1)", "world.getBlock(1,0,1)"]
+
+def test_asgi_not_connected(monkeypatch):
+    """ASGI 版で Minecraft に接続できない場合に 503 を返すかテスト"""
+    monkeypatch.setattr(asgi_app, 'bridge', asgi_app.AsyncBridge("127.0.0.1", 1))
+    status, body = run(call_app("POST", "/command", {"command": "postToChat", "args": ["Test"]}))
+    assert status == 503
+    assert "Minecraft not connected" in body["message"]
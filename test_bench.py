@@ -0,0 +1,87 @@
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from bench import compare, make_request, parse_mix, percentile, run_benchmark, summarize
+
+
+@pytest.fixture
+def bridge_url():
+    """/command と /batch に 200 (getBlock だけは 500) を返す簡易サーバー"""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            status = 500 if isinstance(body, dict) and body.get("command") == "getBlock" else 200
+            payload = b'{"status": "success"}'
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+def test_parse_mix():
+    """"コマンド=重み" の並びと、名前付きの組み合わせを解釈できるかテスト"""
+    assert parse_mix("setBlock=70, getBlock=30") == [("setBlock", 70.0), ("getBlock", 30.0)]
+    assert parse_mix("getHeight") == [("getHeight", 1.0)]
+    assert [name for name, _ in parse_mix("bulk")] == ["setBlocks", "getBlocks", "batch"]
+    with pytest.raises(ValueError):
+        parse_mix("")
+
+def test_make_request_sizes():
+    """setBlocks / getBlocks の範囲と /batch のコマンド数が指定どおりになるかテスト"""
+    rng = random.Random(0)
+    path, body, items = make_request("setBlocks", rng, 4, 10)
+    x1, y1, z1, x2, y2, z2, _ = body["args"]
+    assert (path, items) == ("/command", 1)
+    assert (x2 - x1, y2 - y1, z2 - z1) == (3, 3, 3)
+    path, body, items = make_request("getBlocks", rng, 128, 10)
+    x1, y1, z1, x2, y2, z2 = body["args"]
+    assert (x2 - x1 + 1) * (y2 - y1 + 1) * (z2 - z1 + 1) <= 65536
+    path, body, items = make_request("batch", rng, 4, 10)
+    assert (path, items, len(body["commands"])) == ("/batch", 10, 10)
+
+def test_percentile_and_summarize():
+    """パーセンタイルと1秒あたりの処理数の集計をテスト"""
+    values = [i / 1000 for i in range(1, 101)]
+    assert percentile(values, 50) == 0.05
+    assert percentile(values, 99) == 0.099
+    assert percentile([], 50) is None
+    summary = summarize(values, 2.0, items=400, errors=3)
+    assert summary["requests"] == 100
+    assert summary["opsPerSec"] == 50.0
+    assert summary["itemsPerSec"] == 200.0
+    assert (summary["p50"], summary["p95"], summary["p99"]) == (50.0, 95.0, 99.0)
+    assert summary["errors"] == 3
+
+def test_run_benchmark(bridge_url):
+    """並列のクライアントがリクエストを送り、コマンドごとに集計されるかテスト"""
+    result = run_benchmark(bridge_url, [("setBlock", 1), ("getBlock", 1), ("batch", 1)], 2, 0.3, batch_size=5)
+    assert result["concurrency"] == 2
+    assert result["requests"] > 0
+    assert set(result["commands"]) == {"setBlock", "getBlock", "batch"}
+    assert result["commands"]["getBlock"]["errors"] == result["commands"]["getBlock"]["requests"]
+    assert result["commands"]["batch"]["itemsPerSec"] > result["commands"]["batch"]["opsPerSec"]
+    assert set(result["statuses"]) == {"200", "500"}
+
+def test_compare_detects_regression():
+    """同じ条件の測定を比べ、指定した割合を超えて遅くなった測定を検出するかテスト"""
+    run = {"mix": "single", "concurrency": 4, "size": 8, "batchSize": 100, "opsPerSec": 100.0, "p95": 10.0}
+    baseline = {"runs": [run]}
+    current = {"runs": [dict(run, opsPerSec=80.0, p95=12.0), dict(run, concurrency=16)]}
+    table, regressions = compare(baseline, current, max_regression=10)
+    assert "-20.0%" in table
+    assert regressions == [("single", 4, 8, 100)]
+    assert compare(baseline, current, max_regression=25)[1] == []
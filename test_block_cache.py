@@ -0,0 +1,115 @@
+import pytest
+from block_cache import BlockCache, HeightCache, WorldCache
+from commands import prepare_command
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+# --- BlockCache のテスト ---
+
+def test_block_cache_put_get_and_ttl():
+    """書き込んだ値が TTL の間だけ読み出せるかテスト"""
+    clock = FakeClock()
+    cache = BlockCache(ttl=1.0, clock=clock)
+    assert cache.get(1, 2, 3) is None
+    cache.put(1, 2, 3, 5)
+    assert cache.get(1, 2, 3) == 5
+    clock.now = 1.5
+    assert cache.get(1, 2, 3) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+def test_block_cache_lru_eviction():
+    """チャンク数が上限を超えると最も古いチャンクが捨てられるかテスト"""
+    cache = BlockCache(max_chunks=2)
+    cache.put(0, 0, 0, 1)     # チャンク (0, 0, 0)
+    cache.put(16, 0, 0, 2)    # チャンク (1, 0, 0)
+    cache.get(0, 0, 0)        # (0, 0, 0) を最近使ったことにする
+    cache.put(32, 0, 0, 3)    # チャンク (2, 0, 0) -> (1, 0, 0) が捨てられる
+    assert cache.get(0, 0, 0) == 1
+    assert cache.get(16, 0, 0) is None
+    assert cache.get(32, 0, 0) == 3
+
+def test_block_cache_regions():
+    """setBlocks の範囲の書き込みと無効化のテスト"""
+    cache = BlockCache()
+    cache.put_region(2, 0, 2, 0, 1, 0, 7)
+    assert cache.get(1, 1, 1) == 7
+    cache.invalidate_region(0, 0, 0, 1, 1, 1)
+    assert cache.get(1, 1, 1) is None
+    assert cache.get(2, 1, 2) == 7
+    # 大きな範囲は書き込まずに無効化だけ行う
+    cache.put_region(0, 0, 0, 100, 100, 100, 1)
+    assert cache.get(2, 1, 2) is None
+
+# --- HeightCache のテスト ---
+
+def test_height_cache_follows_writes():
+    """1ブロックの書き込みに合わせて列の高さが更新されるかテスト"""
+    cache = HeightCache()
+    cache.put(0, 0, 10)
+    cache.on_set_block(0, 12, 0, 1)
+    assert cache.get(0, 0) == 12
+    cache.on_set_block(0, 5, 0, 0)
+    assert cache.get(0, 0) == 12
+    cache.on_set_block(0, 12, 0, 0)
+    assert cache.get(0, 0) is None
+
+def test_height_cache_invalidate_columns():
+    """範囲内の列が無効化されるかテスト"""
+    cache = HeightCache()
+    cache.put(0, 0, 1)
+    cache.put(5, 5, 1)
+    cache.invalidate_columns(-100, -100, 2, 2)
+    assert cache.get(0, 0) is None
+    assert cache.get(5, 5) == 1
+
+def test_world_cache_block_hits():
+    """ブロックヒットの座標がキャッシュから無効化されるかテスト"""
+    cache = WorldCache()
+    cache.on_set_block(1, 2, 3, 4)
+    cache.heights.put(1, 3, 2)
+    cache.on_block_hits([{"type": 4, "pos": {"x": 1, "y": 2, "z": 3}, "face": 1, "entityId": 1}])
+    assert cache.blocks.get(1, 2, 3) is None
+    assert cache.heights.get(1, 3) is None
+
+# --- コマンドとの連携のテスト ---
+
+def test_commands_read_through_cache(mocker):
+    """getBlock / getHeight がキャッシュを使い、書き込みで更新されるかテスト"""
+    mc = mocker.MagicMock()
+    mc.getBlock.return_value = 3
+    mc.getHeight.return_value = 60
+    mocker.patch('commands.world_cache', WorldCache())
+
+    assert prepare_command('getBlock', [1, 2, 3])(mc)['block_id'] == 3
+    assert prepare_command('getBlock', [1, 2, 3])(mc)['block_id'] == 3
+    mc.getBlock.assert_called_once_with(1, 2, 3)
+
+    prepare_command('setBlock', [1, 2, 3, 9])(mc)
+    assert prepare_command('getBlock', [1, 2, 3])(mc)['block_id'] == 9
+    assert mc.getBlock.call_count == 1
+
+    assert prepare_command('getHeight', [1, 3])(mc)['height'] == 60
+    prepare_command('setBlocks', [0, 0, 0, 2, 70, 4, 1])(mc)
+    assert prepare_command('getHeight', [1, 3])(mc)['height'] == 60
+    assert mc.getHeight.call_count == 2
+
+def test_commands_failed_write_keeps_cache(mocker):
+    """setBlock / setBlocks が失敗した場合は、キャッシュを書き換えないかテスト"""
+    mc = mocker.MagicMock()
+    mc.getBlock.return_value = 3
+    mocker.patch('commands.world_cache', WorldCache())
+    prepare_command('getBlock', [1, 2, 3])(mc)
+    mc.setBlock.side_effect = OSError("broken pipe")
+    mc.setBlocks.side_effect = OSError("broken pipe")
+    with pytest.raises(OSError):
+        prepare_command('setBlock', [1, 2, 3, 9])(mc)
+    with pytest.raises(OSError):
+        prepare_command('setBlocks', [0, 0, 0, 2, 2, 4, 1])(mc)
+    assert prepare_command('getBlock', [1, 2, 3])(mc)['block_id'] == 3
+    assert mc.getBlock.call_count == 1
@@ -0,0 +1,191 @@
+import pytest
+from commands import COMMANDS, Command, CommandError, decode_values, encode_values, prepare_command, to_bool
+
+# --- コマンド登録表のテスト ---
+
+def test_all_commands_registered():
+    """既存のすべてのコマンドが登録表に含まれているかテスト"""
+    expected = {
+        'postToChat', 'setBlock', 'getBlock', 'setBlocks', 'getHeight',
+        'getPlayerPos', 'setPlayerPos', 'getPlayerTilePos', 'getPlayerDirection',
+        'getPlayerRotation', 'getPlayerPitch', 'worldSetting',
+        'pollBlockHits', 'pollChatPosts', 'clearEvents',
+    }
+    assert expected <= set(COMMANDS)
+
+def test_prepare_command_converts_args(mocker):
+    """引数がスキーマに従って変換され、ハンドラに渡されるかテスト"""
+    mc = mocker.MagicMock()
+    action = prepare_command('setBlock', ["1", 2.0, 3, "4"])
+    result = action(mc)
+    mc.setBlock.assert_called_once_with(1, 2, 3, 4)
+    assert result == {"status": "success", "message": "Set block at (1,2,3) to 4"}
+
+def test_prepare_command_optional_arg(mocker):
+    """省略可能な引数が渡された場合とそうでない場合のテスト"""
+    mc = mocker.MagicMock()
+    prepare_command('setBlocks', [0, 0, 0, 1, 1, 1, 35])(mc)
+    mc.setBlocks.assert_called_with(0, 0, 0, 1, 1, 1, 35)
+    prepare_command('setBlocks', [0, 0, 0, 1, 1, 1, 35, 2])(mc)
+    mc.setBlocks.assert_called_with(0, 0, 0, 1, 1, 1, 35, 2)
+
+def test_prepare_command_unknown():
+    """未知のコマンドは CommandError になるかテスト"""
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('unknownAction', [])
+    assert excinfo.value.message == "Unknown command: unknownAction"
+    assert excinfo.value.status == 400
+
+def test_prepare_command_args_not_a_list():
+    """args がリストでない場合は CommandError になるかテスト"""
+    with pytest.raises(CommandError):
+        prepare_command('getBlock', "1,2,3")
+
+def test_generated_error_messages():
+    """エラーメッセージがスキーマから正しく組み立てられるかテスト"""
+    spec = Command('example', None, (int, int), optional=(int,))
+    assert spec.arity_message == "Incorrect number of arguments for example (expected 2 or 3)"
+    assert spec.invalid_message == "Invalid arguments for example (must be integers)"
+    assert Command('noArgs', None).arity_message == "noArgs does not take any arguments"
+    assert Command('pos', None, (float,)).invalid_message == "Invalid arguments for pos (must be numbers)"
+
+def test_to_bool():
+    """to_bool が true/false と 1/0 を変換し、それ以外を拒否するかテスト"""
+    assert to_bool(True) is True
+    assert to_bool("1") is True
+    assert to_bool("FALSE") is False
+    assert to_bool(0) is False
+    with pytest.raises(ValueError):
+        to_bool("maybe")
+
+# --- getBlocks のテスト ---
+
+def test_get_blocks_native(mocker):
+    """world.getBlocks の結果 (y, x, z の順) が y, z, x の順に並べ替えられるかテスト"""
+    mocker.patch('commands.native_get_blocks', True)
+    mc = mocker.MagicMock()
+    # (x, y, z) のブロックIDを x + 10 * z + 100 * y とする
+    mc.getBlocks.return_value = [x + 10 * z + 100 * y for y in range(2) for x in range(2) for z in range(3)]
+    result = prepare_command('getBlocks', [0, 0, 0, 1, 1, 2])(mc)
+    mc.getBlocks.assert_called_once_with(0, 0, 0, 1, 1, 2)
+    assert result["size"] == {"x": 2, "y": 2, "z": 3}
+    assert result["blocks"] == [x + 10 * z + 100 * y for y in range(2) for z in range(3) for x in range(2)]
+
+def test_get_blocks_pipelined_fallback(mocker):
+    """world.getBlocks が使えない場合は getBlock をまとめて送り、以降も使わないかテスト"""
+    mocker.patch('commands.native_get_blocks', True)
+    query_many = mocker.patch('commands.query_many', side_effect=lambda mc, requests: [str(args[0]) for _, args in requests])
+    mc = mocker.MagicMock()
+    mc.getBlocks.side_effect = ValueError("Fail")
+    result = prepare_command('getBlocks', [0, 5, 5, 2, 5, 5, 'uint8'])(mc)
+    assert result["encoding"] == "uint8"
+    assert result["blocks"] == "AAEC" # base64 で [0, 1, 2]
+    query_many.assert_called_once_with(mc, [("world.getBlock", (x, 5, 5)) for x in range(3)])
+    prepare_command('getBlocks', [0, 0, 0, 0, 0, 0])(mc)
+    assert mc.getBlocks.call_count == 1
+
+def test_get_blocks_validation():
+    """大きすぎる範囲や未知の形式が検証で拒否されるかテスト"""
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('getBlocks', [0, 0, 0, 255, 255, 255])
+    assert excinfo.value.status == 413
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('getBlocks', [0, 0, 0, 1, 1, 1, 'float'])
+    assert "encoding must be list, uint8 or uint16" in excinfo.value.message
+
+def test_encode_values():
+    """uint16 がリトルエンディアンの base64 に変換され、範囲外の値を拒否するかテスト"""
+    assert encode_values([1, 256], 'uint16') == "AQAAAQ=="
+    with pytest.raises(ValueError):
+        encode_values([300], 'uint8')
+
+def test_encode_values_raw():
+    """raw の場合は base64 にせずバイト列を返し、decode_values で元に戻せるかテスト"""
+    assert encode_values([1, 256], 'uint16', raw=True) == b"\x01\x00\x00\x01"
+    assert decode_values(b"\x01\x00\x00\x01", 'uint16') == [1, 256]
+
+# --- getHeights のテスト ---
+
+def test_get_heights_stride_and_cache(mocker):
+    """stride おきの列だけを読み、キャッシュにある列はゲームに問い合わせないかテスト"""
+    from block_cache import WorldCache
+    cache = WorldCache()
+    cache.heights.put(0, 0, 70)
+    mocker.patch('commands.world_cache', cache)
+    query_many = mocker.patch('commands.query_many', side_effect=lambda mc, requests: [str(x + z) for _, (x, z) in requests])
+    mc = mocker.MagicMock()
+    result = prepare_command('getHeights', [0, 0, 4, 2, 2])(mc)
+    assert result["size"] == {"x": 3, "z": 2}
+    assert result["heights"] == [70, 2, 4, 2, 4, 6]
+    query_many.assert_called_once_with(mc, [("world.getHeight", (x, z)) for z in (0, 2) for x in (0, 2, 4) if (x, z) != (0, 0)])
+    assert cache.heights.get(4, 2) == 6
+
+def test_get_heights_validation():
+    """stride が 1 未満の場合に検証で拒否されるかテスト"""
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('getHeights', [0, 0, 10, 10, 0])
+    assert excinfo.value.message == "Invalid stride for getHeights (must be at least 1)"
+
+# --- snapshotRegion / restoreRegion のテスト ---
+
+@pytest.fixture
+def world_mc(mocker):
+    """fake_minecraft の世界を読み書きする Minecraft のモック"""
+    from fake_minecraft import FakeGame
+    game = FakeGame(ground=0)
+    mc = mocker.MagicMock()
+    mc.getBlocks.side_effect = lambda *args: game.handle(f"world.getBlocks({','.join(map(str, args))})").split(",")
+    mc.setBlocks.side_effect = game.world.set_blocks
+    mc.setBlock.side_effect = game.world.set_block
+    mc.world = game.world
+    mocker.patch('commands.native_get_blocks', True)
+    return mc
+
+def test_snapshot_and_restore(mocker, tmp_path, world_mc):
+    """保存した範囲を戻すと、変わった場所だけがまとめた直方体で送られるかテスト"""
+    from snapshots import SnapshotStore
+    mocker.patch('commands.snapshot_store', SnapshotStore(str(tmp_path)))
+    # 1つのまとまりは 65536 // (40 * 40) = 40 層なので、y 方向は2つに分かれる
+    result = prepare_command('snapshotRegion', ["hill", 39, 60, 39, 0, -5, 0])(world_mc)
+    assert result["size"] == {"x": 40, "y": 66, "z": 40}
+    world_mc.world.set_blocks(0, -5, 0, 39, 60, 39, 0)
+    world_mc.world.set_blocks(3, 1, 3, 5, 2, 5, 57)
+    world_mc.setBlocks.reset_mock()
+    world_mc.setBlock.reset_mock()
+
+    result = prepare_command('restoreRegion', ["hill"])(world_mc)
+    # 地面 (y=0 の草、y=-1..-3 の土、その下の石) と置いたダイヤモンドブロックだけが変わっている
+    assert result["changed"] == 40 * 40 * 6 + 18
+    assert result["calls"] == world_mc.setBlocks.call_count + world_mc.setBlock.call_count == 4
+    assert [world_mc.world.get_block(4, y, 4) for y in range(-5, 3)] == [1, 1, 3, 3, 3, 2, 0, 0]
+    # 変わっていなければ何も送らない
+    assert prepare_command('restoreRegion', ["hill"])(world_mc)["calls"] == 0
+
+def test_restore_without_numpy(mocker, tmp_path, world_mc):
+    """NumPy がない場合も貪欲法でまとめて戻せるかテスト"""
+    from snapshots import SnapshotStore
+    mocker.patch('commands.snapshot_store', SnapshotStore(str(tmp_path)))
+    mocker.patch('commands.shapes', None)
+    prepare_command('snapshotRegion', ["flat", 0, 0, 0, 9, 0, 9])(world_mc)
+    world_mc.world.set_blocks(0, 0, 0, 9, 0, 4, 1)
+    result = prepare_command('restoreRegion', ["flat"])(world_mc)
+    assert result["changed"] == 50 and result["calls"] == 1
+    assert world_mc.world.get_block(0, 0, 0) == 2
+
+def test_snapshot_validation(mocker, tmp_path):
+    """名前、範囲の大きさ、ないスナップショット、無効な設定が検証で拒否されるかテスト"""
+    from snapshots import SnapshotStore
+    mocker.patch('commands.snapshot_store', None)
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('restoreRegion', ["hill"])
+    assert excinfo.value.status == 501
+    mocker.patch('commands.snapshot_store', SnapshotStore(str(tmp_path)))
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('snapshotRegion', ["../x", 0, 0, 0, 1, 1, 1])
+    assert excinfo.value.status == 400
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('snapshotRegion', ["big", 0, 0, 0, 255, 255, 255])
+    assert excinfo.value.status == 413
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('restoreRegion', ["missing"])
+    assert excinfo.value.status == 404
@@ -0,0 +1,124 @@
+import threading
+
+from connection import ConnectionManager
+
+# --- ConnectionManager のテスト ---
+
+def test_connect_success(mocker):
+    """接続に成功すると on_change に新しい接続が渡されるかテスト"""
+    mc = mocker.MagicMock()
+    changes = []
+    manager = ConnectionManager(lambda: mc, on_change=changes.append)
+    assert manager.connect() is True
+    assert manager.mc is mc
+    assert changes == [mc]
+    assert manager.wait_connected(0) is True
+
+def test_connect_failure():
+    """接続に失敗した場合はエラーを記録して False を返すかテスト"""
+    def factory():
+        raise ConnectionRefusedError("refused")
+    manager = ConnectionManager(factory)
+    assert manager.connect() is False
+    assert isinstance(manager.last_error, ConnectionRefusedError)
+    # 監視スレッドが動いていない場合は待たずに返る
+    assert manager.wait_connected(10) is False
+
+def test_mark_failed_closes_connection(mocker):
+    """mark_failed() で接続が閉じられ、None が通知されるかテスト"""
+    mc = mocker.MagicMock()
+    changes = []
+    manager = ConnectionManager(lambda: mc, on_change=changes.append)
+    manager.connect()
+    manager.mark_failed(mc, OSError("broken pipe"))
+    assert manager.mc is None
+    assert changes == [mc, None]
+    mc.conn.socket.close.assert_called_once()
+
+def test_mark_failed_ignores_stale_connection(mocker):
+    """古い接続の失敗通知で新しい接続を捨てないかテスト"""
+    old, new = mocker.MagicMock(), mocker.MagicMock()
+    manager = ConnectionManager(lambda: new)
+    manager.connect()
+    manager.mark_failed(old)
+    assert manager.mc is new
+
+def test_supervisor_reconnects(mocker):
+    """監視スレッドが接続に失敗しても再試行し、接続できるかテスト"""
+    mc = mocker.MagicMock()
+    attempts = []
+    def factory():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionRefusedError("refused")
+        return mc
+    manager = ConnectionManager(factory, min_backoff=0.01, max_backoff=0.02, health_interval=60)
+    manager.start()
+    try:
+        assert manager.wait_connected(5) is True
+        assert manager.mc is mc
+        assert len(attempts) == 3
+    finally:
+        manager.stop()
+
+def test_supervisor_health_check_failure(mocker):
+    """ヘルスチェックに失敗した接続が捨てられ、再接続されるかテスト"""
+    first, second = mocker.MagicMock(), mocker.MagicMock()
+    first.getHeight.side_effect = OSError("connection reset")
+    connections = [first, second]
+    reconnected = threading.Event()
+    def on_change(mc):
+        if mc is second:
+            reconnected.set()
+    manager = ConnectionManager(lambda: connections.pop(0), on_change=on_change,
+                                health_interval=0.01, min_backoff=0.01)
+    manager.connect()
+    manager.start()
+    try:
+        assert reconnected.wait(5)
+        first.conn.socket.close.assert_called_once()
+    finally:
+        manager.stop()
+
+def test_probe_measures_round_trip(mocker):
+    """probe() が応答を確認して往復時間を記録し、未接続なら None を返すかテスト"""
+    mc = mocker.MagicMock()
+    manager = ConnectionManager(lambda: mc)
+    assert manager.probe() is None
+    manager.connect()
+    rtt = manager.probe()
+    assert rtt is not None and rtt >= 0
+    assert manager.rtt == rtt
+    mc.getHeight.assert_called_once_with(0, 0)
+
+def test_probe_failure_marks_connection_failed(mocker):
+    """probe() で応答がなければ切断扱いになるかテスト"""
+    mc = mocker.MagicMock()
+    mc.getHeight.side_effect = OSError("broken pipe")
+    manager = ConnectionManager(lambda: mc)
+    manager.connect()
+    assert manager.probe() is None
+    assert manager.mc is None
+    assert isinstance(manager.last_error, OSError)
+
+def test_probe_does_not_wait_for_busy_connection(mocker):
+    """他のスレッドが接続を使っている間は待たずに、最後の往復時間を返すかテスト"""
+    mc = mocker.MagicMock()
+    manager = ConnectionManager(lambda: mc)
+    manager.connect()
+    manager.rtt = 0.002
+    held = threading.Event()
+    release = threading.Event()
+    def hold():
+        with manager.lock:
+            held.set()
+            release.wait(5)
+    thread = threading.Thread(target=hold)
+    thread.start()
+    held.wait(5)
+    try:
+        assert manager.probe(timeout=0.01) == 0.002
+        mc.getHeight.assert_not_called()
+    finally:
+        release.set()
+        thread.join()
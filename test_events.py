@@ -0,0 +1,168 @@
+import threading
+
+import pytest
+
+from events import (BLOCK_HIT, CHAT_POST, COALESCE, DROP_NEWEST, EventLog, EventPoller, EventQueue, block_hit_to_dict,
+                    block_hit_to_row, chat_post_to_dict, chat_post_to_row)
+
+def hit(x, y=0, z=0):
+    """FIELDS の順のブロックヒット (x, y, z, face, entityId, type)"""
+    return (x, y, z, 1, 10, 0)
+
+def post(message):
+    return (11, 0, message)
+
+# --- EventLog のテスト ---
+
+def test_event_log_since():
+    """カーソルより新しいイベントだけが返るかテスト"""
+    log = EventLog(capacity=10)
+    log.extend(BLOCK_HIT, [hit(1), hit(2)])
+    log.extend(CHAT_POST, [post("hi")])
+    events, cursor, missed = log.since(1)
+    assert [event["seq"] for event in events] == [2, 3]
+    assert events[0] == {"seq": 2, "kind": BLOCK_HIT, "type": 0, "pos": {"x": 2, "y": 0, "z": 0}, "face": 1, "entityId": 10}
+    assert events[1] == {"seq": 3, "kind": CHAT_POST, "type": 0, "entityId": 11, "message": "hi"}
+    assert cursor == 3
+    assert missed is False
+    assert log.since(3) == ([], 3, False)
+
+def test_event_log_kinds_and_limit():
+    """種類による絞り込みと件数制限のテスト"""
+    log = EventLog(capacity=10)
+    log.extend(BLOCK_HIT, [hit(1)])
+    log.extend(CHAT_POST, [post("2")])
+    log.extend(BLOCK_HIT, [hit(3), hit(4)])
+    events, cursor, _ = log.since(0, kinds={BLOCK_HIT}, limit=2)
+    assert [event["pos"]["x"] for event in events] == [1, 3]
+    assert cursor == 3
+    assert log.pending(cursor, {BLOCK_HIT}) == 1
+    events, cursor, _ = log.since(cursor, kinds={BLOCK_HIT}, limit=2)
+    assert [event["pos"]["x"] for event in events] == [4]
+    assert cursor == 4
+    assert log.pending(cursor) == 0
+
+def test_event_log_overflow():
+    """容量を超えた古いイベントが捨てられ、取りこぼしが報告されるかテスト"""
+    log = EventLog(capacity=2)
+    log.extend(BLOCK_HIT, [hit(1), hit(2), hit(3)])
+    events, cursor, missed = log.since(0)
+    assert [event["pos"]["x"] for event in events] == [2, 3]
+    assert missed is True
+    assert log.since(1)[2] is False
+    assert log.dropped == 1
+    # 種類ごとのバッファなので、チャットが溢れてもブロックヒットは残る
+    log.extend(CHAT_POST, [post("a"), post("b"), post("c")])
+    assert log.sizes() == {BLOCK_HIT: 2, CHAT_POST: 2}
+
+def test_event_log_drop_newest():
+    """drop-newest では未読のイベントを残して新しいイベントを捨て、読まれた後は新しいイベントを受け付けるかテスト"""
+    log = EventLog(capacity=2, overflow=DROP_NEWEST)
+    log.extend(BLOCK_HIT, [hit(1), hit(2), hit(3)])
+    events, cursor, missed = log.since(0)
+    assert [event["pos"]["x"] for event in events] == [1, 2]
+    assert missed is True and log.dropped == 1
+    log.extend(BLOCK_HIT, [hit(4)])
+    events, _, missed = log.since(cursor)
+    assert [event["pos"]["x"] for event in events] == [4]
+    assert missed is False and log.dropped == 1
+
+def test_event_log_coalesce():
+    """coalesce では溢れたときに同じブロックへのヒットをまとめ、違うブロックは古いイベントを捨てるかテスト"""
+    log = EventLog(capacity=3, overflow=COALESCE)
+    log.extend(BLOCK_HIT, [hit(1), hit(2), hit(1)])
+    log.extend(BLOCK_HIT, [hit(2), hit(1)])
+    assert log.coalesced == 2 and log.dropped == 0
+    log.extend(BLOCK_HIT, [hit(3)])
+    events, _, missed = log.since(0)
+    assert [event["pos"]["x"] for event in events] == [2, 1, 3]
+    assert missed is True and log.dropped == 1
+    # 読まれたイベントは、まとめずに古い方から入れ替わる
+    log.extend(BLOCK_HIT, [hit(3)])
+    assert [event["pos"]["x"] for event in log.since(0)[0]] == [1, 3, 3]
+
+def test_event_log_memory_is_bounded():
+    """長時間イベントを追加し続けても、保持する数と文字列が容量を超えないかテスト"""
+    log = EventLog(capacity=64)
+    for n in range(200):
+        log.extend(BLOCK_HIT, (hit(x, n) for x in range(50)))
+        log.extend(CHAT_POST, [post(f"message {n}")])
+    assert log.sizes() == {BLOCK_HIT: 64, CHAT_POST: 64}
+    assert log.last_seq == 200 * 51
+
+def test_event_log_invalid_settings():
+    """容量が0や知らない方針は ValueError になるかテスト"""
+    with pytest.raises(ValueError):
+        EventLog(capacity=0)
+    with pytest.raises(ValueError):
+        EventLog(overflow="drop-random")
+
+def test_event_log_wait():
+    """wait() が新しいイベントの到着で起きるかテスト"""
+    log = EventLog()
+    assert log.wait(0, timeout=0.01) is False
+    timer = threading.Timer(0.05, log.extend, args=(BLOCK_HIT, [hit(1)]))
+    timer.start()
+    assert log.wait(0, timeout=5) is True
+    timer.join()
+
+# --- EventQueue のテスト ---
+
+def test_queue_take_and_clear():
+    """従来のポーリング用の take() が前回以降のイベントを値のまま最大 limit 件ずつ返すかテスト"""
+    queue = EventQueue(EventLog())
+    queue.log.extend(BLOCK_HIT, [hit(1), hit(2), hit(3)])
+    queue.log.extend(CHAT_POST, [post("hi")])
+    assert queue.take(BLOCK_HIT, limit=2) == ([hit(1), hit(2)], True)
+    assert queue.take(BLOCK_HIT, limit=2) == ([hit(3)], False)
+    assert queue.take(BLOCK_HIT) == ([], False)
+    queue.log.extend(BLOCK_HIT, [hit(4)])
+    queue.clear()
+    assert queue.take(BLOCK_HIT) == ([], False)
+    assert queue.take(CHAT_POST) == ([], False)
+
+def test_event_values_to_dict_and_row():
+    """バッファの値から dict と terse の配列を作れるかテスト"""
+    assert block_hit_to_dict(hit(3)) == {"type": 0, "pos": {"x": 3, "y": 0, "z": 0}, "face": 1, "entityId": 10}
+    assert block_hit_to_row(hit(3)) == [3, 0, 0, 1, 10]
+    assert chat_post_to_dict(post("hi")) == {"type": 0, "entityId": 11, "message": "hi"}
+    assert chat_post_to_row(post("hi")) == [11, "hi"]
+
+# --- EventPoller のテスト ---
+
+def make_hit(mocker, x, y, z):
+    hit = mocker.MagicMock()
+    hit.type = 4
+    hit.pos.x, hit.pos.y, hit.pos.z = x, y, z
+    hit.face = 1
+    hit.entityId = 10
+    return hit
+
+def test_poller_poll_once(mocker):
+    """poll_once() がゲームのイベントを EventLog に追加するかテスト"""
+    mc = mocker.MagicMock()
+    mc.events.pollBlockHits.return_value = [make_hit(mocker, 1, 2, 3)]
+    post = mocker.MagicMock(type=5, entityId=11, message="hi")
+    mc.events.pollChatPosts.return_value = [post]
+    poller = EventPoller(lambda: mc, threading.Lock())
+    poller.poll_once()
+    events, cursor, _ = poller.log.since(0)
+    assert cursor == 2
+    assert events[0] == {"seq": 1, "kind": BLOCK_HIT, "type": 4, "pos": {"x": 1, "y": 2, "z": 3}, "face": 1, "entityId": 10}
+    assert events[1] == {"seq": 2, "kind": CHAT_POST, "type": 5, "entityId": 11, "message": "hi"}
+
+def test_poller_not_connected():
+    """未接続の場合は何もしないかテスト"""
+    poller = EventPoller(lambda: None, threading.Lock())
+    poller.poll_once()
+    assert poller.log.last_seq == 0
+
+def test_poller_reports_hit_positions(mocker):
+    """ヒットしたブロックの座標が on_block_positions に渡されるかテスト (キャッシュの無効化用)"""
+    mc = mocker.MagicMock()
+    mc.events.pollBlockHits.return_value = [make_hit(mocker, 1, 2, 3), make_hit(mocker, 4, 5, 6)]
+    mc.events.pollChatPosts.return_value = []
+    positions = []
+    poller = EventPoller(lambda: mc, threading.Lock(), on_block_positions=positions.extend)
+    poller.poll_once()
+    assert positions == [(1, 2, 3), (4, 5, 6)]
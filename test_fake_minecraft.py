@@ -0,0 +1,105 @@
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+from fake_minecraft import AIR, GRASS, STONE, FakeGame, FakeMinecraftServer, VoxelWorld
+from pipeline import query_many
+
+
+@pytest.fixture
+def server():
+    """空いているポートで起動したフェイクサーバー"""
+    server = FakeMinecraftServer(("127.0.0.1", 0)).start()
+    yield server
+    server.stop()
+
+def connect(server):
+    sock = socket.create_connection(("127.0.0.1", server.port))
+    return SimpleNamespace(conn=SimpleNamespace(socket=sock, drain=lambda: None))
+
+def test_world_flat_terrain():
+    """書き込んでいない場所は平らな地形 (ground 以下が地面) になるかテスト"""
+    world = VoxelWorld(ground=-1)
+    assert world.get_block(5, -1, 5) == GRASS
+    assert world.get_block(5, -10, 5) == STONE
+    assert world.get_block(5, 0, 5) == AIR
+    assert world.get_height(100, -100) == -1
+    assert world.chunk_count == 0
+
+def test_world_set_blocks_across_chunks():
+    """チャンクをまたぐ setBlocks が範囲内だけを書き換えるかテスト"""
+    world = VoxelWorld()
+    world.set_blocks(-3, 0, 14, 17, 2, 18, 5, 2)
+    assert world.get_block_with_data(-3, 0, 14) == (5, 2)
+    assert world.get_block_with_data(17, 2, 18) == (5, 2)
+    assert world.get_block(18, 2, 18) == AIR
+    assert world.get_block(0, 3, 15) == AIR
+    # x 方向に 3 チャンク、z 方向に 2 チャンク
+    assert world.chunk_count == 6
+    assert world.get_height(0, 15) == 2
+
+def test_world_get_height_after_digging():
+    """地面を掘ると getHeight が下がるかテスト"""
+    world = VoxelWorld()
+    world.set_blocks(0, -5, 0, 0, -1, 0, AIR)
+    assert world.get_height(0, 0) == -6
+    assert world.get_height(1, 0) == -1
+
+def test_game_protocol_lines():
+    """mcpi の要求の行を処理し、応答のあるコマンドだけが応答を返すかテスト"""
+    game = FakeGame()
+    assert game.handle("world.setBlock(1,2,3,4,5)") is None
+    assert game.handle("world.getBlock(1,2,3)") == "4"
+    assert game.handle("world.getBlockWithData(1,2,3)") == "4,5"
+    assert game.handle("world.getBlocks(1,2,3,1,2,4)") == "4,0"
+    assert game.handle("player.setPos(1.5,2.0,-3.5)") is None
+    assert game.handle("player.getTile()") == "1,2,-4"
+    assert game.handle("player.getDirection()") == "-0.0,-0.0,1.0"
+    assert game.handle("unknown.command()") == "Fail"
+    assert game.handle("world.getBlock(a,b,c)") == "Fail"
+
+def test_game_events():
+    """起こしたイベントが events.* で取り出され、取り出すと空になるかテスト"""
+    game = FakeGame()
+    game.hit_block(1, 2, 3, face=4, entity_id=7)
+    game.hit_block(5, 6, 7)
+    game.post_chat("hello")
+    assert game.handle("events.block.hits()") == "1,2,3,4,7|5,6,7,1,1"
+    assert game.handle("events.block.hits()") == ""
+    assert game.handle("events.chat.posts()") == "1,hello"
+    game.post_chat("again")
+    game.handle("events.clear()")
+    assert game.handle("events.chat.posts()") == ""
+
+def test_server_pipelined_requests(server):
+    """TCP 越しにパイプライン化した要求の応答が順番どおりに返るかテスト"""
+    mc = connect(server)
+    mc.conn.socket.sendall(b"world.setBlocks(0,0,0,9,0,0,7)\n")
+    replies = query_many(mc, [("world.getBlock", (x, 0, 0)) for x in range(12)])
+    assert replies == ["7"] * 10 + ["0", "0"]
+    mc.conn.socket.close()
+
+def test_server_latency():
+    """応答の前に指定した遅延が入るかテスト"""
+    server = FakeMinecraftServer(("127.0.0.1", 0), latency=0.05).start()
+    try:
+        mc = connect(server)
+        started = time.perf_counter()
+        assert query_many(mc, [("world.getHeight", (0, 0))]) == ["-1"]
+        assert time.perf_counter() - started >= 0.05
+        mc.conn.socket.close()
+    finally:
+        server.stop()
+
+def test_server_jitter_is_seeded():
+    """同じ seed なら同じゆらぎの列になるかテスト"""
+    first = FakeMinecraftServer(("127.0.0.1", 0), latency=0.01, jitter=0.02, seed=3)
+    second = FakeMinecraftServer(("127.0.0.1", 0), latency=0.01, jitter=0.02, seed=3)
+    try:
+        delays = [first.next_delay() for _ in range(5)]
+        assert delays == [second.next_delay() for _ in range(5)]
+        assert all(0.01 <= delay <= 0.03 for delay in delays)
+    finally:
+        first.server_close()
+        second.server_close()
@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+from journal import CommandJournal, read_journal, segment_paths
+
+
+def test_append_and_read(tmp_path):
+    """記録したコマンドが sync でまとめて書き込まれ、同じ順に読み出せるかテスト"""
+    times = iter([100.0, 100.5, 101.25])
+    journal = CommandJournal(str(tmp_path), clock=lambda: next(times))
+    journal.append("tab-1", "setBlock", [1, 2, 3, 4])
+    journal.append("tab-2", "postToChat", ["こんにちは"])
+    assert len(journal) == 2 and journal.records == 0
+    assert journal.sync() == 2
+    journal.append("tab-1", "setBlocks", [0, 0, 0, 1, 1, 1, 5])
+    journal.stop()
+    assert journal.records == 3 and journal.syncs == 2
+    assert list(read_journal(str(tmp_path))) == [
+        {"t": 100.0, "client": "tab-1", "command": "setBlock", "args": [1, 2, 3, 4]},
+        {"t": 100.5, "client": "tab-2", "command": "postToChat", "args": ["こんにちは"]},
+        {"t": 101.25, "client": "tab-1", "command": "setBlocks", "args": [0, 0, 0, 1, 1, 1, 5]},
+    ]
+
+def test_rotation_and_retention(tmp_path):
+    """セグメントが大きさで切り替わり、古いセグメントが削除されるかテスト"""
+    journal = CommandJournal(str(tmp_path), segment_bytes=1, max_segments=2)
+    for i in range(4):
+        journal.append("tab", "setBlock", [i, 0, 0, 1])
+        journal.sync()
+    journal.stop()
+    assert [os.path.basename(path) for path in segment_paths(str(tmp_path))] == [
+        "journal-00000003.jsonl", "journal-00000004.jsonl"]
+    assert [record["args"][0] for record in read_journal(str(tmp_path))] == [2, 3]
+    # 再起動したら、前のセグメントには追記せずに次の番号から始める
+    journal = CommandJournal(str(tmp_path))
+    journal.append("tab", "setBlock", [4, 0, 0, 1])
+    journal.stop()
+    assert os.path.basename(segment_paths(str(tmp_path))[-1]) == "journal-00000005.jsonl"
+
+def test_failed_sync_keeps_records(tmp_path, monkeypatch):
+    """書き込みに失敗した記録は捨てずに残し、次の sync で書き込まれるかテスト"""
+    journal = CommandJournal(str(tmp_path))
+    journal.append("tab-1", "setBlock", [1, 0, 0, 1])
+    def broken_fsync(fd):
+        raise OSError("disk full")
+    monkeypatch.setattr(os, "fsync", broken_fsync)
+    with pytest.raises(OSError):
+        journal.sync()
+    journal.append("tab-1", "setBlock", [2, 0, 0, 1])
+    assert len(journal) == 2 and journal.records == 0
+    monkeypatch.undo()
+    assert journal.sync() == 2
+    journal.stop()
+    assert [record["args"][0] for record in read_journal(str(tmp_path))] == [1, 2]
+
+def test_torn_line_is_skipped(tmp_path):
+    """途中までしか書かれていない行は読み飛ばすかテスト"""
+    path = tmp_path / "journal-00000001.jsonl"
+    line = json.dumps({"t": 1.0, "client": "a", "command": "setBlock", "args": [0, 0, 0, 1]})
+    path.write_text(line + "\n" + line[:20])
+    assert [record["t"] for record in read_journal(str(tmp_path))] == [1.0]
+    assert len(list(read_journal(str(path)))) == 1
+
+def test_worker_directories_are_merged(tmp_path):
+    """ワーカーごとのディレクトリの記録が時刻の順に合わせて読み出されるかテスト"""
+    for worker, times in (("worker-1", [1.0, 4.0]), ("worker-2", [2.0, 3.0])):
+        clock = iter(times)
+        journal = CommandJournal(str(tmp_path / worker), clock=lambda: next(clock))
+        for _ in times:
+            journal.append(worker, "setBlock", [0, 0, 0, 1])
+        journal.stop()
+    assert [(record["t"], record["client"]) for record in read_journal(str(tmp_path))] == [
+        (1.0, "worker-1"), (2.0, "worker-2"), (3.0, "worker-2"), (4.0, "worker-1")]
@@ -0,0 +1,45 @@
+from metrics import Metrics
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_histogram_buckets_are_cumulative():
+    """ヒストグラムのバケットが累積で出力され、合計と回数が正しいかテスト"""
+    clock = FakeClock()
+    metrics = Metrics(['getBlock'], clock=clock)
+    for elapsed in (0.0002, 0.003, 20.0):
+        started = metrics.start()
+        clock.now += elapsed
+        metrics.finish('getBlock', 200, started)
+    text = metrics.render()
+    assert 'bridge_request_seconds_bucket{command="getBlock",le="0.0005"} 1' in text
+    assert 'bridge_request_seconds_bucket{command="getBlock",le="0.005"} 2' in text
+    assert 'bridge_request_seconds_bucket{command="getBlock",le="10.0"} 2' in text
+    assert 'bridge_request_seconds_bucket{command="getBlock",le="+Inf"} 3' in text
+    assert 'bridge_request_seconds_count{command="getBlock"} 3' in text
+
+def test_unused_and_unknown_commands():
+    """使われていないコマンドは出力されず、未知のコマンドは unknown にまとめられるかテスト"""
+    metrics = Metrics(['getBlock', 'setBlock'])
+    metrics.finish('bogus', 400, metrics.start())
+    metrics.finish(['not', 'a', 'name'], 400, metrics.start())
+    text = metrics.render()
+    assert 'command="getBlock"' not in text
+    assert 'bridge_requests_total{command="unknown"} 2' in text
+    assert 'bridge_errors_total{command="unknown",code="400"} 2' in text
+
+def test_gauges():
+    """ゲージが読み出し時の値で出力されるかテスト"""
+    metrics = Metrics([])
+    depth = [3]
+    metrics.gauge("queue_depth", "Depth", lambda: depth[0])
+    metrics.gauge("hits_total", "Hits", lambda: {'cache="block"': 5}, "counter")
+    depth[0] = 4
+    text = metrics.render()
+    assert "# TYPE queue_depth gauge\nqueue_depth 4" in text
+    assert '# TYPE hits_total counter\nhits_total{cache="block"} 5' in text
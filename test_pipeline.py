@@ -0,0 +1,45 @@
+import socket
+import threading
+from types import SimpleNamespace
+
+import pytest
+from pipeline import query_many
+
+
+def fake_minecraft(reply):
+    """1行ごとに reply(要求) を返す簡易サーバーにつながった mc を作る"""
+    client, server = socket.socketpair()
+    received = []
+
+    def serve():
+        with server, server.makefile("rb") as reader:
+            for line in reader:
+                line = line.decode().rstrip("\n")
+                received.append(line)
+                answer = reply(line)
+                if answer is None:
+                    break
+                server.sendall((answer + "\n").encode())
+
+    threading.Thread(target=serve, daemon=True).start()
+    mc = SimpleNamespace(conn=SimpleNamespace(socket=client, drain=lambda: None))
+    return mc, received
+
+def test_query_many_keeps_order():
+    """多数の要求の応答が要求の順番どおりに返るかテスト (ウィンドウより多い場合も含む)"""
+    mc, received = fake_minecraft(lambda line: line.split("(")[1].split(",")[0])
+    requests = [("world.getBlock", (i, 0, 0)) for i in range(1000)]
+    assert query_many(mc, requests, window=64) == [str(i) for i in range(1000)]
+    assert received[:2] == ["world.getBlock(0,0,0)", "world.getBlock(1,0,0)"]
+    mc.conn.socket.close()
+
+def test_query_many_empty():
+    """要求がない場合はソケットに触れずに空のリストを返すかテスト"""
+    assert query_many(SimpleNamespace(conn=None), []) == []
+
+def test_query_many_connection_closed():
+    """応答の途中で接続が切れた場合に ConnectionError になるかテスト"""
+    mc, _ = fake_minecraft(lambda line: None)
+    with pytest.raises(ConnectionError):
+        query_many(mc, [("world.getHeight", (0, 0))])
+    mc.conn.socket.close()
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+from commands import prepare_command
+from player_state import PlayerStateCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_cache_shares_within_window():
+    """window 秒以内は前回の結果を返し、過ぎたら取得し直すかテスト"""
+    clock = FakeClock()
+    cache = PlayerStateCache(window=0.02, clock=clock)
+    calls = []
+    fetch = lambda: calls.append(1) or len(calls)
+    assert cache.get(fetch) == 1
+    clock.now = 0.01
+    assert cache.get(fetch) == 1
+    clock.now = 0.05
+    assert cache.get(fetch) == 2
+    cache.clear()
+    assert cache.get(fetch) == 3
+    assert (cache.hits, cache.misses) == (1, 3)
+
+def test_cache_single_flight():
+    """同時の要求が1回の取得を共有するかテスト"""
+    cache = PlayerStateCache(window=1.0)
+    started = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return "state"
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(cache.get(fetch)))
+    first.start()
+    started.wait()
+    others = [threading.Thread(target=lambda: results.append(cache.get(fetch))) for _ in range(5)]
+    for thread in others:
+        thread.start()
+    for thread in [first] + others:
+        thread.join()
+    assert results == ["state"] * 6
+    assert len(calls) == 1
+
+def test_cache_retries_after_error():
+    """取得に失敗した場合は例外を送出し、次の要求で取得し直すかテスト"""
+    cache = PlayerStateCache(window=1.0)
+    with pytest.raises(ValueError):
+        cache.get(lambda: int("Fail"))
+    assert cache.get(lambda: 5) == 5
+
+def test_get_player_state_command(mocker):
+    """getPlayerState が5つの問い合わせを1回にまとめて送り、結果を組み立てるかテスト"""
+    mocker.patch('commands.player_state_cache', PlayerStateCache(window=1.0))
+    query_many = mocker.patch('commands.query_many', return_value=["1.5,64.0,-3.25", "1,64,-4", "0.0,0.0,1.0", "90.0", "-15.5"])
+    mc = mocker.MagicMock()
+    result = prepare_command('getPlayerState', [])(mc)
+    assert result == {
+        "status": "success",
+        "pos": {"x": 1.5, "y": 64.0, "z": -3.25},
+        "tilePos": {"x": 1, "y": 64, "z": -4},
+        "direction": {"x": 0.0, "y": 0.0, "z": 1.0},
+        "rotation": 90.0,
+        "pitch": -15.5,
+    }
+    prepare_command('getPlayerState', [])(mc)
+    query_many.assert_called_once()
+    # プレイヤーを動かしたら次の要求ではゲームに問い合わせる
+    prepare_command('setPlayerPos', [0, 0, 0])(mc)
+    prepare_command('getPlayerState', [])(mc)
+    assert query_many.call_count == 2
@@ -0,0 +1,87 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from replay import main, replay
+
+
+@pytest.fixture
+def bridge():
+    """届いたリクエストを (時刻, クライアント, ボディ, パス) で記録する簡易サーバー"""
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            received.append((time.perf_counter(), self.headers["X-Client-Id"], body, self.path))
+            status = 400 if body["command"] == "bad" else 200
+            payload = b'{"status": "success"}'
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}", received
+    server.shutdown()
+    server.server_close()
+
+def records(*items):
+    return [{"t": t, "client": client, "command": command, "args": [i]} for i, (t, client, command) in enumerate(items)]
+
+def test_replay_keeps_order_per_client(bridge):
+    """クライアントごとに記録の順で、元のクライアントの識別子で送られるかテスト"""
+    url, received = bridge
+    result = replay(url, records((0, "a", "setBlock"), (0, "b", "setBlock"), (0, "a", "bad"), (0, "a", "setBlock")),
+                    speed=0, prefix="r-")
+    assert result["requests"] == 4 and result["clients"] == 2
+    assert result["commands"]["bad"]["errors"] == 1
+    assert [body["args"][0] for _, client, body, _ in received if client == "r-a"] == [0, 2, 3]
+
+def test_replay_follows_recorded_timing(bridge):
+    """speed に合わせて、記録された間隔を空けて送るかテスト"""
+    url, received = bridge
+    result = replay(url, records((1000.0, "a", "setBlock"), (1000.4, "a", "setBlock")), speed=2)
+    assert result["recordedDuration"] == 0.4
+    assert received[1][0] - received[0][0] >= 0.19
+
+def test_replay_routes_worlds(bridge):
+    """ワールドの記録は /w/<名前>/command に送り、route_worlds が False なら /command に送るかテスト"""
+    url, received = bridge
+    items = records((0, "a", "setBlock"), (0, "a", "setBlock"))
+    items[1]["world"] = "lab 1"
+    replay(url, items, speed=0)
+    assert [path for *_, path in received] == ["/command", "/w/lab%201/command"]
+    received.clear()
+    replay(url, items, speed=0, route_worlds=False)
+    assert [path for *_, path in received] == ["/command", "/command"]
+
+def test_main_reads_journal_directory(bridge, tmp_path):
+    """ジャーナルのディレクトリを読んで再生し、結果を保存するかテスト"""
+    url, received = bridge
+    (tmp_path / "journal-00000001.jsonl").write_text(
+        "".join(json.dumps(record) + "\n" for record in records((5.0, "a", "setBlock"), (6.0, "b", "postToChat"))))
+    output = tmp_path / "result.json"
+    assert main([str(tmp_path), "--url", url, "--speed", "0", "--output", str(output)]) == 0
+    assert len(received) == 2
+    assert json.loads(output.read_text())["requests"] == 2
+
+def test_replay_speed_zero_keeps_journal_order(bridge):
+    """speed 0 では1つの接続でジャーナルの順に送り、同じブロックへの最後の書き込みが最後に届くかテスト"""
+    url, received = bridge
+    items = records(*[(t, client, "setBlock") for t, client in
+                      [(0.0, "a"), (0.1, "b"), (0.2, "a"), (0.3, "b"), (0.4, "a"), (0.5, "b"), (0.6, "b"), (0.7, "a")]])
+    for item in items:
+        item["args"] = [0, 0, 0, item["args"][0]]
+    result = replay(url, items, speed=0)
+    assert result["clients"] == 2
+    assert [body["args"][3] for _, _, body, _ in received] == list(range(8))
+    assert [client for _, client, _, _ in received] == ["a", "b", "a", "b", "a", "b", "b", "a"]
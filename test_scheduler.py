@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+from commands import prepare_command
+from scheduler import FairScheduler, Overloaded, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for_depth(scheduler, depth):
+    deadline = time.monotonic() + 2
+    while scheduler.depth() < depth:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+# --- TokenBucket のテスト ---
+
+def test_token_bucket_refills():
+    """トークンが rate で回復し、足りない場合は待ち時間を返すかテスト"""
+    bucket = TokenBucket(rate=10, burst=5, now=0.0)
+    assert bucket.take(5, 0.0) == 0.0
+    assert bucket.take(1, 0.0) == pytest.approx(0.1)
+    assert bucket.take(1, 0.1) == 0.0
+
+# --- FairScheduler のテスト ---
+
+def test_scheduler_round_robin():
+    """大量に送るクライアントがいても、他のクライアントの順番が先に回ってくるかテスト"""
+    scheduler = FairScheduler()
+    release = threading.Event()
+    order = []
+
+    def submit(client, name):
+        scheduler.run(client, 1, lambda: order.append(name))
+
+    # 実行中のコマンドの間に a が3つ、b が1つ待つ
+    blocker = threading.Thread(target=lambda: scheduler.run("a", 1, release.wait))
+    blocker.start()
+    threads = []
+    for depth, (client, name) in enumerate([("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")], 1):
+        thread = threading.Thread(target=submit, args=(client, name))
+        thread.start()
+        threads.append(thread)
+        wait_for_depth(scheduler, depth)
+    release.set()
+    for thread in [blocker] + threads:
+        thread.join()
+    assert order == ["a1", "b1", "a2", "a3"]
+
+def test_scheduler_huge_cost_does_not_spin():
+    """レート制限がなければ上限のないコストのコマンドも、1周ずつ回さずにすぐ順番が来るかテスト"""
+    scheduler = FairScheduler()
+    started = time.monotonic()
+    assert scheduler.run("a", 10_000_000, lambda: "ok") == "ok"
+    assert scheduler.run("b", 1, lambda: "ok") == "ok"
+    assert time.monotonic() - started < 0.5
+
+def test_scheduler_rate_limit():
+    """トークンが足りない場合に Overloaded になり、他のクライアントには影響しないかテスト"""
+    clock = FakeClock()
+    scheduler = FairScheduler(rate=1, burst=2, clock=clock)
+    assert scheduler.run("a", 2, lambda: "ok") == "ok"
+    with pytest.raises(Overloaded) as excinfo:
+        scheduler.run("a", 1, lambda: "ok")
+    assert excinfo.value.status == 429
+    assert excinfo.value.retry_after == pytest.approx(1.0)
+    assert scheduler.run("b", 1, lambda: "ok") == "ok"
+    clock.now = 1.0
+    assert scheduler.run("a", 1, lambda: "ok") == "ok"
+    # バースト量を超える重いコマンドも、満タンになれば実行できる
+    clock.now = 10.0
+    assert scheduler.run("a", 100, lambda: "ok") == "ok"
+
+def test_scheduler_prunes_idle_buckets():
+    """待ちがなく、トークンが満タンに戻ったクライアントのバケットが捨てられるかテスト"""
+    clock = FakeClock()
+    scheduler = FairScheduler(rate=1, burst=2, clock=clock)
+    for client in range(100):
+        scheduler.run(client, 1, lambda: None)
+    assert len(scheduler._buckets) == 100
+    # まだ満タンに戻っていないバケットは残す
+    clock.now = 1.0
+    scheduler.run("a", 2, lambda: None)
+    assert len(scheduler._buckets) == 101
+    clock.now = 2.5
+    scheduler.run("b", 1, lambda: None)
+    assert set(scheduler._buckets) == {"a", "b"}
+
+def test_scheduler_queue_full():
+    """待ち行列が一杯のクライアントのコマンドは Overloaded になるかテスト"""
+    scheduler = FairScheduler(max_queue=1)
+    release = threading.Event()
+    blocker = threading.Thread(target=lambda: scheduler.run("a", 1, release.wait))
+    blocker.start()
+    waiting = threading.Thread(target=lambda: scheduler.run("a", 1, lambda: None))
+    waiting.start()
+    wait_for_depth(scheduler, 1)
+    with pytest.raises(Overloaded):
+        scheduler.run("a", 1, lambda: None)
+    release.set()
+    blocker.join()
+    waiting.join()
+    assert scheduler.rejected == 1
+
+def test_scheduler_releases_after_error():
+    """実行中のコマンドが例外を送出しても次のコマンドが実行されるかテスト"""
+    scheduler = FairScheduler()
+    with pytest.raises(ValueError):
+        scheduler.run("a", 1, lambda: int("x"))
+    assert scheduler.run("a", 1, lambda: "ok") == "ok"
+
+def test_command_costs():
+    """setBlocks などの重さがブロック数に応じて大きくなるかテスト"""
+    assert prepare_command('setBlock', [0, 0, 0, 1]).cost == 1
+    assert prepare_command('setBlocks', [0, 0, 0, 0, 0, 0, 1]).cost == 1
+    assert prepare_command('setBlocks', [0, 0, 0, 99, 99, 99, 1]).cost == 1 + 1000000 // 1024
+    assert prepare_command('getBlocks', [0, 0, 0, 15, 15, 15]).cost == 5
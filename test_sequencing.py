@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+from sequencing import ClientSequencer, SequenceError
+
+
+def counting_action(log, name, status=200):
+    def action():
+        log.append(name)
+        return {"status": "success", "message": name}, status
+    return action
+
+def run_in_thread(sequencer, client, seq, action, results):
+    thread = threading.Thread(target=lambda: results.append(sequencer.run(client, seq, action)))
+    thread.start()
+    return thread
+
+def test_duplicate_returns_stored_result():
+    """同じ連番の再送は実行されずに、保存した結果が返るかテスト"""
+    sequencer = ClientSequencer()
+    log = []
+    first = sequencer.run("tab-1", 1, counting_action(log, "chat"))
+    again = sequencer.run("tab-1", 1, counting_action(log, "chat"))
+    assert first == again == ({"status": "success", "message": "chat"}, 200)
+    assert log == ["chat"]
+    assert sequencer.replayed == 1
+    # 別のクライアントの同じ連番は別のコマンド
+    sequencer.run("tab-2", 1, counting_action(log, "other"))
+    assert log == ["chat", "other"]
+
+def test_stored_result_is_not_shared():
+    """返した結果を書き換えても、保存した結果は変わらないかテスト"""
+    sequencer = ClientSequencer()
+    result, _ = sequencer.run("tab-1", 1, counting_action([], "chat"))
+    result["id"] = 99
+    assert "id" not in sequencer.run("tab-1", 1, counting_action([], "chat"))[0]
+
+def test_out_of_order_arrival_runs_in_order():
+    """後の連番が先に届いても、前の連番が届くのを待って順番に実行するかテスト"""
+    sequencer = ClientSequencer(order_wait=2.0)
+    log = []
+    results = []
+    sequencer.run("tab-1", 1, counting_action(log, "1"))
+    late = run_in_thread(sequencer, "tab-1", 3, counting_action(log, "3"), results)
+    time.sleep(0.05)
+    sequencer.run("tab-1", 2, counting_action(log, "2"))
+    late.join()
+    assert log == ["1", "2", "3"]
+
+def test_missing_seq_times_out():
+    """前の連番が届かない場合は order_wait 秒待ってから実行し、後から届いた連番は 409 になるかテスト"""
+    sequencer = ClientSequencer(order_wait=0.05)
+    log = []
+    sequencer.run("tab-1", 1, counting_action(log, "1"))
+    started = time.monotonic()
+    sequencer.run("tab-1", 3, counting_action(log, "3"))
+    assert time.monotonic() - started >= 0.05
+    with pytest.raises(SequenceError) as excinfo:
+        sequencer.run("tab-1", 2, counting_action(log, "2"))
+    assert excinfo.value.status == 409
+    assert log == ["1", "3"]
+
+def test_duplicate_while_running_waits_for_result():
+    """実行中の連番が再送された場合は、実行が終わるのを待って同じ結果を返すかテスト"""
+    sequencer = ClientSequencer()
+    release = threading.Event()
+    log = []
+
+    def slow():
+        log.append("run")
+        release.wait(2)
+        return {"status": "success"}, 200
+
+    results = []
+    first = run_in_thread(sequencer, "tab-1", 5, slow, results)
+    time.sleep(0.05)
+    retry = run_in_thread(sequencer, "tab-1", 5, slow, results)
+    time.sleep(0.05)
+    release.set()
+    first.join()
+    retry.join()
+    assert log == ["run"]
+    assert results == [({"status": "success"}, 200)] * 2
+
+def test_duplicate_while_hung_gives_up():
+    """実行中の連番が終わらない場合、再送は order_wait 秒で 503 になり、次の連番は先に進むかテスト"""
+    sequencer = ClientSequencer(order_wait=0.05)
+    release = threading.Event()
+    log = []
+
+    def hung():
+        release.wait(2)
+        return {"status": "success"}, 200
+
+    results = []
+    first = run_in_thread(sequencer, "tab-1", 1, hung, results)
+    time.sleep(0.02)
+    started = time.monotonic()
+    with pytest.raises(SequenceError) as excinfo:
+        sequencer.run("tab-1", 1, hung)
+    assert excinfo.value.status == 503
+    assert sequencer.run("tab-1", 2, counting_action(log, "2"))[1] == 200
+    assert time.monotonic() - started < 1
+    release.set()
+    first.join()
+    assert log == ["2"] and results == [({"status": "success"}, 200)]
+
+def test_retryable_result_is_not_stored():
+    """実行されなかった結果 (503 など) は保存せず、同じ連番で再送すると実行されるかテスト"""
+    sequencer = ClientSequencer()
+    log = []
+    assert sequencer.run("tab-1", 1, counting_action(log, "down", 503))[1] == 503
+    assert sequencer.run("tab-1", 1, counting_action(log, "up"))[1] == 200
+    assert log == ["down", "up"]
+
+def test_window_forgets_old_results():
+    """window を超えた古い結果は忘れ、その連番の再送は 409 になるかテスト"""
+    sequencer = ClientSequencer(window=2)
+    for seq in range(1, 4):
+        sequencer.run("tab-1", seq, counting_action([], str(seq)))
+    assert sequencer.run("tab-1", 3, counting_action([], "again"))[0]["message"] == "3"
+    with pytest.raises(SequenceError):
+        sequencer.run("tab-1", 1, counting_action([], "again"))
+
+def test_invalid_seq():
+    """連番が整数でない場合は 400 になるかテスト"""
+    sequencer = ClientSequencer()
+    for seq in ("1", -1, 1.5, True):
+        with pytest.raises(SequenceError) as excinfo:
+            sequencer.run("tab-1", seq, counting_action([], "x"))
+        assert excinfo.value.status == 400
@@ -0,0 +1,43 @@
+import pytest
+import serialization
+from serialization import CBOR, JSON, MSGPACK, canonical, decode, encode
+
+msgpack = pytest.importorskip("msgpack")
+cbor2 = pytest.importorskip("cbor2")
+
+
+def test_round_trip_all_formats():
+    """JSON / MessagePack / CBOR で同じ値に戻るかテスト (バイナリの形式は bytes もそのまま)"""
+    value = {"status": "success", "hits": [[1, 2, 3, 1, 10]], "message": "こんにちは"}
+    for fmt in (JSON, MSGPACK, CBOR):
+        assert decode(encode(value, fmt), fmt) == value
+    assert decode(encode({"blocks": b"\x00\x01"}, MSGPACK), MSGPACK) == {"blocks": b"\x00\x01"}
+    assert decode(encode({"blocks": b"\x00\x01"}, CBOR), CBOR) == {"blocks": b"\x00\x01"}
+
+def test_json_is_compact():
+    """JSON は空白なしで、ASCII 以外の文字はエスケープせずに出力するかテスト"""
+    assert encode({"a": [1, 2], "b": "é"}) == '{"a":[1,2],"b":"é"}'.encode()
+
+def test_aliases_and_availability():
+    """MessagePack の別名が正式な名前になり、使える形式に含まれるかテスト"""
+    assert canonical("application/x-msgpack") == MSGPACK
+    assert canonical(JSON) == JSON
+    assert serialization.available()[0] == JSON
+    assert {MSGPACK, CBOR, "application/x-msgpack"} <= set(serialization.available())
+
+def test_decode_errors():
+    """不正なボディや使えない形式が ValueError になるかテスト"""
+    with pytest.raises(ValueError):
+        decode(b"\xc1", MSGPACK)
+    with pytest.raises(ValueError):
+        decode(b"{", JSON)
+    with pytest.raises(ValueError):
+        decode(b"", "application/xml")
+
+def test_missing_optional_packages(mocker):
+    """msgpack / cbor2 がない場合は JSON だけが使えるかテスト"""
+    mocker.patch('serialization.msgpack', None)
+    mocker.patch('serialization.cbor2', None)
+    assert serialization.available() == [JSON]
+    with pytest.raises(ValueError):
+        decode(b"\x80", MSGPACK)
@@ -0,0 +1,93 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import shapes
+from commands import CommandError, encode_values, prepare_command
+
+
+def box_coords(boxes):
+    coords = []
+    for x1, y1, z1, x2, y2, z2 in boxes:
+        coords += [(x, y, z) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1) for z in range(z1, z2 + 1)]
+    return coords
+
+def assert_exact_cover(points, boxes):
+    """直方体が座標をちょうど (重複なく) 埋めているか確認する"""
+    coords = box_coords(boxes)
+    assert len(coords) == len(set(coords))
+    assert set(coords) == {tuple(point) for point in points.tolist()}
+
+# --- ボクセル化と分解のテスト ---
+
+def test_sphere_decomposes_into_few_boxes():
+    """半径20の球が数百個の直方体に分解されるかテスト"""
+    points = shapes.sphere(5, 60, -3, 20)
+    boxes = shapes.decompose(points)
+    assert len(points) > 30000
+    assert len(boxes) < 600
+    assert_exact_cover(points, boxes)
+
+def test_hollow_shapes():
+    """中空の球と円柱が表面だけになるかテスト"""
+    solid = shapes.sphere(0, 0, 0, 6)
+    hollow = shapes.sphere(0, 0, 0, 6, hollow=True)
+    assert {tuple(p) for p in hollow.tolist()} < {tuple(p) for p in solid.tolist()}
+    assert (0, 0, 0) not in {tuple(p) for p in hollow.tolist()}
+    tube = shapes.cylinder(0, 10, 0, 3, -4, hollow=True)
+    assert {y for _, y, _ in tube.tolist()} == {7, 8, 9, 10}
+    assert (0, 10, 0) not in {tuple(p) for p in tube.tolist()}
+    assert_exact_cover(tube, shapes.decompose(tube))
+
+def test_line():
+    """軸に平行な線は1つの直方体に、斜めの線は端点を含む連続したボクセルになるかテスト"""
+    assert shapes.decompose(shapes.line(0, 5, 0, 10, 5, 0)) == [(0, 5, 0, 10, 5, 0)]
+    points = shapes.line(0, 0, 0, 7, -3, 2)
+    assert len(points) == 8
+    assert points[0].tolist() == [0, 0, 0] and points[-1].tolist() == [7, -3, 2]
+
+def test_polygon():
+    """多角形の内部と辺が塗りつぶされるかテスト"""
+    points = shapes.polygon([(0, 0), (4, 0), (4, 3), (0, 3)], 7)
+    assert shapes.decompose(points) == [(0, 7, 0, 4, 7, 3)]
+
+def test_template_boxes():
+    """テンプレートがブロックIDごとの直方体になり、空気は省かれるかテスト"""
+    boxes = shapes.template_boxes(10, 0, 0, (2, 1, 2), [1, 1, 0, 2])
+    assert boxes == {1: [(10, 0, 0, 11, 0, 0)], 2: [(11, 0, 1, 11, 0, 1)]}
+
+def test_diff_boxes():
+    """変わった場所だけが保存したブロックIDごとの直方体になり、空気も戻すかテスト"""
+    boxes = shapes.diff_boxes(10, 0, 0, (2, 1, 2), [1, 1, 0, 2], [1, 5, 3, 2])
+    assert boxes == {0: [(10, 0, 1, 10, 0, 1)], 1: [(11, 0, 0, 11, 0, 0)]}
+    assert shapes.diff_boxes(0, 0, 0, (2, 1, 1), [1, 2], [1, 2]) == {}
+
+# --- 図形のコマンドのテスト ---
+
+def test_draw_sphere_command(mocker):
+    """drawSphere が setBlocks にまとめて送るかテスト"""
+    mc = mocker.MagicMock()
+    result = prepare_command('drawSphere', [0, 64, 0, 3, 1])(mc)
+    assert result["message"].startswith("Drew sphere with ")
+    assert mc.setBlocks.call_count + mc.setBlock.call_count < 30
+
+def test_place_template_command(mocker):
+    """placeTemplate が getBlocks のレスポンス形式のテンプレートを置くかテスト"""
+    mc = mocker.MagicMock()
+    template = {"size": {"x": 2, "y": 1, "z": 1}, "encoding": "uint8", "blocks": encode_values([5, 5], 'uint8')}
+    result = prepare_command('placeTemplate', [1, 2, 3, template])(mc)
+    mc.setBlocks.assert_called_once_with(1, 2, 3, 2, 2, 3, 5)
+    assert result["message"] == "Placed template with 2 blocks in 1 calls"
+
+def test_shape_validation():
+    """大きすぎる図形や不正な引数が検証で拒否されるかテスト"""
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('drawSphere', [0, 0, 0, 500, 1])
+    assert excinfo.value.status == 413
+    with pytest.raises(CommandError) as excinfo:
+        prepare_command('drawCylinder', [0, 0, 0, -1, 5, 1])
+    assert excinfo.value.message == "Invalid radius (must not be negative)"
+    with pytest.raises(CommandError):
+        prepare_command('fillPolygon', [[[0, 0], [1, 1]], 0, 1])
+    with pytest.raises(CommandError):
+        prepare_command('placeTemplate', [0, 0, 0, {"size": {"x": 2, "y": 1, "z": 1}, "blocks": [1]}])
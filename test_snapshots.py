@@ -0,0 +1,49 @@
+import pytest
+
+from snapshots import Snapshot, SnapshotStore, is_valid_name, write_snapshot
+
+
+def test_round_trip(tmp_path):
+    """まとまりごとに書き込んだブロックIDが、同じ順に読み出せるかテスト"""
+    store = SnapshotStore(str(tmp_path / "snaps"))
+    slabs = [[1] * 12, [2, 3] * 6, [65535] * 6]
+    store.save("house", (-5, 60, 7), (3, 5, 2), 2, iter(slabs))
+    assert store.exists("house") and not store.exists("castle")
+    with store.open("house") as snapshot:
+        assert snapshot.origin == (-5, 60, 7)
+        assert snapshot.size == (3, 5, 2)
+        assert snapshot.volume == 30
+        assert len(snapshot) == 3
+        assert [(bottom, layers, values.tolist()) for bottom, layers, values in map(snapshot.slab, range(3))] == [
+            (60, 2, slabs[0]), (62, 2, slabs[1]), (64, 1, slabs[2])]
+
+def test_compresses_uniform_regions(tmp_path):
+    """同じブロックが続く範囲は、ブロック数よりずっと小さいファイルになるかテスト"""
+    path = str(tmp_path / "air.snap")
+    length = write_snapshot(path, (0, 0, 0), (100, 6, 100), 6, [[0] * 60000])
+    assert length < 1000
+
+def test_wrong_slab_size_keeps_previous_file(tmp_path):
+    """まとまりの大きさが合わない場合はエラーになり、前のファイルが残るかテスト"""
+    store = SnapshotStore(str(tmp_path))
+    store.save("a", (0, 0, 0), (1, 1, 1), 1, [[7]])
+    with pytest.raises(ValueError):
+        store.save("a", (0, 0, 0), (2, 1, 1), 1, [[7]])
+    with store.open("a") as snapshot:
+        assert snapshot.slab(0)[2].tolist() == [7]
+    # 失敗した一時ファイルは残らない
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["a.snap"]
+
+def test_rejects_other_files(tmp_path):
+    """スナップショットではないファイルや空のファイルは ValueError になるかテスト"""
+    (tmp_path / "bad.snap").write_bytes(b"not a snapshot at all, just some text")
+    (tmp_path / "empty.snap").write_bytes(b"")
+    for name in ("bad", "empty"):
+        with pytest.raises(ValueError):
+            Snapshot(str(tmp_path / f"{name}.snap"))
+
+def test_is_valid_name():
+    """ファイル名に使えない名前が拒否されるかテスト"""
+    assert is_valid_name("castle_2-b")
+    for name in ("", "../etc", "a/b", "a.b", "x" * 65, 5, None):
+        assert not is_valid_name(name)
@@ -0,0 +1,63 @@
+import io
+import json
+import logging
+import logging.handlers
+import queue
+
+from structured_log import CommandSampler, DeferredQueueHandler, JsonFormatter, parse_sample_rates
+
+
+def make_record(message, level=logging.INFO, args=(), **extra):
+    record = logging.LogRecord("app", level, __file__, 1, message, args, None)
+    record.__dict__.update(extra)
+    return record
+
+def test_json_formatter():
+    """レコードがメッセージと extra の値を持つ1行の JSON になるかテスト"""
+    line = JsonFormatter().format(make_record("Received %s", args=("setBlock",), command="setBlock", arguments=[1, 2, 3, 4]))
+    entry = json.loads(line)
+    assert entry["msg"] == "Received setBlock"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "app"
+    assert entry["command"] == "setBlock"
+    assert entry["arguments"] == [1, 2, 3, 4]
+    assert "\n" not in line
+
+def test_json_formatter_exception():
+    """例外のトレースバックが exc に入るかテスト"""
+    try:
+        int("x")
+    except ValueError:
+        record = logging.LogRecord("app", logging.ERROR, __file__, 1, "failed", (), __import__("sys").exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ValueError" in entry["exc"]
+
+def test_command_sampler():
+    """コマンドごとに N 件に1件だけ通し、警告以上とコマンドのないレコードは常に通すかテスト"""
+    sampler = CommandSampler(parse_sample_rates("setBlock=10, *=2"))
+    kept = [sampler.filter(make_record("x", command="setBlock")) for _ in range(30)]
+    assert sum(kept) == 3
+    assert sum(sampler.filter(make_record("x", command="getBlock")) for _ in range(10)) == 5
+    assert sampler.filter(make_record("x", logging.ERROR, command="setBlock"))
+    assert sampler.filter(make_record("x"))
+
+def test_queue_handler_writes_in_listener():
+    """キューに入れたレコードが書き出し側のスレッドで JSON になって出力されるかテスト"""
+    log_queue = queue.SimpleQueue()
+    stream = io.StringIO()
+    output = logging.StreamHandler(stream)
+    output.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(log_queue, output)
+    handler = DeferredQueueHandler(log_queue)
+    logger = logging.getLogger("test_structured_log")
+    logger.addHandler(handler)
+    logger.propagate = False
+    listener.start()
+    try:
+        logger.warning("hello %s", "world", extra={"command": "postToChat"})
+    finally:
+        listener.stop()
+        logger.removeHandler(handler)
+    entry = json.loads(stream.getvalue())
+    assert entry["msg"] == "hello world"
+    assert entry["command"] == "postToChat"
@@ -0,0 +1,38 @@
+import pytest
+
+from worlds import InflightLimit, World, parse_worlds
+
+
+def test_parse_worlds():
+    """WORLDS の名前とアドレスが読み取られ、ポートを省略すると既定のポートになるかテスト"""
+    assert parse_worlds("") == {}
+    assert parse_worlds("lab1=10.0.0.1:4712, lab2=mc.local", 4711) == {
+        "lab1": ("10.0.0.1", 4712), "lab2": ("mc.local", 4711)}
+
+@pytest.mark.parametrize("text", ["lab1", "=host", "lab1=", "lab1=a,lab1=b", "default=host", "lab1=host:port"])
+def test_parse_worlds_invalid(text):
+    """不正な WORLDS は ValueError になるかテスト"""
+    with pytest.raises(ValueError):
+        parse_worlds(text)
+
+def test_inflight_limit():
+    """上限に達すると拒否して数え、解放すると再び受け付けるかテスト (0 は無制限)"""
+    limit = InflightLimit(2)
+    assert limit.acquire() and limit.acquire()
+    assert not limit.acquire()
+    assert limit.inflight == 2 and limit.rejected == 1
+    limit.release()
+    assert limit.acquire()
+    unlimited = InflightLimit()
+    assert all(unlimited.acquire() for _ in range(100))
+
+def test_world_connects_with_its_address(mocker):
+    """ワールドの接続が自分のホストとポートで作られ、ワールドごとに別の状態を持つかテスト"""
+    factory = mocker.MagicMock()
+    world = World("lab", "10.0.0.1", 4712, factory)
+    other = World("lab2", "10.0.0.2", 4711, factory)
+    assert world.connection.connect()
+    factory.assert_called_once_with("10.0.0.1", 4712)
+    assert world.mc is factory.return_value and other.mc is None
+    assert world.state is not other.state and world.mc_lock is not other.mc_lock
+    assert world.event_poller is None
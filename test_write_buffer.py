@@ -0,0 +1,135 @@
+import itertools
+import random
+import threading
+
+import commands
+import pytest
+from block_cache import WorldCache
+from commands import prepare_command
+from write_buffer import BlockWriteBuffer, merge_boxes
+
+
+def box_coords(box):
+    x1, y1, z1, x2, y2, z2 = box
+    return {(x, y, z) for x in range(x1, x2 + 1) for y in range(y1, y2 + 1) for z in range(z1, z2 + 1)}
+
+# --- merge_boxes のテスト ---
+
+def test_merge_boxes_solid_cuboid():
+    """直方体を埋める座標が1つの直方体にまとめられるかテスト"""
+    coords = list(itertools.product(range(4), range(3), range(5)))
+    assert merge_boxes(coords) == [(0, 0, 0, 3, 2, 4)]
+
+def test_merge_boxes_covers_exactly():
+    """分割した直方体が元の座標をちょうど (重複なく) 埋めるかテスト"""
+    rng = random.Random(1)
+    coords = {(rng.randrange(6), rng.randrange(6), rng.randrange(6)) for _ in range(120)}
+    boxes = merge_boxes(coords)
+    covered = [box_coords(box) for box in boxes]
+    assert set().union(*covered) == coords
+    assert sum(len(c) for c in covered) == len(coords)
+    assert len(boxes) < len(coords)
+
+# --- BlockWriteBuffer のテスト ---
+
+def test_flush_merges_writes(mocker):
+    """同じブロックの連続した書き込みが setBlocks にまとめられるかテスト"""
+    mc = mocker.MagicMock()
+    buffer = BlockWriteBuffer(lambda: mc, threading.RLock())
+    for x in range(10):
+        buffer.set_block(mc, x, 0, 0, 1)
+    buffer.set_block(mc, 20, 0, 0, 2)
+    assert buffer.flush() == (11, 2)
+    mc.setBlocks.assert_called_once_with(0, 0, 0, 9, 0, 0, 1)
+    mc.setBlock.assert_called_once_with(20, 0, 0, 2)
+    assert len(buffer) == 0
+
+def test_overwrite_keeps_last_write(mocker):
+    """同じ座標への上書きは最後の書き込みだけが送信されるかテスト"""
+    mc = mocker.MagicMock()
+    buffer = BlockWriteBuffer(lambda: mc, threading.RLock())
+    buffer.set_block(mc, 1, 2, 3, 1)
+    buffer.set_block(mc, 1, 2, 3, 5)
+    assert buffer.get_block(1, 2, 3) == 5
+    assert buffer.get_block(0, 0, 0) is None
+    assert buffer.flush() == (1, 1)
+    mc.setBlock.assert_called_once_with(1, 2, 3, 5)
+
+def test_max_pending_flushes_immediately(mocker):
+    """max_pending に達した場合はその場で送信されるかテスト"""
+    mc = mocker.MagicMock()
+    buffer = BlockWriteBuffer(lambda: mc, threading.RLock(), max_pending=3)
+    for x in range(3):
+        buffer.set_block(mc, x, 0, 0, 1)
+    mc.setBlocks.assert_called_once_with(0, 0, 0, 2, 0, 0, 1)
+
+def test_failed_flush_keeps_unsent_writes(mocker):
+    """送信に失敗した場合は、まだ送っていない書き込みをバッファに戻して例外を送出するかテスト"""
+    mc = mocker.MagicMock()
+    mc.setBlock.side_effect = OSError("broken pipe")
+    buffer = BlockWriteBuffer(lambda: mc, threading.RLock())
+    for x in range(3):
+        buffer.set_block(mc, x, 0, 0, 1)
+    buffer.set_block(mc, 9, 0, 0, 2)
+    with pytest.raises(OSError):
+        buffer.flush()
+    # setBlocks で送った範囲は戻さず、失敗した setBlock の書き込みだけが残る
+    mc.setBlocks.assert_called_once_with(0, 0, 0, 2, 0, 0, 1)
+    assert len(buffer) == 1 and buffer.get_block(9, 0, 0) == 2
+    mc.setBlock.side_effect = None
+    assert buffer.flush() == (1, 1)
+    mc.setBlock.assert_called_with(9, 0, 0, 2)
+
+def test_background_flush(mocker):
+    """delay 後にバックグラウンドで送信されるかテスト"""
+    mc = mocker.MagicMock()
+    sent = threading.Event()
+    mc.setBlock.side_effect = lambda *args: sent.set()
+    buffer = BlockWriteBuffer(lambda: mc, threading.RLock(), delay=0.01)
+    buffer.start()
+    try:
+        buffer.set_block(mc, 0, 0, 0, 1)
+        assert sent.wait(5)
+    finally:
+        buffer.stop()
+
+# --- コマンドとの連携のテスト ---
+
+def test_commands_use_write_buffer(mocker):
+    """書き込みバッファ有効時の setBlock / getBlock / flush の動作をテスト"""
+    mc = mocker.MagicMock()
+    buffer = BlockWriteBuffer(lambda: mc, threading.RLock())
+    mocker.patch('commands.write_buffer', buffer)
+
+    prepare_command('setBlock', [0, 0, 0, 1])(mc)
+    prepare_command('setBlock', [1, 0, 0, 1])(mc)
+    mc.setBlock.assert_not_called()
+    assert prepare_command('getBlock', [1, 0, 0])(mc)['block_id'] == 1
+    mc.getBlock.assert_not_called()
+
+    result = prepare_command('flush', [])(mc)
+    assert result == {"status": "success", "message": "Flushed 2 blocks in 1 calls"}
+    mc.setBlocks.assert_called_once_with(0, 0, 0, 1, 0, 0, 1)
+
+def test_other_commands_flush_first(mocker):
+    """他のコマンドの前にバッファの書き込みが送信されるかテスト"""
+    mc = mocker.MagicMock()
+    buffer = BlockWriteBuffer(lambda: mc, threading.RLock())
+    mocker.patch('commands.write_buffer', buffer)
+    prepare_command('setBlock', [0, 0, 0, 1])(mc)
+    prepare_command('postToChat', ["done"])(mc)
+    assert [c[0] for c in mc.method_calls] == ['setBlock', 'postToChat']
+
+def test_failed_buffer_flush_invalidates_cache(mocker):
+    """バッファがいっぱいで送信に失敗した setBlock は、エラーを返してキャッシュの古い値を消すかテスト"""
+    mc = mocker.MagicMock()
+    mc.getBlock.return_value = 3
+    mc.setBlocks.side_effect = OSError("broken pipe")
+    mocker.patch('commands.write_buffer', BlockWriteBuffer(lambda: mc, threading.RLock(), max_pending=2))
+    mocker.patch('commands.world_cache', WorldCache())
+    prepare_command('getBlock', [1, 0, 0])(mc)
+    prepare_command('setBlock', [0, 0, 0, 1])(mc)
+    with pytest.raises(OSError):
+        prepare_command('setBlock', [1, 0, 0, 1])(mc)
+    assert commands.world_cache.blocks.get(1, 0, 0) is None
+    assert len(commands.write_buffer) == 2
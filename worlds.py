@@ -0,0 +1,84 @@
+# 1つのブリッジで複数の Minecraft サーバー (ワールド) を扱うためのルーティング (オプション)
+#
+# WORLDS="lab1=192.168.1.11:4711,lab2=192.168.1.12" のように名前付きのサーバーを設定すると、
+# /w/<名前>/command などのパス、またはボディの "world" でコマンドを送るサーバーを選べます。
+# 指定しないリクエストは、これまでどおり MINECRAFT_HOST / MINECRAFT_PORT の既定のワールドに送ります。
+#
+# ワールドごとに接続、ロック、スケジューラー、連番、キャッシュ、イベントのポーラーを持つので、
+# 1つのサーバーが止まったり遅くなったりしても、他のワールドのコマンドは待たされません。
+# 同時に処理するリクエストの数もワールドごとに制限し、応答しないサーバーへのリクエストが
+# 共有のスレッド (gunicorn の WEB_THREADS) を使い切らないようにします。
+
+import threading
+
+from commands import WorldState
+from connection import ConnectionManager
+
+# 既定のワールド (MINECRAFT_HOST / MINECRAFT_PORT) の名前
+DEFAULT_WORLD = "default"
+
+
+def parse_worlds(text, default_port=4711):
+    """"名前=ホスト[:ポート],..." を {名前: (ホスト, ポート)} に変換する (不正な場合は ValueError)"""
+    worlds = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        name, sep, address = item.partition("=")
+        name, address = name.strip(), address.strip()
+        if not sep or not name or not address:
+            raise ValueError(f"expected name=host[:port], got {item!r}")
+        if name == DEFAULT_WORLD or name in worlds:
+            raise ValueError(f"duplicate world name: {name}")
+        host, _, port = address.rpartition(":") if ":" in address else (address, "", "")
+        worlds[name] = (host, int(port) if port else default_port)
+    return worlds
+
+
+class InflightLimit:
+    """ワールドごとに同時に処理するリクエストの数の上限 (limit が 0 なら無制限)"""
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        self.inflight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """処理を始めてよければ True を返す (上限に達している場合は False)"""
+        with self._lock:
+            if self.limit and self.inflight >= self.limit:
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+
+class World:
+    """名前付きの Minecraft サーバー1つ分の接続と、そのワールドのキャッシュやスケジューラー
+
+    factory はホストとポートを受け取って Minecraft インスタンスを作る関数です。
+    コマンドのキャッシュ、書き込みバッファ、ポーラーは state (commands.WorldState) に持ちます。
+    """
+
+    def __init__(self, name, host, port, factory, health_interval=5.0, max_inflight=0):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.mc = None
+        self.mc_lock = threading.RLock()
+        self.connection = ConnectionManager(lambda: factory(host, port), lock=self.mc_lock,
+                                            on_change=self._set_minecraft, health_interval=health_interval)
+        self.state = WorldState()
+        self.scheduler = None
+        self.sequencer = None
+        self.limit = InflightLimit(max_inflight)
+
+    @property
+    def event_poller(self):
+        return self.state.event_poller
+
+    def _set_minecraft(self, mc):
+        self.mc = mc
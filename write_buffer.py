@@ -0,0 +1,146 @@
+# setBlock の書き込みを短時間ためて、まとめて Minecraft に送るバッファ (オプション)
+#
+# Scratch で建物を作ると、隣り合った座標に同じブロックを置く setBlock が大量に届きます。
+# バッファは一定時間 (または flush コマンドまで) 書き込みをため、同じ座標への上書きを捨て、
+# 同じブロックIDの連続した範囲を直方体にまとめて setBlocks で送ります。
+#
+# バッファの中身は Minecraft への接続と同じロックで保護します。
+# 書き込みの送信中に getBlock などが割り込むことはありません。
+# 送信に失敗した場合は、まだ送っていない書き込みをバッファに戻してエラーを呼び出し側に返します
+# (バックグラウンドの送信は RETRY_INTERVAL 秒後にもう一度試します)。
+
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# バックグラウンドの送信に失敗した場合に、もう一度試すまでの秒数
+RETRY_INTERVAL = 1.0
+
+
+def merge_boxes(coords):
+    """座標の集合を、それをちょうど埋める直方体のリストに分割する (貪欲法)
+
+    各直方体は (x1, y1, z1, x2, y2, z2) です。
+    走査順で最初の座標から x 方向、z 方向、y 方向の順にできるだけ広げます。
+    """
+    remaining = set(coords)
+    boxes = []
+    for x, y, z in sorted(coords, key=lambda c: (c[1], c[2], c[0])):
+        if (x, y, z) not in remaining:
+            continue
+        x2 = x
+        while (x2 + 1, y, z) in remaining:
+            x2 += 1
+        z2 = z
+        while all((i, y, z2 + 1) in remaining for i in range(x, x2 + 1)):
+            z2 += 1
+        y2 = y
+        while all((i, y2 + 1, k) in remaining for i in range(x, x2 + 1) for k in range(z, z2 + 1)):
+            y2 += 1
+        for j in range(y, y2 + 1):
+            for k in range(z, z2 + 1):
+                for i in range(x, x2 + 1):
+                    remaining.discard((i, j, k))
+        boxes.append((x, y, z, x2, y2, z2))
+    return boxes
+
+
+class BlockWriteBuffer:
+    """setBlock をためて setBlocks にまとめる書き込みバッファ
+
+    get_connection は現在の Minecraft インスタンス (未接続なら None) を返す関数、
+    lock は接続と共有するロックです。delay 秒ごとにバックグラウンドで送信し、
+    max_pending 個の書き込みがたまった場合はその場で送信します。
+    """
+
+    def __init__(self, get_connection, lock, delay=0.005, max_pending=4096):
+        self.get_connection = get_connection
+        self.lock = lock
+        self.delay = delay
+        self.max_pending = max_pending
+        self._pending = {} # (x, y, z) -> block_id
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-buffer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """バックグラウンドの送信を止め、残っている書き込みを送信する (flush() と同じ値を返す)"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        return self.flush()
+
+    def set_block(self, mc, x, y, z, block_id):
+        """書き込みをバッファに追加する (呼び出し側は lock を保持していること)"""
+        self._pending[(x, y, z)] = block_id
+        if len(self._pending) >= self.max_pending:
+            self.flush(mc)
+        else:
+            self._wake.set()
+
+    def get_block(self, x, y, z):
+        """バッファにある書き込みを返す (なければ None)"""
+        return self._pending.get((x, y, z))
+
+    def flush(self, mc=None):
+        """たまっている書き込みを送信し、(書き込みの数, Minecraft の呼び出し回数) を返す
+
+        送信中に例外が発生した場合は、まだ送っていない書き込みをバッファに戻してから例外を送出します。
+        """
+        with self.lock:
+            if not self._pending:
+                return 0, 0
+            if mc is None:
+                mc = self.get_connection()
+                if mc is None:
+                    return 0, 0
+            pending, self._pending = self._pending, {}
+
+            by_id = {}
+            for coord, block_id in pending.items():
+                by_id.setdefault(block_id, []).append(coord)
+            calls = 0
+            sent = set()
+            try:
+                for block_id, coords in by_id.items():
+                    for x1, y1, z1, x2, y2, z2 in merge_boxes(coords):
+                        if (x1, y1, z1) == (x2, y2, z2):
+                            mc.setBlock(x1, y1, z1, block_id)
+                        else:
+                            mc.setBlocks(x1, y1, z1, x2, y2, z2, block_id)
+                        calls += 1
+                        sent.update((x, y, z) for y in range(y1, y2 + 1) for z in range(z1, z2 + 1)
+                                    for x in range(x1, x2 + 1))
+            except Exception:
+                # 失敗した直方体とまだ送っていない書き込みを戻す (送信中に届いた書き込みは lock で防がれている)
+                for coord, block_id in pending.items():
+                    if coord not in sent:
+                        self._pending.setdefault(coord, block_id)
+                raise
+            return len(pending), calls
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait()
+            if self._stop.is_set():
+                break
+            # 最初の書き込みから delay 秒の間に届いた書き込みをまとめて送る
+            self._stop.wait(self.delay)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.warning("Write buffer flush failed, %s writes kept for retry: %s", len(self._pending), e)
+                self._stop.wait(RETRY_INTERVAL)
+                self._wake.set()